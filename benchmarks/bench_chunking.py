@@ -0,0 +1,92 @@
+"""
+Бенчмарк ml.ml.analyze_items на `--items` задачах: один запрос на все элементы
+(прежнее поведение) против чанков по ML_CHUNK_TOKENS токенов, которые идут
+параллельно не больше `--concurrency` штук. Вместо Gemini — заглушка, которая
+отвечает за `--base-ms` плюс `--ms-per-1k-tokens` на тысячу оценочных токенов
+промпта и ответа: время генерации растёт с длиной ответа, поэтому один большой
+запрос медленнее, чем параллельные маленькие. Кэш вердиктов отключён.
+
+Запуск: python -m benchmarks.bench_chunking --items 3000 --concurrency 4
+"""
+import argparse
+import asyncio
+import time
+
+import ml.ml
+from ml.limiter import RateLimiter
+from ml.ml import BatchAnalysis, ItemAnalysis, analyze_items, estimate_tokens
+from ml.verdicts import VerdictCache
+
+
+class SlowLLM:
+    def __init__(self, base_ms: float, ms_per_1k_tokens: float):
+        self.base = base_ms / 1000
+        self.per_token = ms_per_1k_tokens / 1000 / 1000
+        self.calls = 0
+
+    async def ainvoke(self, prompt: str) -> BatchAnalysis:
+        self.calls += 1
+        lines = prompt.split("List to analyze:\n")[1].splitlines()
+        verdicts = [
+            ItemAnalysis(id=int(line.split(" | ")[0].removeprefix("ID: ")), is_important=True, about="Сдать лабу")
+            for line in lines
+        ]
+        tokens = estimate_tokens(prompt) + len(verdicts) * ml.ml.VERDICT_OVERHEAD_TOKENS
+        await asyncio.sleep(self.base + tokens * self.per_token)
+        return BatchAnalysis(items=verdicts)
+
+
+async def no_verdicts(keys):
+    return {}
+
+
+async def skip_save(rows):
+    pass
+
+
+class Task:
+    __slots__ = ("id", "task_name", "context")
+
+    def __init__(self, item_id: int):
+        self.id = item_id
+        self.task_name = f"надо сдать лабораторную работу {item_id} до пятницы, в 12:00 в аудитории 301"
+        self.context = self.task_name
+
+
+async def run(items, args, chunk_tokens: int, chunk_items: int, concurrency: int) -> tuple:
+    ml.ml.ML_CHUNK_TOKENS = chunk_tokens
+    ml.ml.ML_CHUNK_ITEMS = chunk_items
+    ml.ml.llm_limiter = RateLimiter(concurrency)
+    ml.ml.verdict_cache = VerdictCache(load=no_verdicts, save=skip_save)
+    ml.ml.structured_llm = llm = SlowLLM(args.base_ms, args.ms_per_1k_tokens)
+
+    start = time.perf_counter()
+    result = await analyze_items(items, "task")
+    return time.perf_counter() - start, llm.calls, len(result)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--chunk-tokens", type=int, default=ml.ml.ML_CHUNK_TOKENS)
+    parser.add_argument("--chunk-items", type=int, default=ml.ml.ML_CHUNK_ITEMS)
+    parser.add_argument("--base-ms", type=float, default=500)
+    parser.add_argument("--ms-per-1k-tokens", type=float, default=40)
+    args = parser.parse_args()
+
+    items = [Task(i) for i in range(args.items)]
+    total = 10 ** 9
+    variants = (
+        ("один запрос:", total, total, 1),
+        ("чанки, по одному:", args.chunk_tokens, args.chunk_items, 1),
+        (f"чанки, по {args.concurrency}:", args.chunk_tokens, args.chunk_items, args.concurrency),
+    )
+    print(f"задач: {args.items}, чанк: {args.chunk_tokens} токенов / {args.chunk_items} элементов")
+    for name, chunk_tokens, chunk_items, concurrency in variants:
+        elapsed, calls, important = await run(items, args, chunk_tokens, chunk_items, concurrency)
+        print(f"{name:<20}{elapsed * 1000:8.0f} ms, запросов {calls}, важных {important}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
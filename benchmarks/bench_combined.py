@@ -0,0 +1,121 @@
+"""
+Бенчмарк разбора сводки: по запросу на категорию (analyze_items для пяти видов
+параллельно) против общего запроса analyze_categories. В каждой категории
+`--items` новых элементов. Вместо Gemini — заглушка, которая отвечает за `--base-ms`
+плюс `--ms-per-1k-tokens` на тысячу оценочных токенов запроса и ответа.
+Токены запроса — промпт и JSON-схема ответа, которая уходит с каждым вызовом
+structured output. Кэш вердиктов отключён.
+
+Запуск: python -m benchmarks.bench_combined --items 10
+"""
+import argparse
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import ml.ml
+from ml.ml import (
+    BatchAnalysis, CategoryAnalysis, CombinedAnalysis, ItemAnalysis, PROMPTS,
+    VERDICT_OVERHEAD_TOKENS, analyze_categories, analyze_items, estimate_tokens,
+)
+from ml.verdicts import VerdictCache
+
+CONTENT = {
+    "link": ("url", "https://example.com/lecture/{}"),
+    "doc": ("document_name", "lecture_{}.pdf"),
+    "task": ("task_name", "сдать лабораторную {} до пятницы"),
+    "mention": ("mention", "@student{}"),
+    "hashtag": ("hashtag", "#матан{}"),
+}
+
+
+class SlowLLM:
+    def __init__(self, schema, base_ms: float, ms_per_1k_tokens: float):
+        self.schema_tokens = estimate_tokens(json.dumps(schema.model_json_schema(), ensure_ascii=False))
+        self.base = base_ms / 1000
+        self.per_token = ms_per_1k_tokens / 1000 / 1000
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.answer_tokens = 0
+
+    @staticmethod
+    def judge(lines: str):
+        return [
+            ItemAnalysis(id=int(line.split(" | ")[0].removeprefix("ID: ")), is_important=True, about="Лекция 5")
+            for line in lines.strip().splitlines()
+        ]
+
+    async def ainvoke(self, prompt: str):
+        if "### Раздел: " in prompt:
+            answer = CombinedAnalysis(categories=[
+                CategoryAnalysis(category=section.split("\n", 1)[0], items=self.judge(section.split("List to analyze:\n")[1]))
+                for section in prompt.split("### Раздел: ")[1:]
+            ])
+        else:
+            answer = BatchAnalysis(items=self.judge(prompt.split("List to analyze:\n")[1]))
+
+        prompt_tokens = estimate_tokens(prompt) + self.schema_tokens
+        answer_tokens = estimate_tokens(answer.model_dump_json())
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.answer_tokens += answer_tokens
+        await asyncio.sleep(self.base + (prompt_tokens + answer_tokens) * self.per_token)
+        return answer
+
+
+async def no_verdicts(keys):
+    return {}
+
+
+async def skip_save(rows):
+    pass
+
+
+def make_batches(count: int) -> dict:
+    batches, next_id = {}, 0
+    for item_type, (field, template) in CONTENT.items():
+        batches[item_type] = []
+        for i in range(count):
+            next_id += 1
+            batches[item_type].append(SimpleNamespace(
+                **{"id": next_id, field: template.format(i), "context": f"посмотрите к экзамену {i}"}
+            ))
+    return batches
+
+
+async def run(batches: dict, args, combined: bool) -> tuple:
+    ml.ml.verdict_cache = VerdictCache(load=no_verdicts, save=skip_save)
+    ml.ml.structured_llm = separate = SlowLLM(BatchAnalysis, args.base_ms, args.ms_per_1k_tokens)
+    ml.ml.combined_llm = joint = SlowLLM(CombinedAnalysis, args.base_ms, args.ms_per_1k_tokens)
+
+    start = time.perf_counter()
+    if combined:
+        await analyze_categories(batches)
+    else:
+        await asyncio.gather(*(analyze_items(items, item_type) for item_type, items in batches.items()))
+    elapsed = time.perf_counter() - start
+
+    calls = separate.calls + joint.calls
+    return elapsed, calls, separate.prompt_tokens + joint.prompt_tokens, separate.answer_tokens + joint.answer_tokens
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=10)
+    parser.add_argument("--base-ms", type=float, default=500)
+    parser.add_argument("--ms-per-1k-tokens", type=float, default=40)
+    args = parser.parse_args()
+
+    batches = make_batches(args.items)
+    print(f"категорий: {len(batches)}, элементов в категории: {args.items}, "
+          f"промпты видов: {sum(estimate_tokens(p) for p in PROMPTS.values())} токенов, "
+          f"обвязка вердикта: {VERDICT_OVERHEAD_TOKENS}")
+    for name, combined in (("по категориям:", False), ("общий запрос:", True)):
+        elapsed, calls, prompt_tokens, answer_tokens = await run(batches, args, combined)
+        print(f"{name:<16}{elapsed * 1000:8.0f} ms, запросов {calls}, "
+              f"токенов запроса {prompt_tokens}, ответа {answer_tokens}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+"""
+Бенчмарк записи сущностей: построчный ORM (session.add + commit на каждое
+сообщение, как раньше в CollectorMiddleware) против IngestPool.
+
+Запуск: python -m benchmarks.bench_ingest --messages 5000
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from database.cache import ChatState, ChatStateCache
+from database.ingest import IngestPool, IngestRecord
+from database.models import Base, ChatMessage, Hashtag, Link, Task
+
+TEST_DB_URL = "sqlite+aiosqlite:///:memory:"
+
+
+def message_rows(i: int):
+    text = f"надо сделать лабу #{i % 7} до пятницы https://example.com/{i}"
+    return [
+        (ChatMessage, dict(chat_id=1, message_id=i, text=text)),
+        (Hashtag, dict(chat_id=1, message_id=i, hashtag=f"#{i % 7}")),
+        (Link, dict(chat_id=1, message_id=i, url=f"https://example.com/{i}")),
+        (Task, dict(chat_id=1, message_id=i, task_name=text)),
+    ]
+
+
+async def make_session_pool():
+    engine = create_async_engine(TEST_DB_URL, echo=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    return engine, async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+async def bench_orm(messages: int) -> float:
+    engine, session_pool = await make_session_pool()
+    rows = 0
+    start = time.perf_counter()
+    for i in range(messages):
+        async with session_pool() as session:
+            for model, row in message_rows(i):
+                session.add(model(**row))
+                rows += 1
+            await session.commit()
+    elapsed = time.perf_counter() - start
+    await engine.dispose()
+    return rows / elapsed
+
+
+def message_record(i: int) -> IngestRecord:
+    text = f"надо сделать лабу #{i % 7} до пятницы https://example.com/{i}"
+    return IngestRecord(1, i, text, hashtags=(f"#{i % 7}",), links=(f"https://example.com/{i}",))
+
+
+async def bench_pool(messages: int, workers: int, batch_size: int, flush_interval_ms: int) -> float:
+    engine, session_pool = await make_session_pool()
+    cache = ChatStateCache()
+    cache.set(1, ChatState(is_active=True))
+    pool = IngestPool(
+        session_pool, workers=workers, batch_size=batch_size,
+        flush_interval_ms=flush_interval_ms, cache=cache,
+    )
+    await pool.start()
+    start = time.perf_counter()
+    for i in range(messages):
+        await pool.submit(message_record(i))
+    await pool.stop()
+    elapsed = time.perf_counter() - start
+    assert pool.records_failed == 0
+    rows = pool.rows_written
+    await engine.dispose()
+    return rows / elapsed
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--flush-interval-ms", type=int, default=200)
+    args = parser.parse_args()
+
+    before = await bench_orm(args.messages)
+    after = await bench_pool(args.messages, args.workers, args.batch_size, args.flush_interval_ms)
+
+    print(f"messages: {args.messages}, rows: {args.messages * 4}")
+    print(f"{'ORM add + commit на сообщение:':<32}{before:10.0f} rows/sec")
+    print(f"{f'IngestPool, воркеров {args.workers}:':<32}{after:10.0f} rows/sec")
+    print(f"ускорение: x{after / before:.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
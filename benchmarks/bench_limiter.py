@@ -0,0 +1,60 @@
+"""
+Бенчмарк ml.limiter.RateLimiter: `--chats` сводок по расписанию стартуют разом,
+а пока они идут, каждые `--interval-ms` приходит команда пользователя. Сравниваются
+ожидание команд в своей полосе interactive и в общей очереди (все в scheduled).
+Вместо Gemini — sleep на `--latency-ms`; лимит запросов в минуту — `--rpm`.
+
+Запуск: python -m benchmarks.bench_limiter --chats 200 --commands 20
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from ml.limiter import RateLimiter
+
+
+async def request(limiter: RateLimiter, lane: str, latency: float) -> float:
+    start = time.perf_counter()
+    async with limiter.slot(2000, lane):
+        waited = time.perf_counter() - start
+        await asyncio.sleep(latency)
+    return waited
+
+
+async def run(args, command_lane: str) -> tuple:
+    limiter = RateLimiter(args.concurrency, requests_per_minute=args.rpm)
+    latency = args.latency_ms / 1000
+
+    start = time.perf_counter()
+    scheduled = [asyncio.create_task(request(limiter, "scheduled", latency)) for _ in range(args.chats)]
+    commands = []
+    for _ in range(args.commands):
+        await asyncio.sleep(args.interval_ms / 1000)
+        commands.append(asyncio.create_task(request(limiter, command_lane, latency)))
+    command_waits = await asyncio.gather(*commands)
+    await asyncio.gather(*scheduled)
+    return command_waits, time.perf_counter() - start
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--commands", type=int, default=20)
+    parser.add_argument("--interval-ms", type=float, default=50)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rpm", type=int, default=6000)
+    args = parser.parse_args()
+
+    print(f"сводок: {args.chats}, команд: {args.commands}, слотов: {args.concurrency}, запросов в минуту: {args.rpm}")
+    for name, lane in (("общая очередь:", "scheduled"), ("полоса команд:", "interactive")):
+        waits, elapsed = await run(args, lane)
+        waits = sorted(waits)
+        p95 = waits[int(len(waits) * 0.95) - 1] if len(waits) > 1 else waits[0]
+        print(f"{name:<16}ожидание команды p50 {statistics.median(waits) * 1000:7.0f} ms, "
+              f"p95 {p95 * 1000:7.0f} ms, всего {elapsed:5.1f} s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+"""
+Бенчмарк записи результатов анализа: прежний цикл UPDATE ... WHERE id = ?
+на каждый элемент против bulk UPDATE (executemany) из database.crud.save_analysis_results.
+
+`--rtt-ms` добавляет задержку перед каждым запросом, как до БД по сети.
+
+Запуск: python -m benchmarks.bench_save_results --sizes 1000 10000 --rtt-ms 1
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+import database.session
+from database import crud
+from database.migrations import migrate
+from database.models import Item, Task
+from database.session import session_scope
+
+
+async def legacy_save_analysis_results(model, analysis_results: list[dict]):
+    """
+    Прежняя реализация: UPDATE на каждый элемент.
+    """
+    async with session_scope() as session:
+        for item_data in analysis_results:
+            await session.execute(
+                update(model)
+                .where(model.id == item_data['id'])
+                .values(is_important=item_data['is_important'])
+            )
+        await session.commit()
+
+
+async def seed(engine, size: int, chat_id: int) -> list:
+    async with engine.begin() as conn:
+        await conn.execute(insert(Item), [
+            dict(kind="task", chat_id=chat_id, message_id=i, content=f"надо сделать {i}") for i in range(size)
+        ])
+        result = await conn.execute(select(Task.id).where(Task.chat_id == chat_id))
+        return list(result.scalars())
+
+
+def analysis_results(ids: list) -> list:
+    return [
+        {"id": task_id, "is_important": i % 3 == 0, "about": f"задача {i}" if i % 3 == 0 else None}
+        for i, task_id in enumerate(ids)
+    ]
+
+
+async def bench(save, engine, size: int, chat_id: int) -> float:
+    ids = await seed(engine, size, chat_id)
+    start = time.perf_counter()
+    await save(Task, analysis_results(ids))
+    return (time.perf_counter() - start) * 1000
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--rtt-ms", type=float, default=1.0)
+    parser.add_argument("--db-url", default="sqlite+aiosqlite:///:memory:")
+    args = parser.parse_args()
+
+    engine = create_async_engine(args.db_url, echo=False)
+    database.session.async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    await migrate(engine)
+    if args.rtt_ms:
+        event.listen(engine.sync_engine, "before_cursor_execute", lambda *_: time.sleep(args.rtt_ms / 1000))
+
+    print(f"RTT: {args.rtt_ms} ms")
+    for n, size in enumerate(args.sizes):
+        before = await bench(legacy_save_analysis_results, engine, size, chat_id=2 * n)
+        after = await bench(crud.save_analysis_results, engine, size, chat_id=2 * n + 1)
+        print(f"{size:>6} элементов: цикл {before:9.1f} ms, bulk {after:8.1f} ms, ускорение x{before / after:.1f}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+"""
+Бенчмарк шардированного режима: пропускная способность (updates/sec) при
+1..N процессах-воркерах. Апдейты синтетические, Telegram и БД не участвуют:
+каждый воркер прогоняет апдейт через aiogram-диспетчер и выполняет
+CPU-часть сбора (сущности, эвристика задач, строки для вставки).
+
+Запуск: python -m benchmarks.bench_sharding --updates 20000 --workers 1 2 4
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
+
+from database.cache import ChatState
+from database.ingest import IngestRecord, record_rows
+from utils.sharding import ShardRouter
+
+ACTIVE = ChatState(is_active=True)
+
+
+def make_update(update_id: int, chats: int):
+    text = f"надо сделать лабу #{update_id % 7} до пятницы https://example.com/{update_id}"
+    hashtag = f"#{update_id % 7}"
+    url = f"https://example.com/{update_id}"
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 1700000000,
+            "chat": {"id": -1000 - update_id % chats, "type": "supergroup", "title": "Группа"},
+            "from": {"id": 42, "is_bot": False, "first_name": "Тест"},
+            "text": text,
+            "entities": [
+                {"type": "hashtag", "offset": text.index(hashtag), "length": len(hashtag)},
+                {"type": "url", "offset": text.index(url), "length": len(url)},
+            ],
+        },
+    }
+
+
+def busy_wait(microseconds: int) -> None:
+    deadline = time.perf_counter() + microseconds / 1_000_000
+    while time.perf_counter() < deadline:
+        pass
+
+
+def cpu_shard(work_us: int):
+    """
+    Фабрика воркера: хендлер повторяет CPU-часть CollectorMiddleware
+    и, если задано, ещё `work_us` микросекунд «прочей» работы.
+    """
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+    dp = Dispatcher()
+    router = Router()
+
+    @router.message()
+    async def on_message(message: Message):
+        text = message.text
+        entities = [e.extract_from(text) for e in message.entities or []]
+        record = IngestRecord(
+            message.chat.id, message.message_id, text,
+            hashtags=tuple(e for e in entities if e.startswith("#")),
+            links=tuple(e for e in entities if e.startswith("http")),
+        )
+        record_rows(record, ACTIVE)
+        if work_us:
+            busy_wait(work_us)
+
+    dp.include_router(router)
+    return Bot(token="42:TEST"), dp
+
+
+async def bench(workers: int, updates: int, chats: int, work_us: int) -> float:
+    router = ShardRouter(workers, cpu_shard, factory_args=(work_us,), queue_size=1000)
+    router.start()
+    assert await router.wait_ready(timeout=120)
+
+    start = time.perf_counter()
+    for i in range(updates):
+        await router.route(make_update(i, chats))
+    await router.stop(timeout=600)
+    elapsed = time.perf_counter() - start
+    return updates / elapsed
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--chats", type=int, default=64)
+    parser.add_argument("--work-us", type=int, default=0)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    print(f"updates: {args.updates}, chats: {args.chats}, CPU: {os.cpu_count()}")
+    baseline = None
+    for workers in sorted(set(args.workers)):
+        rate = await bench(workers, args.updates, args.chats, args.work_us)
+        baseline = baseline or rate
+        print(f"воркеров {workers:2d}: {rate:10.0f} updates/sec  x{rate / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,54 @@
+"""
+Микробенчмарк эвристики задач: старый any()-скан по списку слов
+против скомпилированного TaskDetector на синтетическом корпусе сообщений.
+
+Запуск: python -m benchmarks.bench_task_detector --messages 200000
+"""
+import argparse
+import random
+import time
+
+from ml.detector import DEFAULT_TASK_KEYWORDS, TaskDetector
+
+WORDS = [
+    "привет", "как", "дела", "кто", "идёт", "на", "пару", "завтра", "экзамен", "по", "матану",
+    "лекция", "перенесли", "скинь", "конспект", "спасибо", "ок", "го", "в", "столовку",
+    "сделайте", "дедлайны", "задания", "надо", "сдать", "лабу", "deadline", "task", "lol",
+]
+
+
+def make_corpus(size: int, seed: int = 42):
+    rnd = random.Random(seed)
+    return [" ".join(rnd.choice(WORDS) for _ in range(rnd.randint(3, 30))) for _ in range(size)]
+
+
+def legacy_is_task(text: str) -> bool:
+    keywords = list(DEFAULT_TASK_KEYWORDS)
+    return any(word in text.lower() for word in keywords) and len(text) > 4
+
+
+def bench(fn, corpus):
+    start = time.perf_counter()
+    found = sum(1 for text in corpus if fn(text))
+    return len(corpus) / (time.perf_counter() - start), found
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=200_000)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.messages)
+    detector = TaskDetector()
+
+    before, before_found = bench(legacy_is_task, corpus)
+    after, after_found = bench(detector.is_task, corpus)
+
+    print(f"messages: {args.messages}")
+    print(f"any() по списку слов: {before:12.0f} msg/sec, задач: {before_found}")
+    print(f"TaskDetector:         {after:12.0f} msg/sec, задач: {after_found}")
+    print(f"ускорение: x{after / before:.1f}")
+
+
+if __name__ == "__main__":
+    main()
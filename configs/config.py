@@ -10,4 +10,95 @@ DB_HOST = os.getenv("DB_HOST")
 DB_PORT = os.getenv("DB_PORT")
 DB_NAME = os.getenv("DB_NAME")
 
-DB_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
\ No newline at end of file
+# DB_URL можно задать целиком, например sqlite+aiosqlite:///bot.db для локального запуска
+DB_URL = os.getenv("DB_URL") or f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+# Реплика для тяжёлых чтений (сводка и списки сущностей); без неё всё читается из DB_URL.
+# Если реплика отстаёт больше DB_REPLICA_MAX_LAG секунд или недоступна, чтения идут в основную БД;
+# отставание перепроверяется не чаще раза в DB_REPLICA_LAG_CHECK_INTERVAL секунд
+DB_REPLICA_URL = os.getenv("DB_REPLICA_URL")
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "5"))
+DB_REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_LAG_CHECK_INTERVAL", "1"))
+
+
+def env_flag(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+# Движок БД (database/session.py). DB_ECHO пишет в лог каждый SQL-запрос — только для отладки
+DB_ECHO = env_flag("DB_ECHO", False)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+# Сколько ждать свободного соединения, прежде чем упасть с TimeoutError (секунды)
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Соединения старше DB_POOL_RECYCLE секунд пересоздаются (-1 — никогда)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = env_flag("DB_POOL_PRE_PING", True)
+# Кэш подготовленных выражений asyncpg на соединение (0 — не кэшировать)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+# /summary и списки сущностей читают строки курсором на сервере пачками по DB_STREAM_CHUNK_SIZE:
+# в памяти держится одна пачка и важные элементы для вывода, а не все строки за сутки
+DB_STREAM_CHUNK_SIZE = int(os.getenv("DB_STREAM_CHUNK_SIZE", "500"))
+
+# Пул записи входящих сообщений (database/ingest.py)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+INGEST_FLUSH_INTERVAL_MS = int(os.getenv("INGEST_FLUSH_INTERVAL_MS", "200"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "10000"))
+# Что делать при переполнении очереди: block, drop или spill (дозапись в файл)
+INGEST_OVERFLOW = os.getenv("INGEST_OVERFLOW", "block")
+# Файл спилла; туда же при любой политике уходят пачки, не записанные из-за недоступности БД
+INGEST_SPILL_PATH = os.getenv("INGEST_SPILL_PATH", "ingest_spill.jsonl")
+
+# Кэш состояния чатов (is_active) для CollectorMiddleware
+CHAT_CACHE_TTL = int(os.getenv("CHAT_CACHE_TTL", "60"))
+CHAT_CACHE_SIZE = int(os.getenv("CHAT_CACHE_SIZE", "10000"))
+
+# Кэш вердиктов LLM (ml/verdicts.py): сколько вердиктов держать в памяти процесса поверх таблицы verdicts
+VERDICT_CACHE_SIZE = int(os.getenv("VERDICT_CACHE_SIZE", "50000"))
+
+# Разбор элементов в LLM (ml/ml.py): чанки не больше ML_CHUNK_TOKENS оценочных токенов и ML_CHUNK_ITEMS
+# элементов (ответ растёт с числом элементов), не больше ML_CONCURRENCY запросов одновременно на процесс
+ML_CHUNK_TOKENS = int(os.getenv("ML_CHUNK_TOKENS", "6000"))
+ML_CHUNK_ITEMS = int(os.getenv("ML_CHUNK_ITEMS", "150"))
+ML_CONCURRENCY = int(os.getenv("ML_CONCURRENCY", "4"))
+# Лимиты Gemini на процесс (ml/limiter.py), под квоту ключа; 0 — без ограничения
+ML_REQUESTS_PER_MINUTE = int(os.getenv("ML_REQUESTS_PER_MINUTE", "1000"))
+ML_TOKENS_PER_MINUTE = int(os.getenv("ML_TOKENS_PER_MINUTE", "1000000"))
+# /summary разбирает небольшую пачку всех категорий одним запросом к LLM (0 — запрос на категорию)
+ML_COMBINED = env_flag("ML_COMBINED", True)
+
+# Режим получения апдейтов: polling, webhook или sharded
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Публичный адрес бота для setWebhook, например https://bot.example.com
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEB_SERVER_HOST = os.getenv("WEB_SERVER_HOST", "0.0.0.0")
+WEB_SERVER_PORT = int(os.getenv("WEB_SERVER_PORT", "8080"))
+# Сколько апдейтов один процесс обрабатывает одновременно
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "100"))
+
+# Шардированный режим (BOT_MODE=sharded): процессы-воркеры по chat_id
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", str(os.cpu_count() or 1)))
+SHARD_QUEUE_SIZE = int(os.getenv("SHARD_QUEUE_SIZE", "1000"))
+
+# FSM в БД: сколько живёт незавершённое состояние и кэш чтения в процессе (секунды)
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", "86400"))
+FSM_CACHE_TTL = int(os.getenv("FSM_CACHE_TTL", "5"))
+# Сколько процесс помнит, что состояния нет (читается на каждом апдейте), секунды
+FSM_EMPTY_CACHE_TTL = int(os.getenv("FSM_EMPTY_CACHE_TTL", "3600"))
+
+# Срок хранения сообщений и сущностей (дни, 0 — хранить всё) и период очистки (секунды).
+# В Postgres таблицы секционированы по дням, секции создаются на PARTITION_PREMAKE_DAYS вперёд
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "30"))
+RETENTION_INTERVAL = int(os.getenv("RETENTION_INTERVAL", "3600"))
+PARTITION_PREMAKE_DAYS = int(os.getenv("PARTITION_PREMAKE_DAYS", "3"))
+# Сколько создание и удаление секций ждут блокировку таблицы, прежде чем отложить секцию (мс, 0 — без лимита)
+RETENTION_LOCK_TIMEOUT_MS = int(os.getenv("RETENTION_LOCK_TIMEOUT_MS", "2000"))
+
+# Метрики в формате Prometheus (utils/metrics.py). В режиме вебхука /metrics отдаёт сервер
+# вебхука, иначе — отдельный сервер на METRICS_PORT (0 — не поднимать); в шардированном
+# режиме воркер i слушает METRICS_PORT + 1 + i
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
@@ -1,6 +1,6 @@
 from .models import Base
 from .session import engine
+from .migrations import migrate
 
 async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+    await migrate(engine)
@@ -0,0 +1,84 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional
+
+from configs.config import CHAT_CACHE_TTL, CHAT_CACHE_SIZE
+
+
+class ChatState(NamedTuple):
+    """
+    То, что конвейеру записи нужно знать о чате на каждом сообщении.
+    """
+    is_active: bool
+    task_keywords: Optional[str] = None
+
+
+class ChatStateCache:
+    """
+    In-process кэш состояния чатов с TTL и LRU-ограничением по размеру.
+
+    Заполняется при первом сообщении из чата и сбрасывается функциями из
+    database/crud.py, которые меняют запись Chat. В нескольких процессах
+    кэши независимы: устаревшее значение живёт не дольше ttl секунд.
+    """
+
+    def __init__(self, ttl: float = 60, maxsize: int = 10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: "OrderedDict[int, tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, chat_id: int) -> Optional[Any]:
+        """
+        Возвращает закэшированное значение или None, если его нет или оно устарело.
+        """
+        entry = self._data.get(chat_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[chat_id]
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(chat_id)
+        self.hits += 1
+        return value
+
+    def peek(self, chat_id: int) -> Optional[Any]:
+        """
+        Как get(), но без учёта в статистике и без обновления порядка LRU.
+        """
+        entry = self._data.get(chat_id)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def set(self, chat_id: int, value: Any) -> None:
+        self._data[chat_id] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(chat_id)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, chat_id: int) -> None:
+        self._data.pop(chat_id, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+chat_cache = ChatStateCache(ttl=CHAT_CACHE_TTL, maxsize=CHAT_CACHE_SIZE)
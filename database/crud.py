@@ -1,15 +1,20 @@
 from datetime import datetime, timedelta
-from sqlalchemy import select, update
+from typing import AsyncIterator
+
+from sqlalchemy import and_, delete, false, or_, select, true, update, tuple_
 from aiogram import types
 
-from database.session import async_session
-from database.models import Chat, Task, Link, Document, Mention, Hashtag
+from configs.config import DB_STREAM_CHUNK_SIZE
+from database.session import read_session_scope, session_scope, stream_session_scope
+from database.cache import chat_cache
+from database.models import Chat, ChatMessage, Digest, Item, Task, Link, Document, Mention, Hashtag
+from database.records import ITEM_FIELDS, RECORDS
 
 async def activate_chat(message_chat: types.Chat) -> Chat:
     """
     Команда /on: Создает запись или включает is_active=True
     """
-    async with async_session() as session:
+    async with session_scope() as session:
         result = await session.execute(select(Chat).where(Chat.chat_id == message_chat.id))
         chat_entry = result.scalar_one_or_none()
 
@@ -28,6 +33,7 @@ async def activate_chat(message_chat: types.Chat) -> Chat:
             chat_entry.username = message_chat.username
 
         await session.commit()
+        chat_cache.invalidate(message_chat.id)
         await session.refresh(chat_entry)
         return chat_entry
 
@@ -35,18 +41,22 @@ async def deactivate_chat(chat_id: int):
     """
     Команда /off: Ставит is_active=False
     """
-    async with async_session() as session:
+    async with session_scope() as session:
         await session.execute(
             update(Chat).where(Chat.chat_id == chat_id).values(is_active=False)
         )
         await session.commit()
+        chat_cache.invalidate(chat_id)
 
 async def get_chat_settings(chat_id: int) -> Chat:
     """
     Получаем объект чата (он же настройки)
     """
-    async with async_session() as session:
-        result = await session.execute(select(Chat).where(Chat.chat_id == chat_id))
+    async with session_scope() as session:
+        # Сессия может быть общей на апдейт: перечитываем объект, а не берём из identity map
+        result = await session.execute(
+            select(Chat).where(Chat.chat_id == chat_id).execution_options(populate_existing=True)
+        )
         chat_entry = result.scalar_one_or_none()
         return chat_entry
 
@@ -54,54 +64,231 @@ async def update_settings_field(chat_id: int, **kwargs):
     """
     Обновляем любое поле в таблице Chat (время, галочки и т.д.)
     """
-    async with async_session() as session:
+    async with session_scope() as session:
         await session.execute(
             update(Chat).where(Chat.chat_id == chat_id).values(**kwargs)
         )
+        # Готовая сводка собрана по прежним категориям: следующий /summary соберёт её заново
+        await session.execute(delete(Digest).where(Digest.chat_id == chat_id))
         await session.commit()
+        chat_cache.invalidate(chat_id)
+
+# Категория сводки -> (модель, флаг включения в Chat)
+DAILY_CATEGORIES = {
+    "tasks": (Task, Chat.include_tasks),
+    "mentions": (Mention, Chat.include_mentions),
+    "hashtags": (Hashtag, Chat.include_hashtags),
+    "links": (Link, Chat.include_links),
+    "documents": (Document, Chat.include_docs),
+}
+
+# Вид элемента (items.kind) -> категория сводки
+DAILY_KINDS = {model.__mapper__.polymorphic_identity: kind for kind, (model, _) in DAILY_CATEGORIES.items()}
+
+
+def daily_data_query(chat_id: int, since: datetime, unchecked_only: bool = False):
+    """
+    Один SELECT по items в общей проекции, соединённый с chats: виды элементов,
+    выключенные в настройках чата, отсекаются условием на kind.
+    unchecked_only оставляет только не разобранные ML элементы (частичный индекс ix_items_unchecked).
+    """
+    included = or_(*(
+        and_(Item.kind == model.__mapper__.polymorphic_identity, include_flag.is_(true()))
+        for model, include_flag in DAILY_CATEGORIES.values()
+    ))
+    query = (
+        select(Item.kind, *(getattr(Item, key) for key in ITEM_FIELDS), Item.content, Item.file_id)
+        .join(Chat, Chat.chat_id == Item.chat_id)
+        .where(Item.chat_id == chat_id, Item.created_at >= since, included)
+    )
+    if unchecked_only:
+        query = query.where(Item.is_checked.is_(false()))
+    return query.order_by(Item.created_at, Item.id)
+
+
+# Категория -> класс записи (database/records.py) под значения строки daily_data_query;
+# у не-документов zip отбросит пустой file_id
+DAILY_RECORDS = {kind: RECORDS[model] for kind, (model, _) in DAILY_CATEGORIES.items()}
+
+
+def group_daily_rows(rows) -> dict:
+    """
+    Раскладывает строки daily_data_query по категориям. Ключи — все категории.
+    """
+    data = {kind: [] for kind in DAILY_CATEGORIES}
+    for kind, *values in rows:
+        category = DAILY_KINDS[kind]
+        data[category].append(DAILY_RECORDS[category](*values))
+    return data
+
 
 async def get_daily_data(chat_id: int):
     """
-    Собирает все данные по конкретному чату за последние 24 часа.
+    Собирает все данные по конкретному чату за последние 24 часа одним запросом
+    (с реплики, если она есть). Выключенные в настройках категории приходят пустыми.
     """
     yesterday = datetime.now() - timedelta(days=1)
-    
-    async with async_session() as session:
-        tasks_q = await session.execute(
-            select(Task).where(Task.chat_id == chat_id, Task.created_at >= yesterday)
-        )
-        mentions_q = await session.execute(
-            select(Mention).where(Mention.chat_id == chat_id, Mention.created_at >= yesterday)
-        )
-        hashtags_q = await session.execute(
-            select(Hashtag).where(Hashtag.chat_id == chat_id, Hashtag.created_at >= yesterday)
-        )
-        links_q = await session.execute(
-            select(Link).where(Link.chat_id == chat_id, Link.created_at >= yesterday)
-        )
-        docs_q = await session.execute(
-            select(Document).where(Document.chat_id == chat_id, Document.created_at >= yesterday)
-        )
 
-        return {
-            "tasks": tasks_q.scalars().all(),
-            "mentions": mentions_q.scalars().all(),
-            "hashtags": hashtags_q.scalars().all(),
-            "links": links_q.scalars().all(),
-            "documents": docs_q.scalars().all(),
-        }
+    async with read_session_scope() as session:
+        result = await session.execute(daily_data_query(chat_id, yesterday))
+        rows = result.all()
+
+    return group_daily_rows(rows)
+
+
+async def has_daily_data(chat_id: int) -> bool:
+    """
+    Есть ли за последние 24 часа хоть что-то во включённых категориях.
+    """
+    return await has_rows(daily_data_query(chat_id, datetime.now() - timedelta(days=1)))
+
+
+async def stream_daily_data(
+        chat_id: int,
+        chunk_size: int = DB_STREAM_CHUNK_SIZE,
+        unchecked_only: bool = False,
+) -> AsyncIterator[dict]:
+    """
+    Потоковый вариант get_daily_data: тот же запрос курсором на сервере,
+    пачками по chunk_size строк, каждая пачка разложена по категориям.
+    """
+    yesterday = datetime.now() - timedelta(days=1)
+    query = daily_data_query(chat_id, yesterday, unchecked_only)
+
+    async with stream_session_scope() as session:
+        async for rows in stream_partitions(session, query, chunk_size):
+            yield group_daily_rows(rows)
+
+
+async def has_rows(query) -> bool:
+    """
+    Возвращает ли запрос хоть одну строку (SELECT EXISTS, с реплики, если она есть).
+    """
+    async with read_session_scope() as session:
+        return bool(await session.scalar(select(query.exists())))
+
+
+async def stream_partitions(session, query, chunk_size: int) -> AsyncIterator[list]:
+    """
+    Строки запроса пачками по chunk_size через курсор на сервере (session.stream).
+    SQLite не даёт другим соединениям коммитить, пока открыт читающий курсор,
+    а пачки сохраняются по ходу чтения, поэтому там строки читаются целиком
+    и только выдаются пачками.
+    """
+    if session.bind.dialect.name == "sqlite":
+        result = await session.execute(query)
+        for rows in result.partitions(chunk_size):
+            yield rows
+        return
+
+    result = await session.stream(query.execution_options(yield_per=chunk_size))
+    async for rows in result.partitions():
+        yield rows
+
+
+async def scalar_partitions(session, query, chunk_size: int) -> AsyncIterator[list]:
+    """
+    Объекты запроса пачками по chunk_size: курсором на сервере, а в SQLite
+    (см. stream_partitions) — сначала только id, затем объекты по пачке id.
+    """
+    if session.bind.dialect.name != "sqlite":
+        result = await session.stream_scalars(query.execution_options(yield_per=chunk_size))
+        async for chunk in result.partitions():
+            yield chunk
+        return
+
+    model = query.column_descriptions[0]["entity"]
+    ids = (await session.execute(query.with_only_columns(model.id))).scalars().all()
+    for start in range(0, len(ids), chunk_size):
+        batch = ids[start:start + chunk_size]
+        result = await session.execute(select(model).where(model.id.in_(batch)))
+        found = {item.id: item for item in result.scalars()}
+        yield [found[item_id] for item_id in batch if item_id in found]
+
+
+async def stream_scalars(query, chunk_size: int = DB_STREAM_CHUNK_SIZE) -> AsyncIterator[list]:
+    """
+    Объекты запроса пачками по chunk_size (см. scalar_partitions). Пачка
+    отсоединяется от сессии до выдачи: identity map не копит объекты, и в памяти
+    живёт только то, что держит вызывающий код. Отложенные колонки (context)
+    подгружаются через attach_context().
+    """
+    async with stream_session_scope() as session:
+        async for chunk in scalar_partitions(session, query, chunk_size):
+            for item in chunk:
+                session.expunge(item)
+            yield chunk
+
+
+async def record_partitions(session, query, chunk_size: int) -> AsyncIterator[list]:
+    """
+    Строки запроса select_records пачками по chunk_size: курсором на сервере,
+    а в SQLite (см. stream_partitions) — сначала только id, затем строки по пачке id.
+    """
+    if session.bind.dialect.name != "sqlite":
+        async for rows in stream_partitions(session, query, chunk_size):
+            yield rows
+        return
+
+    model = query.column_descriptions[0]["entity"]
+    ids = (await session.execute(query.with_only_columns(model.id))).scalars().all()
+    for start in range(0, len(ids), chunk_size):
+        result = await session.execute(query.where(model.id.in_(ids[start:start + chunk_size])))
+        yield result.all()
+
+
+async def stream_records(query, chunk_size: int = DB_STREAM_CHUNK_SIZE) -> AsyncIterator[list]:
+    """
+    Записи (database/records.py) запроса select_records пачками по chunk_size.
+    В отличие от stream_scalars объекты ORM не создаются: строка сразу
+    становится записью со __slots__. context подгружается через attach_context().
+    """
+    record = RECORDS[query.column_descriptions[0]["entity"]]
+    async with stream_session_scope() as session:
+        async for rows in record_partitions(session, query, chunk_size):
+            yield [record(*row) for row in rows]
 
 
 async def save_analysis_results(model, analysis_results: list[dict]):
     """
-    Сохраняет результаты анализа (is_important) для различных моделей.
-    Принимает модель (например, Task, Link) и список словарей с id и is_important.
+    Сохраняет результаты анализа для различных моделей одним bulk UPDATE по id
+    (executemany). Принимает модель (например, Task, Link) и список словарей
+    с id, is_important и about; is_checked по умолчанию True — элемент разобран
+    и в следующую сводку на анализ не уйдёт.
+
+    Элемент могла удалить правка сообщения, пока шёл запрос к LLM: такая строка
+    просто не обновится. Дополнительное условие WHERE отключает в ORM проверку,
+    что обновлено ровно len(rows) строк.
     """
-    async with async_session() as session:
-        for item_data in analysis_results:
-            await session.execute(
-                update(model)
-                .where(model.id == item_data['id'])
-                .values(is_important=item_data['is_important'])
-            )
+    if not analysis_results:
+        return
+
+    rows = [{"is_checked": True, **item_data} for item_data in analysis_results]
+    async with session_scope() as session:
+        await session.execute(
+            update(model).where(model.kind == model.__mapper__.polymorphic_identity),
+            rows,
+            execution_options={"synchronize_session": None},
+        )
         await session.commit()
+
+
+async def attach_context(items: list) -> None:
+    """
+    Подгружает context (текст сообщения из messages) одним запросом
+    и проставляет его объектам. Нужен только тем элементам, что уходят в ML
+    или показываются без about.
+    """
+    keys = {(item.chat_id, item.message_id) for item in items}
+    if not keys:
+        return
+
+    async with session_scope() as session:
+        result = await session.execute(
+            select(ChatMessage.chat_id, ChatMessage.message_id, ChatMessage.text)
+            .where(tuple_(ChatMessage.chat_id, ChatMessage.message_id).in_(keys))
+        )
+        texts = {(row.chat_id, row.message_id): row.text for row in result}
+
+    for item in items:
+        item.context = texts.get((item.chat_id, item.message_id))
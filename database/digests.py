@@ -0,0 +1,162 @@
+"""
+Готовые сводки чатов (таблица digests).
+
+Сводка — важные элементы за окно по категориям /summary. Повторный /summary
+по свежей сводке — одно чтение строки без обращения к таблицам сущностей.
+Новые сущности увеличивают version (database.ingest.mark_digests), и следующий
+/summary доразбирает только ещё не проверенные ML элементы
+(ml.services.refresh_digest). Правки сообщений тоже увеличивают version, но
+ставят built_version = DIGEST_REBUILD, а смена настроек чата удаляет сводку — тогда
+она собирается заново по всем элементам окна.
+
+Строка сводки создаётся до сборки (open_digest), а сохраняется, только если
+version за время сборки не изменилась (save_digest): иначе сводка без
+пришедших за это время элементов считалась бы свежей.
+"""
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import delete, select, update
+
+from database.crud import DAILY_RECORDS
+from database.ingest import DIALECT_INSERTS
+from database.models import DIGEST_REBUILD, Digest
+from database.session import session_scope
+
+# Окно /summary — последние сутки
+DAILY_WINDOW = "24h"
+WINDOW = timedelta(days=1)
+
+
+def is_fresh(digest: Optional[Digest], now: datetime) -> bool:
+    """
+    Сводка собрана по всем известным сущностям и не старше окна.
+    """
+    return (
+        digest is not None
+        and digest.built_version == digest.version
+        and digest.updated_at >= now - WINDOW
+    )
+
+
+def encode_items(data: Dict[str, List[Any]]) -> str:
+    encoded = {}
+    for kind, items in data.items():
+        names = DAILY_RECORDS[kind].fields
+        encoded[kind] = [
+            {name: getattr(item, name) for name in names} | {"created_at": item.created_at.isoformat()}
+            for item in items
+        ]
+    return json.dumps(encoded, ensure_ascii=False)
+
+
+def decode_items(raw: str, since: datetime) -> Dict[str, List[Any]]:
+    """
+    Записи (database/records.py) из JSON сводки; элементы старше since (вышли из окна) отбрасываются.
+    """
+    data = {}
+    for kind, rows in json.loads(raw).items():
+        record = DAILY_RECORDS[kind]
+        data[kind] = []
+        for fields in rows:
+            created_at = datetime.fromisoformat(fields["created_at"])
+            if created_at >= since:
+                data[kind].append(record.from_dict(fields | {"created_at": created_at}))
+    return data
+
+
+def merge_items(base: Dict[str, List[Any]], new: Dict[str, List[Any]]) -> Dict[str, List[Any]]:
+    """
+    Объединяет элементы по категориям; элемент с тем же id берётся из new.
+    """
+    merged = {}
+    for kind in base.keys() | new.keys():
+        by_id = {item.id: item for item in base.get(kind, []) + new.get(kind, [])}
+        merged[kind] = sorted(by_id.values(), key=lambda item: (item.created_at, item.id))
+    return merged
+
+
+async def load_digest(chat_id: int, window_key: str = DAILY_WINDOW) -> Optional[Digest]:
+    async with session_scope() as session:
+        result = await session.execute(
+            select(Digest)
+            .where(Digest.chat_id == chat_id, Digest.window_key == window_key)
+            .execution_options(populate_existing=True)
+        )
+        return result.scalar_one_or_none()
+
+
+async def open_digest(chat_id: int, window_key: str = DAILY_WINDOW) -> Digest:
+    """
+    Сводка чата перед сборкой. Если её нет, создаётся пустая строка с
+    built_version = DIGEST_REBUILD: новые сущности и правки за время сборки
+    увеличат её version, и save_digest это увидит.
+    """
+    async with session_scope() as session:
+        dialect_name = session.get_bind().dialect.name
+        stmt = DIALECT_INSERTS[dialect_name](Digest.__table__).values(
+            chat_id=chat_id, window_key=window_key, version=0, built_version=DIGEST_REBUILD,
+            items="{}", updated_at=datetime.now(),
+        )
+        await session.execute(stmt.on_conflict_do_nothing(index_elements=["chat_id", "window_key"]))
+        await session.commit()
+    return await load_digest(chat_id, window_key)
+
+
+async def save_digest(
+        chat_id: int,
+        data: Dict[str, List[Any]],
+        built_version: int,
+        window_key: str = DAILY_WINDOW,
+) -> bool:
+    """
+    Записывает сводку, собранную по версии built_version, если version строки
+    с тех пор не изменилась. Иначе за время сборки пришли новые сущности или
+    правки, которых в data может не быть: сводка помечается DIGEST_REBUILD, а если
+    строку удалили (смена настроек) — не создаётся. Возвращает, сохранена ли сводка.
+    """
+    where = (Digest.chat_id == chat_id, Digest.window_key == window_key)
+    async with session_scope() as session:
+        result = await session.execute(
+            update(Digest)
+            .where(*where, Digest.version == built_version)
+            .values(items=encode_items(data), built_version=built_version, updated_at=datetime.now())
+        )
+        saved = result.rowcount > 0
+        if not saved:
+            await session.execute(update(Digest).where(*where).values(built_version=DIGEST_REBUILD))
+        await session.commit()
+    return saved
+
+
+async def drop_digest(chat_id: int, window_key: str = DAILY_WINDOW) -> None:
+    async with session_scope() as session:
+        await session.execute(delete(Digest).where(Digest.chat_id == chat_id, Digest.window_key == window_key))
+        await session.commit()
+
+
+async def replace_digest_category(
+        chat_id: int,
+        kind: str,
+        items: List[Any],
+        window_key: str = DAILY_WINDOW,
+) -> None:
+    """
+    Подставляет в сводку категорию, целиком заново разобранную списочной командой
+    (/links, /tasks, ...): иначе /summary не увидел бы разобранные там элементы,
+    он доразбирает только непроверенные. Без сводки ничего не делает.
+    """
+    digest = await load_digest(chat_id, window_key)
+    if digest is None:
+        return
+
+    data = json.loads(digest.items)
+    data[kind] = json.loads(encode_items({kind: items}))[kind]
+    async with session_scope() as session:
+        await session.execute(
+            update(Digest)
+            .where(Digest.id == digest.id)
+            .values(items=json.dumps(data, ensure_ascii=False))
+        )
+        await session.commit()
@@ -0,0 +1,141 @@
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Mapping, NamedTuple, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from sqlalchemy import and_, delete, select
+
+from database.cache import ChatStateCache
+from database.ingest import DIALECT_INSERTS
+from database.models import FsmState
+from database.session import session_scope
+
+
+class FsmEntry(NamedTuple):
+    state: Optional[str] = None
+    data: Dict[str, Any] = {}
+
+
+EMPTY = FsmEntry()
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class SqlStorage(BaseStorage):
+    """
+    FSM-хранилище aiogram в таблице fsm_states той же БД, что и остальные данные.
+    Состояние переживает рестарт и видно всем процессам бота.
+
+    Чтения кэшируются в процессе на `cache_ttl` секунд (запись сразу обновляет кэш),
+    поэтому другой процесс может увидеть изменение с задержкой до cache_ttl.
+    aiogram читает состояние на каждом апдейте, а у почти всех пар (чат, пользователь)
+    его нет: отсутствие кэшируется на `empty_cache_ttl` секунд и сбрасывается записью.
+    Запись из другого процесса этот кэш не сбрасывает; при шардировании по chat_id
+    состояния чата читает и пишет один процесс.
+    Состояния, которые не менялись дольше `state_ttl`, считаются истёкшими:
+    при чтении игнорируются, а раз в `purge_interval` секунд удаляются.
+    """
+
+    def __init__(
+            self,
+            state_ttl: float = 86400,
+            cache_ttl: float = 5,
+            empty_cache_ttl: float = 3600,
+            cache_size: int = 10000,
+            purge_interval: float = 3600,
+    ):
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.state_ttl = state_ttl
+        self.purge_interval = purge_interval
+        self.cache = ChatStateCache(ttl=cache_ttl, maxsize=cache_size)
+        self.empty_cache = ChatStateCache(ttl=empty_cache_ttl, maxsize=cache_size * 10)
+        self._last_purge = time.monotonic()
+
+    def _cutoff(self) -> datetime:
+        return utcnow() - timedelta(seconds=self.state_ttl)
+
+    async def _load(self, key: StorageKey) -> FsmEntry:
+        storage_key = self.key_builder.build(key)
+        entry = self.cache.get(storage_key)
+        if entry is not None:
+            return entry
+        if self.empty_cache.get(storage_key) is not None:
+            return EMPTY
+
+        async with session_scope() as session:
+            result = await session.execute(
+                select(FsmState.state, FsmState.data, FsmState.updated_at).where(FsmState.key == storage_key)
+            )
+            row = result.one_or_none()
+
+        if row is None or row.updated_at < self._cutoff():
+            entry = EMPTY
+        else:
+            entry = FsmEntry(row.state, json.loads(row.data) if row.data else {})
+        if entry == EMPTY:
+            self.empty_cache.set(storage_key, True)
+        else:
+            self.cache.set(storage_key, entry)
+        return entry
+
+    async def _save(self, key: StorageKey, **values) -> None:
+        """
+        Upsert одной колонки (state или data); запись без состояния и данных удаляется.
+        """
+        storage_key = self.key_builder.build(key)
+        values["updated_at"] = utcnow()
+
+        async with session_scope() as session:
+            dialect_name = session.get_bind().dialect.name
+            stmt = DIALECT_INSERTS[dialect_name](FsmState.__table__).values(key=storage_key, **values)
+            await session.execute(stmt.on_conflict_do_update(index_elements=["key"], set_=values))
+            await session.execute(
+                delete(FsmState).where(and_(
+                    FsmState.key == storage_key,
+                    FsmState.state.is_(None),
+                    FsmState.data.is_(None),
+                ))
+            )
+            await session.commit()
+
+        self.empty_cache.invalidate(storage_key)
+        cached = self.cache.peek(storage_key)
+        if cached is None:
+            self.cache.invalidate(storage_key)
+        elif "state" in values:
+            self.cache.set(storage_key, cached._replace(state=values["state"]))
+        else:
+            self.cache.set(storage_key, cached._replace(data=json.loads(values["data"]) if values["data"] else {}))
+
+        if time.monotonic() - self._last_purge > self.purge_interval:
+            await self.purge_expired()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._save(key, state=state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._load(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await self._save(key, data=json.dumps(dict(data), ensure_ascii=False) if data else None)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict((await self._load(key)).data)
+
+    async def purge_expired(self) -> int:
+        """
+        Удаляет истёкшие состояния. Возвращает число удалённых записей.
+        """
+        self._last_purge = time.monotonic()
+        async with session_scope() as session:
+            result = await session.execute(delete(FsmState).where(FsmState.updated_at < self._cutoff()))
+            await session.commit()
+        return result.rowcount
+
+    async def close(self) -> None:
+        self.cache.clear()
+        self.empty_cache.clear()
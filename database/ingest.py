@@ -0,0 +1,470 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import Table, delete, insert, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+
+from database.cache import ChatState, ChatStateCache, chat_cache
+from database.models import DIGEST_REBUILD, Base, Chat, ChatMessage, Digest, Item
+from ml.detector import get_task_detector
+
+logger = logging.getLogger(__name__)
+
+# Лимит bind-параметров в одном INSERT (у Postgres 32767, у SQLite 32766)
+MAX_STATEMENT_PARAMS = 30000
+
+OVERFLOW_POLICIES = ("block", "drop", "spill")
+
+# Ошибки недоступности БД: пачка уходит в спилл и пишется позже.
+# Остальные (нарушение ограничений и т.п.) повтор не исправит
+TRANSIENT_ERRORS = (OperationalError, InterfaceError, PoolTimeoutError, OSError, asyncio.TimeoutError)
+
+_STOP = object()
+
+DIALECT_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+ITEMS = Item.__table__
+
+
+class IngestRecord(NamedTuple):
+    """
+    Всё, что нужно записать об одном сообщении. Собирается в CollectorMiddleware
+    без обращения к БД; активность чата и задачи определяет воркер.
+    """
+    chat_id: int
+    message_id: int
+    text: str
+    document: Optional[Tuple[str, str]] = None  # (file_id, file_name)
+    hashtags: Tuple[str, ...] = ()
+    links: Tuple[str, ...] = ()
+    mentions: Tuple[str, ...] = ()
+    edited: bool = False
+    # Время отправки сообщения; у правки — время исходного сообщения
+    date: Optional[datetime] = None
+
+    def to_json(self) -> str:
+        return json.dumps(self._replace(date=self.date and self.date.isoformat()), ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, line: str) -> "IngestRecord":
+        chat_id, message_id, text, document, hashtags, links, mentions, edited, *date = json.loads(line)
+        date = date[0] if date else None  # в спилле прежних версий даты нет
+        return cls(
+            chat_id, message_id, text,
+            tuple(document) if document else None,
+            tuple(hashtags), tuple(links), tuple(mentions), edited,
+            datetime.fromisoformat(date) if date else None,
+        )
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def record_rows(record: IngestRecord, state: ChatState) -> List[Tuple[Table, Dict[str, Any]]]:
+    """
+    Превращает запись в строки для вставки: текст в messages и элементы items со ссылкой на него.
+    created_at берётся из даты сообщения, поэтому повторная запись того же
+    сообщения попадает в ту же секцию и отсекается уникальным ключом.
+    """
+    chat_id, message_id = record.chat_id, record.message_id
+    rows = []
+
+    def add_items(kind: str, values, file_id: Optional[str] = None) -> None:
+        # Повторы значения в одном сообщении записываются один раз; position — порядок в сообщении
+        for position, content in enumerate(dict.fromkeys(values)):
+            rows.append((ITEMS, dict(
+                kind=kind, chat_id=chat_id, message_id=message_id,
+                position=position, content=content, file_id=file_id,
+            )))
+
+    if record.document:
+        file_id, file_name = record.document
+        add_items("document", (file_name,), file_id)
+    add_items("hashtag", record.hashtags)
+    add_items("link", record.links)
+    add_items("mention", record.mentions)
+    if get_task_detector(state.task_keywords).is_task(record.text):
+        add_items("task", (record.text,))
+
+    if rows:
+        rows.insert(0, (ChatMessage.__table__, dict(
+            chat_id=chat_id, message_id=message_id, text=record.text, text_hash=text_hash(record.text),
+        )))
+        created_at = record.date or datetime.now()
+        for _, row in rows:
+            row["created_at"] = created_at
+    return rows
+
+
+def build_insert(dialect_name: str, table: Table):
+    """
+    INSERT ... ON CONFLICT DO NOTHING для Postgres и SQLite: повторная доставка
+    сообщения (спилл, рестарт) не должна ронять всю пачку. Цель конфликта не
+    указывается: в секционированных таблицах Postgres уникальные ключи дополнены
+    created_at и не совпадают с объявленными в моделях.
+    """
+    if dialect_name in DIALECT_INSERTS:
+        return DIALECT_INSERTS[dialect_name](table).on_conflict_do_nothing()
+    return insert(table)
+
+
+async def write_rows(session, rows: List[Tuple[Table, Dict[str, Any]]]) -> None:
+    """
+    Записывает пачку строк в текущую транзакцию сессии.
+    Строки группируются по таблицам и уходят многострочными INSERT ... VALUES,
+    минуя unit-of-work ORM. Таблицы пишутся в порядке зависимостей схемы.
+    """
+    grouped: Dict[Table, List[dict]] = {}
+    for table, row in rows:
+        grouped.setdefault(table, []).append(row)
+
+    order = {table: i for i, table in enumerate(Base.metadata.sorted_tables)}
+    dialect_name = session.get_bind().dialect.name
+
+    for table in sorted(grouped, key=lambda t: order.get(t, len(order))):
+        table_rows = grouped[table]
+        stmt = build_insert(dialect_name, table)
+        step = max(1, MAX_STATEMENT_PARAMS // len(table.columns))
+        for start in range(0, len(table_rows), step):
+            await session.execute(stmt.values(table_rows[start:start + step]))
+
+
+async def drop_changed_messages(
+        session, records: List[IngestRecord]
+) -> Tuple[Set[Tuple[int, int]], List[Tuple[int, int]]]:
+    """
+    Подготовка правок к записи. Если хэш текста не изменился, сообщение
+    пропускается целиком: сущности и их is_checked/about остаются как есть.
+    У изменённых сообщений удаляются текст и все сущности, а write_rows
+    в той же транзакции вставляет новый набор с is_checked = false.
+    Возвращает ключи неизменённых и заменяемых сообщений.
+    """
+    edited = {(r.chat_id, r.message_id): text_hash(r.text) for r in records if r.edited}
+    if not edited:
+        return set(), []
+
+    result = await session.execute(
+        select(ChatMessage.chat_id, ChatMessage.message_id, ChatMessage.text_hash)
+        .where(tuple_(ChatMessage.chat_id, ChatMessage.message_id).in_(list(edited)))
+    )
+    unchanged, changed = set(), []
+    for chat_id, message_id, stored_hash in result:
+        key = (chat_id, message_id)
+        if stored_hash == edited[key]:
+            unchanged.add(key)
+        else:
+            changed.append(key)
+
+    if changed:
+        for table in (ITEMS, ChatMessage.__table__):
+            await session.execute(
+                delete(table).where(tuple_(table.c.chat_id, table.c.message_id).in_(changed))
+            )
+    return unchanged, changed
+
+
+async def mark_digests(session, rows: List[Tuple[Table, Dict[str, Any]]], replaced: List[Tuple[int, int]]) -> None:
+    """
+    Готовые сводки (таблица digests) чатов с новыми сущностями устаревают: version
+    растёт, и следующий /summary доразберёт новые элементы. У правленых сообщений
+    сущности заменены целиком, поэтому сводка таких чатов помечается DIGEST_REBUILD и
+    собирается заново. Строка не удаляется: сборка, которая идёт сейчас, увидит
+    новую version и не сохранит сводку по прежним сущностям.
+    """
+    rebuilt = {chat_id for chat_id, _ in replaced}
+    changed = {row["chat_id"] for table, row in rows if table is not ChatMessage.__table__} - rebuilt
+
+    if rebuilt:
+        await session.execute(
+            update(Digest)
+            .where(Digest.chat_id.in_(rebuilt))
+            .values(version=Digest.version + 1, built_version=DIGEST_REBUILD)
+        )
+    if changed:
+        await session.execute(
+            update(Digest).where(Digest.chat_id.in_(changed)).values(version=Digest.version + 1)
+        )
+
+
+async def resolve_chats(session, chat_ids, cache: ChatStateCache) -> Dict[int, ChatState]:
+    """
+    Состояния чатов для пачки: из кэша, а неизвестные — одним запросом.
+    """
+    states, missing = {}, []
+    for chat_id in chat_ids:
+        state = cache.get(chat_id)
+        if state is None:
+            missing.append(chat_id)
+        else:
+            states[chat_id] = state
+
+    if missing:
+        result = await session.execute(
+            select(Chat.chat_id, Chat.is_active, Chat.task_keywords).where(Chat.chat_id.in_(missing))
+        )
+        found = {row.chat_id: row for row in result}
+        for chat_id in missing:
+            row = found.get(chat_id)
+            if row is not None and row.is_active:
+                state = ChatState(is_active=True, task_keywords=row.task_keywords)
+            else:
+                state = ChatState(is_active=False)
+            cache.set(chat_id, state)
+            states[chat_id] = state
+
+    return states
+
+
+class IngestPool:
+    """
+    Стадия записи входящих сообщений, отвязанная от обработки апдейтов.
+
+    CollectorMiddleware кладёт IngestRecord через submit() и сразу идёт дальше.
+    `workers` фоновых задач разбирают записи пачками (до `batch_size` записей
+    или `flush_interval_ms`), определяют активность чатов и пишут строки в БД
+    одной транзакцией на пачку. Записи одного чата всегда попадают в одну и ту
+    же очередь, поэтому порядок сообщений внутри чата сохраняется.
+    Правки заменяют набор сущностей сообщения, только если изменился текст
+    (см. drop_changed_messages).
+
+    Очереди ограничены `max_queue_size` записей на все воркеры. При переполнении:
+    - "block": submit() ждёт места (backpressure на цикл поллинга);
+    - "drop": запись отбрасывается и учитывается в метриках;
+    - "spill": запись дописывается в `spill_path` и позже возвращается в очередь.
+    Пачка, которую не удалось записать из-за недоступности БД (TRANSIENT_ERRORS),
+    тоже уходит в `spill_path` при любой политике.
+    stop() дописывает всё, что есть в очередях; файл спилла дочитывается при следующем старте.
+    """
+
+    def __init__(
+            self,
+            session_pool,
+            workers: int = 2,
+            batch_size: int = 500,
+            flush_interval_ms: int = 200,
+            max_queue_size: int = 10000,
+            overflow: str = "block",
+            spill_path: str = "ingest_spill.jsonl",
+            cache: ChatStateCache = chat_cache,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Неизвестная политика переполнения: {overflow}")
+
+        self.session_pool = session_pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.overflow = overflow
+        self.spill_path = spill_path
+        self.cache = cache
+
+        queue_size = max(1, max_queue_size // workers)
+        self._queues: List[asyncio.Queue] = [asyncio.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._tasks: List[asyncio.Task] = []
+        self._replay_task: Optional[asyncio.Task] = None
+
+        self.submitted = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.max_depth = 0
+        self.records_written = 0
+        self.rows_written = 0
+        self.records_failed = 0
+        self.flushes = 0
+        self.edits_skipped = 0
+        self.edits_replaced = 0
+
+    @property
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    def _queue_for(self, chat_id: int) -> asyncio.Queue:
+        return self._queues[chat_id % len(self._queues)]
+
+    async def submit(self, record: IngestRecord) -> bool:
+        """
+        Ставит запись в очередь. Возвращает False, если запись отброшена или ушла в спилл.
+        """
+        queue = self._queue_for(record.chat_id)
+        try:
+            queue.put_nowait(record)
+        except asyncio.QueueFull:
+            if self.overflow == "block":
+                await queue.put(record)
+            elif self.overflow == "drop":
+                self.dropped += 1
+                return False
+            else:
+                self._spill(record)
+                return False
+
+        self.submitted += 1
+        self.max_depth = max(self.max_depth, self.depth)
+        return True
+
+    async def start(self, shard_index: Optional[int] = None) -> None:
+        """
+        В шардированном режиме (utils/sharding.py) у каждого воркера свой файл спилла:
+        иначе воркеры делили бы один файл и дочитывали чужие записи.
+        """
+        if self._tasks:
+            return
+        if shard_index is not None:
+            self.spill_path = f"{self.spill_path}.{shard_index}"
+        self._tasks = [asyncio.create_task(self._worker(q)) for q in self._queues]
+        self._replay_task = asyncio.create_task(self._replay_loop())
+
+    async def stop(self) -> None:
+        if not self._tasks:
+            return
+        if self._replay_task is not None:
+            self._replay_task.cancel()
+            await asyncio.gather(self._replay_task, return_exceptions=True)
+            self._replay_task = None
+        for queue in self._queues:
+            await queue.put(_STOP)
+        await asyncio.gather(*self._tasks)
+        self._tasks = []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "queue_depths": [q.qsize() for q in self._queues],
+            "submitted": self.submitted,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "records_written": self.records_written,
+            "rows_written": self.rows_written,
+            "records_failed": self.records_failed,
+            "flushes": self.flushes,
+            "edits_skipped": self.edits_skipped,
+            "edits_replaced": self.edits_replaced,
+        }
+
+    # ---------- воркеры ----------
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            batch, stopping = await self._collect(queue)
+            if batch:
+                await self._flush(batch)
+            if stopping:
+                return
+
+    async def _collect(self, queue: asyncio.Queue):
+        """
+        Ждёт первую запись, затем добирает пачку до batch_size,
+        но не дольше flush_interval.
+        """
+        loop = asyncio.get_running_loop()
+        item = await queue.get()
+        if item is _STOP:
+            return [], True
+
+        batch = [item]
+        deadline = loop.time() + self.flush_interval
+
+        while len(batch) < self.batch_size:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+
+        return batch, False
+
+    async def _flush(self, batch: List[IngestRecord]) -> None:
+        rows = []
+        try:
+            async with self.session_pool() as session:
+                # Несколько версий одного сообщения в пачке: побеждает последняя
+                latest = {(r.chat_id, r.message_id): r for r in batch}
+                states = await resolve_chats(session, {chat_id for chat_id, _ in latest}, self.cache)
+                records = [r for r in latest.values() if states[r.chat_id].is_active]
+
+                unchanged, replaced = await drop_changed_messages(session, records)
+                for record in records:
+                    if (record.chat_id, record.message_id) not in unchanged:
+                        rows.extend(record_rows(record, states[record.chat_id]))
+
+                if rows or replaced:
+                    await write_rows(session, rows)
+                    await mark_digests(session, rows, replaced)
+                    await session.commit()
+            self.records_written += len(batch)
+            self.rows_written += len(rows)
+            self.edits_skipped += len(unchanged)
+            self.edits_replaced += len(replaced)
+        except TRANSIENT_ERRORS:
+            self.records_failed += len(batch)
+            logger.exception("БД недоступна, пачка из %d сообщений ушла в спилл", len(batch))
+            try:
+                for record in batch:
+                    self._spill(record)
+            except OSError:
+                logger.exception("Не удалось дописать пачку в файл спилла %s", self.spill_path)
+        except Exception:
+            self.records_failed += len(batch)
+            logger.exception("Не удалось записать пачку из %d сообщений", len(batch))
+        finally:
+            self.flushes += 1
+
+    # ---------- спилл ----------
+
+    def _spill(self, record: IngestRecord) -> None:
+        with open(self.spill_path, "a", encoding="utf-8") as f:
+            f.write(record.to_json() + "\n")
+        self.spilled += 1
+
+    async def _replay_loop(self, interval: float = 1.0) -> None:
+        """
+        Возвращает записи из файла спилла в очереди, когда они наполовину свободны.
+        """
+        capacity = sum(q.maxsize for q in self._queues)
+        paths = (self.spill_path, self.spill_path + ".replay")
+        while True:
+            if any(os.path.exists(p) for p in paths) and self.depth < capacity // 2:
+                try:
+                    await self.replay_spill()
+                except Exception:
+                    logger.exception("Не удалось дочитать файл спилла %s", self.spill_path)
+            await asyncio.sleep(interval)
+
+    async def replay_spill(self) -> int:
+        replay_path = self.spill_path + ".replay"
+        if not os.path.exists(replay_path):
+            if not os.path.exists(self.spill_path):
+                return 0
+            os.replace(self.spill_path, replay_path)
+
+        count = 0
+        with open(replay_path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = IngestRecord.from_json(line)
+                    await self._queue_for(record.chat_id).put(record)
+                    count += 1
+        os.remove(replay_path)
+        self.replayed += count
+        return count
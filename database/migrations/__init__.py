@@ -0,0 +1,76 @@
+"""
+Версионные миграции схемы.
+
+Миграция — модуль mNNNN_<имя>.py в этом пакете с VERSION, DESCRIPTION
+и `async def upgrade(conn)`. Применённые версии записываются в schema_version,
+migrate() применяет недостающие по порядку в одной транзакции.
+
+0001 создаёт схему по текущим моделям (create_all пропускает существующие
+таблицы). Поэтому на новой БД следующие миграции находят свои объекты уже
+созданными и обязаны быть идемпотентными (IF NOT EXISTS, проверки через
+database.migrations.utils); их задача — довести до текущей схемы существующие БД.
+"""
+import importlib
+import logging
+import pkgutil
+from types import ModuleType
+from typing import List
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, select, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+# Ключ pg_advisory_xact_lock: несколько процессов не применяют миграции одновременно
+MIGRATION_LOCK_ID = 7_202_604
+
+schema_version = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String(255), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def load_migrations() -> List[ModuleType]:
+    modules = [
+        importlib.import_module(f"{__name__}.{info.name}")
+        for info in pkgutil.iter_modules(__path__)
+        if info.name.startswith("m") and info.name[1:5].isdigit()
+    ]
+    modules.sort(key=lambda m: m.VERSION)
+    versions = [m.VERSION for m in modules]
+    if len(set(versions)) != len(versions):
+        raise RuntimeError(f"Повторяющиеся версии миграций: {versions}")
+    return modules
+
+
+async def migrate(engine: AsyncEngine) -> List[int]:
+    """
+    Применяет недостающие миграции. Возвращает список применённых версий.
+    """
+    migrations = load_migrations()
+
+    async with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            await conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        await conn.run_sync(schema_version.create, checkfirst=True)
+
+        result = await conn.execute(select(schema_version.c.version))
+        applied = {row.version for row in result}
+
+        done = []
+        for migration in migrations:
+            if migration.VERSION in applied:
+                continue
+            logger.info("Миграция %04d: %s", migration.VERSION, migration.DESCRIPTION)
+            await migration.upgrade(conn)
+            await conn.execute(schema_version.insert().values(
+                version=migration.VERSION,
+                description=migration.DESCRIPTION,
+                applied_at=func.now(),
+            ))
+            done.append(migration.VERSION)
+
+    return done
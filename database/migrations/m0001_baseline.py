@@ -0,0 +1,8 @@
+from database.models import Base
+
+VERSION = 1
+DESCRIPTION = "Схема по моделям"
+
+
+async def upgrade(conn) -> None:
+    await conn.run_sync(Base.metadata.create_all)
@@ -0,0 +1,51 @@
+from sqlalchemy import text
+
+from database.migrations.utils import column_names, has_unique, table_names
+
+VERSION = 2
+DESCRIPTION = "Колонки и ограничения, появившиеся до миграций"
+
+# Прежние таблицы сущностей -> колонки уникального ограничения; с миграции 0006
+# сущности живут в общей таблице items, и на новой БД этих таблиц нет
+ENTITY_UNIQUES = {
+    "tags": ("uq_tags_message_value", ("chat_id", "message_id", "mention")),
+    "hashtags": ("uq_hashtags_message_value", ("chat_id", "message_id", "hashtag")),
+    "documents": ("uq_documents_message_value", ("chat_id", "message_id", "file_id")),
+    "links": ("uq_links_message_value", ("chat_id", "message_id", "url")),
+    "tasks": ("uq_tasks_message", ("chat_id", "message_id")),
+}
+
+
+async def add_column(conn, table: str, column: str, ddl_type: str) -> None:
+    if column not in await column_names(conn, table):
+        await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+
+
+async def upgrade(conn) -> None:
+    await add_column(conn, "chats", "task_keywords", "TEXT")
+    await add_column(conn, "messages", "text_hash", "VARCHAR(40)")
+
+    existing = await table_names(conn)
+    for table, (name, columns) in ENTITY_UNIQUES.items():
+        if table not in existing:
+            continue
+        # Раньше текст сообщения хранился в context каждой сущности. created_at
+        # переносится явно: в сыром SQL нет default модели, а строка без даты
+        # не попадёт ни под срок хранения, ни в дневную секцию
+        legacy_columns = await column_names(conn, table)
+        if "context" in legacy_columns:
+            target, source = "chat_id, message_id, text", "chat_id, message_id, MAX(context)"
+            if "created_at" in legacy_columns:
+                target, source = f"{target}, created_at", f"{source}, MIN(created_at)"
+            await conn.execute(text(
+                f"INSERT INTO messages ({target}) SELECT {source} FROM {table} "
+                f"WHERE context IS NOT NULL GROUP BY chat_id, message_id "
+                f"ON CONFLICT (chat_id, message_id) DO NOTHING"
+            ))
+
+        if not await has_unique(conn, table, columns):
+            cols = ", ".join(columns)
+            await conn.execute(text(
+                f"DELETE FROM {table} WHERE id NOT IN (SELECT MIN(id) FROM {table} GROUP BY {cols})"
+            ))
+            await conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {table} ({cols})"))
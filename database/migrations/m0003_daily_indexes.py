@@ -0,0 +1,25 @@
+from sqlalchemy import text
+
+from database.migrations.m0002_legacy_schema import ENTITY_UNIQUES
+from database.migrations.utils import table_names
+
+VERSION = 3
+DESCRIPTION = "Индексы (chat_id, created_at) и частичные индексы по is_checked = false"
+
+
+async def create_daily_indexes(conn, table: str) -> None:
+    """
+    Индексы прежних таблиц сущностей, как их задавал daily_indexes() в database/models.py.
+    """
+    unchecked = "is_checked = 0" if conn.dialect.name == "sqlite" else "is_checked = false"
+    await conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_chat_created ON {table} (chat_id, created_at)"))
+    await conn.execute(text(
+        f"CREATE INDEX IF NOT EXISTS ix_{table}_unchecked ON {table} (chat_id, created_at) WHERE {unchecked}"
+    ))
+
+
+async def upgrade(conn) -> None:
+    existing = await table_names(conn)
+    for table in ENTITY_UNIQUES:
+        if table in existing:
+            await create_daily_indexes(conn, table)
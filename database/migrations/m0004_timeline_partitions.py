@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+from typing import Optional, Sequence, Tuple
+
+from sqlalchemy import text
+
+from configs.config import PARTITION_PREMAKE_DAYS, RETENTION_DAYS
+from database.migrations.m0002_legacy_schema import ENTITY_UNIQUES
+from database.migrations.m0003_daily_indexes import create_daily_indexes
+from database.migrations.utils import table_names
+from database.models import ChatMessage
+from database.retention import create_partitions, days_between, default_partition_name, is_partitioned
+
+VERSION = 4
+DESCRIPTION = "Индексы по created_at; в Postgres — дневные секции messages и таблиц сущностей"
+
+UNIQUES = {**ENTITY_UNIQUES, "messages": ("uq_messages_chat_message", ("chat_id", "message_id"))}
+
+
+async def partition_table(conn, name: str, unique: Optional[Tuple[str, Sequence[str]]] = None) -> None:
+    """
+    Пересоздаёт таблицу как PARTITION BY RANGE (created_at) и переносит строки.
+    Уникальные ключи в Postgres обязаны включать ключ секционирования, поэтому
+    первичный ключ становится (id, created_at), а уникальные ключи дополняются created_at.
+    Внешний ключ на messages не переносится: строки сообщения и его сущностей
+    живут в секциях одного дня и удаляются вместе. unique — (имя, колонки)
+    уникального ключа, по умолчанию из UNIQUES.
+    """
+    old = f"{name}_unpartitioned"
+    sequence = await conn.scalar(text("SELECT pg_get_serial_sequence(:t, 'id')"), {"t": name})
+
+    await conn.execute(text(f"UPDATE {name} SET created_at = now() WHERE created_at IS NULL"))
+    await conn.execute(text(f"ALTER TABLE {name} RENAME TO {old}"))
+    await conn.execute(text(f"CREATE TABLE {name} (LIKE {old} INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)"))
+    await conn.execute(text(f"ALTER TABLE {name} ALTER COLUMN created_at SET NOT NULL"))
+    if sequence:
+        await conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {name}.id"))
+    await conn.execute(text(f"CREATE TABLE {default_partition_name(name)} PARTITION OF {name} DEFAULT"))
+
+    # Секции под уже накопленные строки в пределах срока хранения и на несколько дней вперёд;
+    # более старые строки лягут в DEFAULT и будут удалены первым проходом RetentionJob
+    today = datetime.now().date()
+    first = await conn.scalar(text(f"SELECT MIN(created_at) FROM {old}"))
+    first = first.date() if first else today
+    if RETENTION_DAYS:
+        first = max(first, today - timedelta(days=RETENTION_DAYS))
+    await create_partitions(conn, name, days_between(first, today + timedelta(days=PARTITION_PREMAKE_DAYS)))
+
+    await conn.execute(text(f"INSERT INTO {name} SELECT * FROM {old}"))
+    # CASCADE снимает внешние ключи других таблиц на старую таблицу (items -> messages на новой БД)
+    await conn.execute(text(f"DROP TABLE {old} CASCADE"))
+
+    unique_name, columns = unique or UNIQUES[name]
+    await conn.execute(text(f"ALTER TABLE {name} ADD PRIMARY KEY (id, created_at)"))
+    await conn.execute(text(
+        f"ALTER TABLE {name} ADD CONSTRAINT {unique_name} UNIQUE ({', '.join(columns)}, created_at)"
+    ))
+
+
+async def create_timeline_index(conn, table: str) -> None:
+    """
+    Индекс по created_at прежних таблиц сущностей (timeline_index() в database/models.py).
+    """
+    using = " USING brin" if conn.dialect.name == "postgresql" else ""
+    await conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_created ON {table}{using} (created_at)"))
+
+
+async def upgrade(conn) -> None:
+    existing = await table_names(conn)
+    for name in (*ENTITY_UNIQUES, "messages"):
+        if name not in existing:
+            continue
+        if conn.dialect.name == "postgresql" and not await is_partitioned(conn, name):
+            await partition_table(conn, name)
+        if name == "messages":
+            for index in ChatMessage.__table__.indexes:
+                await conn.run_sync(index.create, checkfirst=True)
+        else:
+            await create_daily_indexes(conn, name)
+            await create_timeline_index(conn, name)
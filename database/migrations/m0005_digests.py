@@ -0,0 +1,8 @@
+from database.models import Digest
+
+VERSION = 5
+DESCRIPTION = "Таблица digests с готовыми сводками чатов"
+
+
+async def upgrade(conn) -> None:
+    await conn.run_sync(Digest.__table__.create, checkfirst=True)
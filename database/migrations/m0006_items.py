@@ -0,0 +1,63 @@
+from sqlalchemy import text
+from sqlalchemy.schema import CreateTable
+
+from database.migrations.m0004_timeline_partitions import partition_table
+from database.migrations.utils import table_names
+from database.models import Item
+from database.retention import is_partitioned
+
+VERSION = 6
+DESCRIPTION = "Общая таблица items вместо tags, hashtags, documents, links и tasks"
+
+# Прежняя таблица -> (kind, колонка значения)
+LEGACY_TABLES = {
+    "tags": ("mention", "mention"),
+    "hashtags": ("hashtag", "hashtag"),
+    "documents": ("document", "document_name"),
+    "links": ("link", "url"),
+    "tasks": ("task", "task_name"),
+}
+
+ITEMS_UNIQUE = ("uq_items_message_position", ("chat_id", "message_id", "kind", "position"))
+
+
+async def copy_legacy(conn, table: str, kind: str, column: str) -> None:
+    """
+    Переносит строки прежней таблицы в items. position — порядок строк этого вида
+    в сообщении по id; результаты разбора ML (is_checked, is_important, about) сохраняются.
+    """
+    file_id = "file_id" if kind == "document" else "NULL"
+    await conn.execute(text(
+        f"INSERT INTO items (kind, chat_id, message_id, position, content, file_id, "
+        f"is_checked, is_important, about, created_at) "
+        f"SELECT '{kind}', chat_id, message_id, "
+        f"ROW_NUMBER() OVER (PARTITION BY chat_id, message_id ORDER BY id) - 1, {column}, {file_id}, "
+        f"COALESCE(is_checked, :no), COALESCE(is_important, :no), about, COALESCE(created_at, CURRENT_TIMESTAMP) "
+        f"FROM {table}"
+    ), {"no": False})
+
+
+async def upgrade(conn) -> None:
+    postgres = conn.dialect.name == "postgresql"
+    existing = await table_names(conn)
+
+    if "items" not in existing:
+        # В Postgres messages уже секционирована, и внешний ключ на (chat_id, message_id) невозможен
+        if postgres:
+            await conn.execute(CreateTable(Item.__table__, include_foreign_key_constraints=[]))
+        else:
+            await conn.run_sync(Item.__table__.create)
+
+    legacy = [table for table in LEGACY_TABLES if table in existing]
+    for table in legacy:
+        await copy_legacy(conn, table, *LEGACY_TABLES[table])
+        await conn.execute(text(f"DROP TABLE {table}"))
+
+    if postgres and not await is_partitioned(conn, "items"):
+        await partition_table(conn, "items", ITEMS_UNIQUE)
+    for index in Item.__table__.indexes:
+        await conn.run_sync(index.create, checkfirst=True)
+
+    if legacy:
+        # Готовые сводки ссылаются на id прежних таблиц — соберутся заново
+        await conn.execute(text("DELETE FROM digests"))
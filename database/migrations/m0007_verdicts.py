@@ -0,0 +1,8 @@
+from database.models import Verdict
+
+VERSION = 7
+DESCRIPTION = "Таблица verdicts с кэшем ответов LLM"
+
+
+async def upgrade(conn) -> None:
+    await conn.run_sync(Verdict.__table__.create, checkfirst=True)
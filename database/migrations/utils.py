@@ -0,0 +1,25 @@
+from typing import List, Sequence, Set
+
+from sqlalchemy import inspect
+
+
+async def table_names(conn) -> Set[str]:
+    return set(await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_table_names()))
+
+
+async def column_names(conn, table: str) -> Set[str]:
+    columns = await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_columns(table))
+    return {column["name"] for column in columns}
+
+
+async def has_unique(conn, table: str, columns: Sequence[str]) -> bool:
+    """
+    Есть ли на таблице уникальное ограничение или уникальный индекс ровно по этим колонкам.
+    """
+    def check(sync_conn) -> bool:
+        inspector = inspect(sync_conn)
+        sets: List[List[str]] = [c["column_names"] for c in inspector.get_unique_constraints(table)]
+        sets += [i["column_names"] for i in inspector.get_indexes(table) if i.get("unique")]
+        return any(list(s) == list(columns) for s in sets)
+
+    return await conn.run_sync(check)
@@ -6,8 +6,14 @@ from sqlalchemy import (
     BigInteger,
     Text,
     Boolean,
+    Enum,
+    ForeignKeyConstraint,
+    Index,
+    UniqueConstraint,
+    select,
+    text,
 )
-from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.orm import DeclarativeBase, column_property, synonym
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.sql import func
 
@@ -37,64 +43,182 @@ class Chat(Base):
     include_mentions = Column(Boolean, default=True)
     include_hashtags = Column(Boolean, default=True)
 
-class Mention(Base):
-    __tablename__ = 'tags'
-    id = Column(Integer, primary_key=True)
-    chat_id = Column(BigInteger, nullable=False)
-    message_id = Column(BigInteger, nullable=False)
-    mention = Column(String(50), nullable=False)
-    context = Column(Text, nullable=True)
-    is_checked = Column(Boolean, default=False)
-    is_important = Column(Boolean, default=False)
-    about = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=func.now()) 
+    task_keywords = Column(Text, nullable=True)
 
-class Hashtag(Base):
-    __tablename__ = 'hashtags'
+def timeline_index(table: str) -> Index:
+    """
+    Индекс по времени записи для очистки по сроку хранения (database/retention.py).
+    Таблицы только дописываются, поэтому в Postgres хватает компактного BRIN.
+    """
+    return Index(f'ix_{table}_created', 'created_at', postgresql_using='brin')
+
+
+class ChatMessage(Base):
+    """
+    Текст сообщения хранится один раз; сущности ссылаются на него по (chat_id, message_id).
+    """
+    __tablename__ = 'messages'
+    __table_args__ = (
+        UniqueConstraint('chat_id', 'message_id', name='uq_messages_chat_message'),
+        timeline_index('messages'),
+    )
     id = Column(Integer, primary_key=True)
     chat_id = Column(BigInteger, nullable=False)
     message_id = Column(BigInteger, nullable=False)
-    hashtag = Column(String(50), nullable=False)
-    context = Column(Text, nullable=True)
-    is_checked = Column(Boolean, default=False)
-    is_important = Column(Boolean, default=False)
-    about = Column(Text, nullable=True)
+    text = Column(Text, nullable=True)
+    # Хэш текста: правка без изменения текста не перезаписывает сущности
+    text_hash = Column(String(40), nullable=True)
     created_at = Column(DateTime, default=func.now())
 
-class Document(Base):
-    __tablename__ = 'documents'
+
+def message_fk() -> ForeignKeyConstraint:
+    return ForeignKeyConstraint(
+        ['chat_id', 'message_id'],
+        ['messages.chat_id', 'messages.message_id'],
+        ondelete='CASCADE',
+    )
+
+
+def daily_indexes(table: str) -> tuple:
+    """
+    Индексы под выборки «элементы чата за сутки»: все и только непроверенные.
+    kind в конце ключа отсеивает чужие виды по индексу, без чтения строк таблицы.
+    """
+    return (
+        Index(f'ix_{table}_chat_created', 'chat_id', 'created_at', 'kind'),
+        Index(
+            f'ix_{table}_unchecked', 'chat_id', 'created_at', 'kind',
+            postgresql_where=text('is_checked = false'),
+            sqlite_where=text('is_checked = 0'),
+        ),
+    )
+
+
+def message_context(chat_id: Column, message_id: Column):
+    """
+    context сущности — текст её сообщения из таблицы messages.
+    Колонка отложенная: грузится через undefer() или database.crud.attach_context().
+    """
+    return column_property(
+        select(ChatMessage.text)
+        .where(ChatMessage.chat_id == chat_id, ChatMessage.message_id == message_id)
+        .correlate_except(ChatMessage)
+        .scalar_subquery(),
+        deferred=True,
+    )
+
+
+# Виды элементов таблицы items
+ITEM_KINDS = ("task", "mention", "hashtag", "link", "document")
+
+
+class Item(Base):
+    """
+    Все сущности сообщений в одной таблице: вид в kind, значение в content
+    (упоминание, хэштег, URL, имя файла или текст задачи). Выборка «всё за сутки
+    по чату» — один проход по индексу (chat_id, created_at, kind).
+
+    Таблица только дописывается; на месте меняются лишь поля разбора ML
+    (is_checked, is_important, about). position — номер элемента этого вида
+    в сообщении: вместе с (chat_id, message_id, kind) он защищает от повторной
+    записи того же сообщения, а длинный текст задачи в уникальный ключ не попадает.
+
+    Mention, Hashtag, Document, Link и Task — виды элемента (наследование
+    в одной таблице): запросы по ним сами добавляют условие на kind,
+    а прежние имена полей (url, task_name, ...) — синонимы content.
+    """
+    __tablename__ = 'items'
+    __table_args__ = (
+        message_fk(),
+        UniqueConstraint('chat_id', 'message_id', 'kind', 'position', name='uq_items_message_position'),
+        *daily_indexes('items'),
+        timeline_index('items'),
+    )
     id = Column(Integer, primary_key=True)
+    kind = Column(Enum(*ITEM_KINDS, name='item_kind', native_enum=False, length=10), nullable=False)
     chat_id = Column(BigInteger, nullable=False)
     message_id = Column(BigInteger, nullable=False)
-    file_id = Column(String(255), nullable=False)
-    document_name = Column(String(255), nullable=False)
-    context = Column(Text, nullable=True)
+    position = Column(Integer, nullable=False, default=0)
+    content = Column(Text, nullable=False)
+    # Только у документов
+    file_id = Column(String(255), nullable=True)
+    context = message_context(chat_id, message_id)
     is_checked = Column(Boolean, default=False)
     is_important = Column(Boolean, default=False)
     about = Column(Text, nullable=True)
     created_at = Column(DateTime, default=func.now())
 
-class Link(Base):
-    __tablename__ = 'links'
+    __mapper_args__ = {"polymorphic_on": kind, "polymorphic_abstract": True}
+
+
+class Mention(Item):
+    __mapper_args__ = {"polymorphic_identity": "mention"}
+    mention = synonym("content")
+
+class Hashtag(Item):
+    __mapper_args__ = {"polymorphic_identity": "hashtag"}
+    hashtag = synonym("content")
+
+class Document(Item):
+    __mapper_args__ = {"polymorphic_identity": "document"}
+    document_name = synonym("content")
+
+class Link(Item):
+    __mapper_args__ = {"polymorphic_identity": "link"}
+    url = synonym("content")
+
+class Task(Item):
+    # Задача — весь текст сообщения, поэтому на сообщение она одна
+    __mapper_args__ = {"polymorphic_identity": "task"}
+    task_name = synonym("content")
+
+class FsmState(Base):
+    """
+    Состояние FSM aiogram (см. database/fsm.py); ключ собирается из StorageKey.
+    """
+    __tablename__ = 'fsm_states'
+    key = Column(String(255), primary_key=True)
+    state = Column(String(255), nullable=True)
+    data = Column(Text, nullable=True)
+    updated_at = Column(DateTime, nullable=False)
+
+# built_version сводки, которую нужно собрать заново по всем элементам окна
+DIGEST_REBUILD = -1
+
+class Digest(Base):
+    """
+    Готовая сводка чата за окно (см. database/digests.py): важные элементы по
+    категориям в JSON. version растёт, когда в чат приходят новые сущности,
+    built_version — версия, по которой собраны items; совпадают — сводка свежая.
+    DIGEST_REBUILD в built_version — items не годятся как основа, сводка собирается заново.
+    """
+    __tablename__ = 'digests'
+    __table_args__ = (
+        UniqueConstraint('chat_id', 'window_key', name='uq_digests_chat_window'),
+    )
     id = Column(Integer, primary_key=True)
     chat_id = Column(BigInteger, nullable=False)
-    message_id = Column(BigInteger, nullable=False)
-    url = Column(String(500), nullable=False)
-    context = Column(Text, nullable=True)
-    is_checked = Column(Boolean, default=False)
-    is_important = Column(Boolean, default=False)
-    about = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=func.now())
+    window_key = Column(String(16), nullable=False)
+    version = Column(Integer, nullable=False, default=0)
+    built_version = Column(Integer, nullable=False, default=0)
+    items = Column(Text, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
 
-class Task(Base):
-    __tablename__ = 'tasks'
+class Verdict(Base):
+    """
+    Кэш ответов LLM (см. ml/verdicts.py). key — хэш вида элемента, нормализованных
+    содержимого и контекста и версии промпта, поэтому вердикт общий для всех чатов.
+    tokens — оценка токенов, которые стоил разбор элемента.
+    """
+    __tablename__ = 'verdicts'
+    __table_args__ = (
+        UniqueConstraint('key', name='uq_verdicts_key'),
+        timeline_index('verdicts'),
+    )
     id = Column(Integer, primary_key=True)
-    chat_id = Column(BigInteger, nullable=False)
-    message_id = Column(BigInteger, nullable=False)
-    task_name = Column(Text, nullable=False)
-    context = Column(Text, nullable=True)
-    is_checked = Column(Boolean, default=False)
-    is_important = Column(Boolean, default=False)
+    key = Column(String(64), nullable=False)
+    item_type = Column(String(10), nullable=False)
+    is_important = Column(Boolean, nullable=False)
     about = Column(Text, nullable=True)
+    tokens = Column(Integer, nullable=False, default=0)
     created_at = Column(DateTime, default=func.now())
-
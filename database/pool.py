@@ -0,0 +1,58 @@
+import time
+from typing import Any, Dict
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Пул соединений, который считает время получения соединения: ожидание
+    свободного соединения плюс установка нового, если пул растёт.
+    Рост waits_seconds_total при checked_out, упёршемся в size + max_overflow,
+    значит, что пул мал для нагрузки.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waits = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.waits += 1
+            self.wait_seconds_total += elapsed
+            self.wait_seconds_max = max(self.wait_seconds_max, elapsed)
+
+
+def pool_stats(pool: Pool) -> Dict[str, Any]:
+    """
+    Состояние пула для метрик. У пулов без очереди (NullPool, StaticPool) — пустой словарь.
+    """
+    if not hasattr(pool, "checkedout"):
+        return {}
+    stats = {
+        "size": pool.size(),
+        "max_overflow": pool._max_overflow,
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        # overflow() отрицателен, пока пул не открыл все pool_size соединений
+        "overflow": max(0, pool.overflow()),
+    }
+    if isinstance(pool, TimedQueuePool):
+        stats.update(
+            waits=pool.waits,
+            wait_seconds_total=pool.wait_seconds_total,
+            wait_seconds_max=pool.wait_seconds_max,
+            timeouts=pool.timeouts,
+        )
+    return stats
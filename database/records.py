@@ -0,0 +1,89 @@
+"""
+Лёгкие записи сущностей для показа и ML.
+
+Хендлерам и ML нужны id, message_id, флаги разбора, about и одна колонка
+содержимого. Объект ORM на строку несёт InstanceState, __dict__ и учёт
+в identity map; запись с __slots__ хранит только значения колонок из
+проекции запроса (select_records) и в разы меньше по памяти и времени
+сборки (python -m benchmarks.bench_records).
+
+Записи изменяемые: конвейер ML проставляет is_checked, is_important и about,
+attach_context — context. В БД изменения пишутся по id через
+database.crud.save_analysis_results.
+"""
+from typing import Any, Dict, Iterable, Type
+
+from sqlalchemy import Select, select
+
+from database.models import Document, Hashtag, Link, Mention, Task
+
+# Общие колонки всех категорий, в порядке проекции запроса
+ITEM_FIELDS = ("id", "chat_id", "message_id", "is_checked", "is_important", "about", "created_at")
+
+
+class ItemRecord:
+    """
+    Строка сущности. fields — колонки проекции в порядке значений конструктора;
+    context (текст сообщения) в проекцию не входит и подгружается отдельно.
+    """
+    __slots__ = ITEM_FIELDS + ("context",)
+    fields = ITEM_FIELDS
+
+    def __init__(self, *values: Any):
+        for name, value in zip(self.fields, values):
+            setattr(self, name, value)
+        self.context = None
+
+    @classmethod
+    def from_dict(cls, values: Dict[str, Any]) -> "ItemRecord":
+        return cls(*(values.get(name) for name in cls.fields))
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(id={self.id}, message_id={self.message_id})"
+
+
+class TaskRecord(ItemRecord):
+    __slots__ = ("task_name",)
+    fields = ITEM_FIELDS + __slots__
+
+
+class MentionRecord(ItemRecord):
+    __slots__ = ("mention",)
+    fields = ITEM_FIELDS + __slots__
+
+
+class HashtagRecord(ItemRecord):
+    __slots__ = ("hashtag",)
+    fields = ITEM_FIELDS + __slots__
+
+
+class LinkRecord(ItemRecord):
+    __slots__ = ("url",)
+    fields = ITEM_FIELDS + __slots__
+
+
+class DocumentRecord(ItemRecord):
+    __slots__ = ("document_name", "file_id")
+    fields = ITEM_FIELDS + __slots__
+
+
+# Модель -> класс записи
+RECORDS: Dict[Type, Type[ItemRecord]] = {
+    Task: TaskRecord,
+    Mention: MentionRecord,
+    Hashtag: HashtagRecord,
+    Link: LinkRecord,
+    Document: DocumentRecord,
+}
+
+
+def select_records(model) -> Select:
+    """
+    SELECT только колонок записи модели; условия и сортировка добавляются как обычно.
+    """
+    return select(*(getattr(model, name) for name in RECORDS[model].fields))
+
+
+def build_records(model, rows: Iterable[Any]) -> list:
+    record = RECORDS[model]
+    return [record(*row) for row in rows]
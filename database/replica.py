@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Отставание реплики Postgres в секундах; 0, если она догнала полученный WAL или это не реплика
+PG_REPLICA_LAG = text(
+    "SELECT CASE "
+    "WHEN NOT pg_is_in_recovery() THEN 0 "
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+async def replica_lag(session) -> float:
+    """
+    Отставание реплики. У других СУБД (SQLite в локальных тестах) его нет — 0.
+    """
+    if session.get_bind().dialect.name != "postgresql":
+        return 0.0
+    return float(await session.scalar(PG_REPLICA_LAG))
+
+
+class ReplicaRouter:
+    """
+    Решает, можно ли читать с реплики. Отставание меряется не чаще раза
+    в `check_interval` секунд; если оно больше `max_lag` или реплика не ответила,
+    чтения уходят в основную БД до следующей проверки.
+    """
+
+    def __init__(self, session_pool, max_lag: float = 5, check_interval: float = 1, lag_probe=replica_lag):
+        self.session_pool = session_pool
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.lag_probe = lag_probe
+        self._lock = asyncio.Lock()
+        self._checked_at: Optional[float] = None
+
+        self.lag: Optional[float] = None
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self.probe_errors = 0
+
+    async def _check(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            if self._checked_at is not None and now - self._checked_at < self.check_interval:
+                return
+            try:
+                async with self.session_pool() as session:
+                    self.lag = await self.lag_probe(session)
+            except Exception as e:
+                self.probe_errors += 1
+                self.lag = None
+                logger.warning("Реплика недоступна, чтения идут в основную БД: %s", e)
+            self._checked_at = time.monotonic()
+
+    async def available(self) -> bool:
+        await self._check()
+        usable = self.lag is not None and self.lag <= self.max_lag
+        if usable:
+            self.replica_reads += 1
+        else:
+            self.primary_reads += 1
+        return usable
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "lag_seconds": self.lag if self.lag is not None else -1,
+            "replica_reads": self.replica_reads,
+            "primary_reads": self.primary_reads,
+            "probe_errors": self.probe_errors,
+        }
@@ -0,0 +1,241 @@
+import asyncio
+import logging
+import re
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Optional, Set
+
+from sqlalchemy import Table, delete, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from database.models import ChatMessage, Item, Verdict
+
+logger = logging.getLogger(__name__)
+
+# Таблицы с временной шкалой по created_at; элементы идут раньше сообщений.
+# Вердикты LLM тоже живут срок хранения, после чего элемент разбирается заново
+TIMELINE_TABLES = (
+    Item.__table__,
+    ChatMessage.__table__,
+    Verdict.__table__,
+)
+
+# Ключ pg_try_advisory_xact_lock: таблицу обслуживает один процесс за раз
+RETENTION_LOCK_ID = 7_202_605
+
+# Сводка читает последние сутки, поэтому срок короче двух дней не допускается
+MIN_RETENTION_DAYS = 2
+
+
+def partition_name(table: str, day: date) -> str:
+    return f"{table}_p{day:%Y%m%d}"
+
+
+def default_partition_name(table: str) -> str:
+    return f"{table}_default"
+
+
+def partition_day(table: str, name: str) -> Optional[date]:
+    match = re.fullmatch(rf"{table}_p(\d{{8}})", name)
+    return datetime.strptime(match.group(1), "%Y%m%d").date() if match else None
+
+
+def days_between(first: date, last: date) -> Iterable[date]:
+    return (first + timedelta(days=i) for i in range((last - first).days + 1))
+
+
+async def is_partitioned(conn, table: str) -> bool:
+    result = await conn.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:t)"), {"t": table})
+    return result.scalar() == "p"
+
+
+async def list_partitions(conn, table: str) -> Set[str]:
+    result = await conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:t)"
+    ), {"t": table})
+    return set(result.scalars())
+
+
+async def create_partitions(conn, table: str, days: Iterable[date]) -> int:
+    """
+    Создаёт недостающие дневные секции. Секция, под которую в DEFAULT уже
+    попали строки, не создаётся (Postgres откажет) — строки дочистит prune.
+    Возвращает число созданных секций.
+    """
+    existing = await list_partitions(conn, table)
+    created = 0
+    for day in days:
+        name = partition_name(table, day)
+        if name in existing:
+            continue
+        try:
+            async with conn.begin_nested():
+                await conn.execute(text(
+                    f"CREATE TABLE {name} PARTITION OF {table} "
+                    f"FOR VALUES FROM ('{day}') TO ('{day + timedelta(days=1)}')"
+                ))
+            created += 1
+        except DBAPIError as e:
+            logger.warning("Секция %s не создана: %s", name, e.orig)
+    return created
+
+
+async def drop_partitions(conn, table: str, cutoff: datetime) -> int:
+    """
+    Удаляет секции, целиком лежащие раньше cutoff. Возвращает число удалённых секций.
+    DROP берёт ACCESS EXCLUSIVE на родительскую таблицу; секция, на которой он упёрся
+    в lock_timeout (его ставит RetentionJob), пропускается до следующего прохода.
+    """
+    dropped = 0
+    for name in sorted(await list_partitions(conn, table)):
+        day = partition_day(table, name)
+        if day is not None and datetime.combine(day + timedelta(days=1), datetime.min.time()) <= cutoff:
+            try:
+                async with conn.begin_nested():
+                    await conn.execute(text(f"DROP TABLE {name}"))
+            except DBAPIError as e:
+                logger.warning("Секция %s не удалена: %s", name, e.orig)
+                continue
+            dropped += 1
+    return dropped
+
+
+async def delete_expired(engine: AsyncEngine, table: Table, cutoff: datetime, batch_size: int) -> int:
+    """
+    Построчное удаление пачками, каждая в своей транзакции, — для SQLite
+    и несекционированных таблиц. Возвращает число удалённых строк.
+    """
+    deleted = 0
+    while True:
+        async with engine.begin() as conn:
+            ids = select(table.c.id).where(table.c.created_at < cutoff).limit(batch_size)
+            result = await conn.execute(delete(table).where(table.c.id.in_(ids.scalar_subquery())))
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            return deleted
+
+
+class RetentionJob:
+    """
+    Срок хранения сообщений и сущностей. Бот читает только последние сутки,
+    поэтому старые строки лишь раздувают таблицы и индексы.
+
+    В Postgres таблицы секционированы по дням created_at (миграция 0004):
+    задача заранее создаёт секции на `premake_days` вперёд и удаляет секции
+    старше `retention_days` целиком (DROP TABLE вместо построчного DELETE).
+    Построчно чистится только DEFAULT-секция. В SQLite и в несекционированных
+    таблицах строки удаляются пачками по `batch_size` по индексу created_at.
+
+    retention_days = 0 отключает удаление, но секции на будущее создаются всё равно.
+
+    Создание и удаление секций блокируют родительскую таблицу целиком. Чтобы
+    не ждать долгие чтения (и не выстраивать за собой очередь вставок), они
+    идут с lock_timeout = `lock_timeout_ms`; не успевшие секции — в следующий проход.
+    """
+
+    def __init__(
+            self,
+            engine: AsyncEngine,
+            retention_days: int = 30,
+            interval: float = 3600,
+            premake_days: int = 3,
+            batch_size: int = 5000,
+            lock_timeout_ms: int = 2000,
+    ):
+        if 0 < retention_days < MIN_RETENTION_DAYS:
+            raise ValueError(f"Срок хранения меньше {MIN_RETENTION_DAYS} дней: {retention_days}")
+
+        self.engine = engine
+        self.retention_days = retention_days
+        self.interval = interval
+        self.premake_days = premake_days
+        self.batch_size = batch_size
+        self.lock_timeout_ms = lock_timeout_ms
+        self._task: Optional[asyncio.Task] = None
+
+        self.runs = 0
+        self.partitions_created = 0
+        self.partitions_dropped = 0
+        self.rows_deleted = 0
+
+    def cutoff(self, now: datetime) -> Optional[datetime]:
+        if not self.retention_days:
+            return None
+        return now - timedelta(days=self.retention_days)
+
+    async def start(self, shard_index: Optional[int] = None) -> None:
+        """
+        В шардированном режиме очистку ведёт только воркер 0: остальным нечего
+        делать, кроме как ждать advisory lock.
+        """
+        if shard_index:
+            return
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Ошибка очистки по сроку хранения")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        Один проход по всем таблицам. Возвращает счётчики этого прохода.
+        """
+        now = now or datetime.now()
+        cutoff = self.cutoff(now)
+        stats = {"partitions_created": 0, "partitions_dropped": 0, "rows_deleted": 0}
+
+        for table in TIMELINE_TABLES:
+            if self.engine.dialect.name == "postgresql":
+                async with self.engine.begin() as conn:
+                    locked = await conn.scalar(text("SELECT pg_try_advisory_xact_lock(:id)"), {"id": RETENTION_LOCK_ID})
+                    if not locked:
+                        continue
+                    if await is_partitioned(conn, table.name):
+                        await self._prune_partitions(conn, table.name, now, cutoff, stats)
+                        continue
+
+            if cutoff is not None:
+                stats["rows_deleted"] += await delete_expired(self.engine, table, cutoff, self.batch_size)
+
+        self.runs += 1
+        self.partitions_created += stats["partitions_created"]
+        self.partitions_dropped += stats["partitions_dropped"]
+        self.rows_deleted += stats["rows_deleted"]
+        if any(stats.values()):
+            logger.info("Очистка по сроку хранения: %s", stats)
+        return stats
+
+    async def _prune_partitions(self, conn, table: str, now: datetime, cutoff: Optional[datetime], stats) -> None:
+        today = now.date()
+        if self.lock_timeout_ms:
+            await conn.execute(text(f"SET LOCAL lock_timeout = {int(self.lock_timeout_ms)}"))
+        stats["partitions_created"] += await create_partitions(
+            conn, table, days_between(today, today + timedelta(days=self.premake_days)),
+        )
+        if cutoff is None:
+            return
+        stats["partitions_dropped"] += await drop_partitions(conn, table, cutoff)
+        result = await conn.execute(
+            text(f"DELETE FROM {default_partition_name(table)} WHERE created_at < :cutoff"), {"cutoff": cutoff}
+        )
+        stats["rows_deleted"] += result.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "runs": self.runs,
+            "partitions_created": self.partitions_created,
+            "partitions_dropped": self.partitions_dropped,
+            "rows_deleted": self.rows_deleted,
+        }
@@ -1,10 +1,171 @@
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from configs.config import DB_URL
+import asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Optional
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession, AsyncConnection, AsyncEngine
+from configs.config import (
+    DB_URL,
+    DB_ECHO,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+    DB_STATEMENT_CACHE_SIZE,
+    DB_REPLICA_URL,
+    DB_REPLICA_MAX_LAG,
+    DB_REPLICA_LAG_CHECK_INTERVAL,
+)
+from database.pool import TimedQueuePool
+from database.replica import ReplicaRouter
+
+
+def build_engine(url: str) -> AsyncEngine:
+    connect_args = {}
+    if url.startswith("postgresql+asyncpg"):
+        connect_args["prepared_statement_cache_size"] = DB_STATEMENT_CACHE_SIZE
+    return create_async_engine(
+        url,
+        echo=DB_ECHO,
+        poolclass=TimedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
 
-engine = create_async_engine(DB_URL, echo=True)
+
+engine = build_engine(DB_URL)
 
 async_session = async_sessionmaker(
-    engine, 
-    class_=AsyncSession, 
+    engine,
+    class_=AsyncSession,
     expire_on_commit=False
 )
+
+# Реплика только для чтения (см. read_session_scope); None, если DB_REPLICA_URL не задан
+replica_engine: Optional[AsyncEngine] = build_engine(DB_REPLICA_URL) if DB_REPLICA_URL else None
+
+replica: Optional[ReplicaRouter] = None
+if replica_engine is not None:
+    replica = ReplicaRouter(
+        async_sessionmaker(replica_engine, class_=AsyncSession, expire_on_commit=False),
+        max_lag=DB_REPLICA_MAX_LAG,
+        check_interval=DB_REPLICA_LAG_CHECK_INTERVAL,
+    )
+
+
+class LazySession:
+    """
+    Сессия на время обработки одного апдейта.
+    Соединение из пула берётся при первом обращении к БД и держится до конца
+    апдейта, поэтому несколько crud-хелперов с commit() внутри делят один
+    checkout. Апдейты, которым БД не понадобилась, пул не трогают.
+    Транзакция заканчивается на выходе из session_scope, а перед долгими
+    ожиданиями (запросы к LLM) соединение возвращается в пул — release_session().
+    """
+
+    def __init__(self, session_pool):
+        self._session_pool = session_pool
+        self._connection: Optional[AsyncConnection] = None
+        self._session: Optional[AsyncSession] = None
+        # AsyncSession нельзя использовать из нескольких задач одновременно
+        self.lock = asyncio.Lock()
+
+    @property
+    def started(self) -> bool:
+        return self._session is not None
+
+    async def get(self) -> AsyncSession:
+        if self._session is None:
+            self._connection = await self._session_pool.kw["bind"].connect()
+            self._session = self._session_pool(bind=self._connection)
+        return self._session
+
+    async def execute(self, *args, **kwargs):
+        session = await self.get()
+        return await session.execute(*args, **kwargs)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            await self._connection.close()
+            self._session = None
+            self._connection = None
+
+
+current_session: ContextVar[Optional[LazySession]] = ContextVar("current_session", default=None)
+
+
+@asynccontextmanager
+async def session_scope() -> AsyncIterator[AsyncSession]:
+    """
+    Сессия для crud-хелперов: сессия текущего апдейта (см. DbSessionMiddleware),
+    а вне апдейта — новая. Внутри scope не открывать вложенный session_scope.
+    """
+    session = current_session.get()
+    if session is None:
+        async with async_session() as new_session:
+            yield new_session
+        return
+
+    async with session.lock:
+        db = await session.get()
+        try:
+            yield db
+        except BaseException:
+            await db.rollback()
+            raise
+        # Чтения тоже закрывают транзакцию: соединение апдейта не висит idle in transaction.
+        # commit, а не rollback: rollback пометил бы устаревшими уже возвращённые объекты
+        if db.in_transaction():
+            await db.commit()
+
+
+async def release_session() -> None:
+    """
+    Возвращает соединение текущего апдейта в пул перед долгим ожиданием (запрос к LLM).
+    Следующий session_scope возьмёт соединение заново.
+    """
+    session = current_session.get()
+    if session is not None:
+        async with session.lock:
+            await session.close()
+
+
+@asynccontextmanager
+async def read_session_scope() -> AsyncIterator[AsyncSession]:
+    """
+    Сессия для тяжёлых чтений (сводка, списки сущностей): отдельная сессия
+    на реплике, если она настроена и не отстаёт, иначе — session_scope().
+    Объекты с реплики после выхода из scope отсоединены: отложенные колонки
+    (context) подгружаются через database.crud.attach_context().
+    Писать через эту сессию нельзя.
+    """
+    if replica is not None and await replica.available():
+        async with replica.session_pool() as session:
+            yield session
+        return
+
+    async with session_scope() as session:
+        yield session
+
+
+@asynccontextmanager
+async def stream_session_scope() -> AsyncIterator[AsyncSession]:
+    """
+    Сессия для потокового чтения (database.crud.stream_records): реплика, если она
+    доступна, иначе отдельная сессия основной БД — не сессия апдейта. Курсор открыт,
+    пока пачки разбираются ML и сохраняются через session_scope(), и общая сессия
+    апдейта на это время была бы занята. Соединение держится до конца чтения.
+    """
+    if replica is not None and await replica.available():
+        async with replica.session_pool() as session:
+            yield session
+        return
+
+    async with async_session() as session:
+        yield session
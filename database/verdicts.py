@@ -0,0 +1,35 @@
+"""
+Вердикты LLM по элементам (таблица verdicts), общие для всех чатов.
+Ключи и кэш в памяти — в ml/verdicts.py.
+"""
+from typing import Any, Dict, Iterable, List
+
+from sqlalchemy import select
+
+from database.ingest import MAX_STATEMENT_PARAMS, build_insert
+from database.models import Verdict
+from database.session import session_scope
+
+
+async def load_verdicts(keys: List[str]) -> Dict[str, Any]:
+    async with session_scope() as session:
+        result = await session.execute(
+            select(Verdict.key, Verdict.is_important, Verdict.about, Verdict.tokens).where(Verdict.key.in_(keys))
+        )
+        return {row.key: row for row in result}
+
+
+async def save_verdicts(rows: Iterable[dict]) -> None:
+    """
+    Дописывает вердикты; ключ, уже записанный другим процессом, пропускается.
+    Большая пачка делится на INSERT по MAX_STATEMENT_PARAMS параметров, как в database/ingest.py.
+    """
+    rows = list(rows)
+    if not rows:
+        return
+    async with session_scope() as session:
+        stmt = build_insert(session.get_bind().dialect.name, Verdict.__table__)
+        step = max(1, MAX_STATEMENT_PARAMS // len(rows[0]))
+        for start in range(0, len(rows), step):
+            await session.execute(stmt.values(rows[start:start + step]))
+        await session.commit()
@@ -1,11 +1,31 @@
 import asyncio
 import logging
 
-from aiogram import Bot, Dispatcher, BaseMiddleware
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram import Bot, Dispatcher
 from aiogram.client.bot import DefaultBotProperties
 
-from configs.config import BOT_TOKEN
+from configs.config import (
+    BOT_TOKEN,
+    BOT_MODE,
+    MAX_CONCURRENT_UPDATES,
+    SHARD_WORKERS,
+    SHARD_QUEUE_SIZE,
+    FSM_STATE_TTL,
+    FSM_CACHE_TTL,
+    FSM_EMPTY_CACHE_TTL,
+    INGEST_WORKERS,
+    INGEST_BATCH_SIZE,
+    INGEST_FLUSH_INTERVAL_MS,
+    INGEST_QUEUE_SIZE,
+    INGEST_OVERFLOW,
+    INGEST_SPILL_PATH,
+    RETENTION_DAYS,
+    RETENTION_INTERVAL,
+    PARTITION_PREMAKE_DAYS,
+    RETENTION_LOCK_TIMEOUT_MS,
+    METRICS_PORT,
+    WEB_SERVER_HOST,
+)
 
 from src.entry.handlers import router as entry_router
 from src.tasks.handlers import router as tasks_router
@@ -18,31 +38,65 @@ from src.settings.handlers import router as settings_router
 from src.summary.handlers import router as summary_router
 
 from database import init_db
-from database.session import async_session
-
-from middlewares.middleware import CollectorMiddleware
-
-class DbSessionMiddleware(BaseMiddleware):
-    def __init__(self, session_pool):
-        super().__init__()
-        self.session_pool = session_pool
-
-    async def __call__(self, handler, event, data):
-        async with self.session_pool() as session:
-            data["session"] = session
-            return await handler(event, data)
-
-async def main() -> None:
-    await init_db()
-
-    logging.basicConfig(level=logging.INFO)
-    
-    bot = Bot(
-        token=BOT_TOKEN,
-        default=DefaultBotProperties(parse_mode="HTML")
+from database.session import async_session, engine, replica, replica_engine
+from database.ingest import IngestPool
+from database.retention import RetentionJob
+from database.cache import chat_cache
+from database.pool import pool_stats
+from database.fsm import SqlStorage
+from ml.limiter import llm_limiter
+from ml.verdicts import verdict_cache
+
+from middlewares.middleware import (
+    CollectorMiddleware, ConcurrencyLimitMiddleware, DbSessionMiddleware, LlmLaneMiddleware,
+)
+from utils.webhook import run_webhook
+from utils.sharding import run_supervisor
+from utils.metrics import MetricsServer, registry
+
+def build_dispatcher() -> Dispatcher:
+    """
+    Диспетчер со всеми роутерами и middleware; общий для поллинга и вебхука.
+    """
+    dp = Dispatcher(storage=SqlStorage(
+        state_ttl=FSM_STATE_TTL, cache_ttl=FSM_CACHE_TTL, empty_cache_ttl=FSM_EMPTY_CACHE_TTL,
+    ))
+
+    ingest = IngestPool(
+        async_session,
+        workers=INGEST_WORKERS,
+        batch_size=INGEST_BATCH_SIZE,
+        flush_interval_ms=INGEST_FLUSH_INTERVAL_MS,
+        max_queue_size=INGEST_QUEUE_SIZE,
+        overflow=INGEST_OVERFLOW,
+        spill_path=INGEST_SPILL_PATH,
     )
-
-    dp = Dispatcher(storage=MemoryStorage())
+    dp.startup.register(ingest.start)
+    dp.shutdown.register(ingest.stop)
+
+    retention = RetentionJob(
+        engine,
+        retention_days=RETENTION_DAYS,
+        interval=RETENTION_INTERVAL,
+        premake_days=PARTITION_PREMAKE_DAYS,
+        lock_timeout_ms=RETENTION_LOCK_TIMEOUT_MS,
+    )
+    dp.startup.register(retention.start)
+    dp.shutdown.register(retention.stop)
+
+    registry.register("db_pool", lambda: pool_stats(engine.pool))
+    registry.register("ingest", ingest.stats)
+    registry.register("chat_cache", chat_cache.stats)
+    registry.register("verdict_cache", verdict_cache.stats)
+    registry.register("llm_limiter", llm_limiter.stats)
+    registry.register("retention", retention.stats)
+    if replica is not None:
+        registry.register("db_replica_pool", lambda: pool_stats(replica_engine.pool))
+        registry.register("db_replica", replica.stats)
+    if METRICS_PORT and BOT_MODE != "webhook":
+        metrics_server = MetricsServer(WEB_SERVER_HOST, METRICS_PORT)
+        dp.startup.register(metrics_server.start)
+        dp.shutdown.register(metrics_server.stop)
 
     dp.include_router(entry_router)
     dp.include_router(tasks_router)
@@ -54,16 +108,60 @@ async def main() -> None:
     dp.include_router(summary_router)
 
     dp.message.outer_middleware(DbSessionMiddleware(async_session))
-    dp.message.outer_middleware(CollectorMiddleware())
+    dp.message.outer_middleware(CollectorMiddleware(ingest))
+    dp.message.outer_middleware(LlmLaneMiddleware())
 
     dp.edited_message.outer_middleware(DbSessionMiddleware(async_session))
-    dp.edited_message.outer_middleware(CollectorMiddleware())
+    dp.edited_message.outer_middleware(CollectorMiddleware(ingest))
+
+    dp.callback_query.outer_middleware(DbSessionMiddleware(async_session))
+    dp.callback_query.outer_middleware(LlmLaneMiddleware())
+
+    # Лимит ставится перед FSM-middleware aiogram: чтение состояния тоже берёт соединение из пула
+    dp.update.outer_middleware.unregister(dp.fsm)
+    dp.update.outer_middleware(ConcurrencyLimitMiddleware(MAX_CONCURRENT_UPDATES))
+    dp.update.outer_middleware(dp.fsm)
 
     dp.include_router(catch_router)
 
+    return dp
+
+def build_bot() -> Bot:
+    return Bot(
+        token=BOT_TOKEN,
+        default=DefaultBotProperties(parse_mode="HTML")
+    )
+
+def build_shard():
+    """
+    Фабрика процесса-воркера для BOT_MODE=sharded.
+    """
+    return build_bot(), build_dispatcher()
+
+async def main() -> None:
+    await init_db()
+
+    logging.basicConfig(level=logging.INFO)
+    
+    bot = build_bot()
+
+    dp = build_dispatcher()
+
+    # На edited_message висит только CollectorMiddleware, хендлеров нет,
+    # поэтому resolve_used_update_types() правки не запрашивает
+    allowed_updates = sorted(set(dp.resolve_used_update_types()) | {"edited_message"})
+
+    if BOT_MODE == "webhook":
+        await run_webhook(dp, bot, allowed_updates)
+        return
+
+    if BOT_MODE == "sharded":
+        await run_supervisor(bot, build_shard, SHARD_WORKERS, allowed_updates, queue_size=SHARD_QUEUE_SIZE)
+        return
+
     await bot.delete_webhook(drop_pending_updates=True)
 
-    await dp.start_polling(bot)
+    await dp.start_polling(bot, allowed_updates=allowed_updates)
 
 if __name__ == "__main__":
     try:
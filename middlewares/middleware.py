@@ -1,88 +1,153 @@
-from typing import Callable, Dict, Any, Awaitable
+import asyncio
+from typing import Callable, Dict, Any, Awaitable, Iterable, Optional, Tuple
 from aiogram import BaseMiddleware
 from aiogram.types import Message
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
-from database.models import Mention, Hashtag, Document, Link, Task, Chat
+from database.cache import ChatStateCache, chat_cache
+from database.ingest import IngestPool, IngestRecord
+from database.session import LazySession, current_session
+from ml.detector import MIN_TASK_LENGTH
+from ml.limiter import llm_lane
+
+class DbSessionMiddleware(BaseMiddleware):
+    """
+    Кладёт в data["session"] ленивую сессию на время апдейта и делает её
+    текущей для crud-хелперов (database.session.session_scope).
+    Соединение из пула берётся, только если кто-то действительно пошёл в БД.
+    """
+    def __init__(self, session_pool):
+        super().__init__()
+        self.session_pool = session_pool
+
+    async def __call__(self, handler, event, data):
+        session = LazySession(self.session_pool)
+        token = current_session.set(session)
+        data["session"] = session
+        try:
+            return await handler(event, data)
+        finally:
+            current_session.reset(token)
+            await session.close()
+
+class LlmLaneMiddleware(BaseMiddleware):
+    """
+    Запросы к LLM из хендлеров апдейта идут в полосе lane (ml.limiter):
+    команды пользователя обгоняют сводки по расписанию и фоновый разбор.
+    """
+    def __init__(self, lane: str = "interactive"):
+        super().__init__()
+        self.lane = lane
+
+    async def __call__(self, handler, event, data):
+        with llm_lane(self.lane):
+            return await handler(event, data)
+
+class ConcurrencyLimitMiddleware(BaseMiddleware):
+    """
+    Ограничивает число апдейтов, которые процесс обрабатывает одновременно.
+    aiogram запускает каждый апдейт отдельной задачей (и при поллинге, и в
+    вебхуке), поэтому без лимита всплеск апдейтов разбирает весь пул БД.
+    """
+    def __init__(self, limit: int):
+        super().__init__()
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit)
+        self.in_flight = 0
+
+    async def __call__(self, handler, event, data):
+        async with self.semaphore:
+            self.in_flight += 1
+            try:
+                return await handler(event, data)
+            finally:
+                self.in_flight -= 1
+
+def split_entities(entities: Iterable[Tuple[str, str, Optional[str]]]) -> Tuple[tuple, tuple, tuple]:
+    """
+    Раскладывает сущности текста (тип по Bot API, текст сущности, url у text_link)
+    на хэштеги, ссылки и упоминания. Общая для апдейтов и импорта истории (utils/backfill.py).
+    """
+    hashtags, links, mentions = [], [], []
+    for entity_type, entity_value, url in entities:
+        if entity_type == "hashtag":
+            hashtags.append(entity_value)
+
+        elif entity_type in ["url", "text_link"]:
+            links.append(url if entity_type == "text_link" else entity_value)
+
+        elif entity_type in ["mention", "text_mention"]:
+            mentions.append(entity_value)
+
+    return tuple(hashtags), tuple(links), tuple(mentions)
+
+def worth_ingesting(record: IngestRecord) -> bool:
+    """
+    Сообщение без сущностей и короче MIN_TASK_LENGTH задачей не станет — писать нечего.
+    """
+    has_entities = record.document or record.hashtags or record.links or record.mentions
+    return bool(has_entities) or len(record.text) >= MIN_TASK_LENGTH
+
+def build_record(event: Message, text: str) -> IngestRecord:
+    """
+    Достаёт из сообщения документ, хэштеги, ссылки и упоминания. В БД не ходит.
+    """
+    document = None
+    if event.document:
+        document = (event.document.file_id, event.document.file_name or "Без названия")
+
+    entities = event.entities or event.caption_entities or []
+    hashtags, links, mentions = split_entities(
+        (entity.type, entity.extract_from(text), entity.url if entity.type == "text_link" else None)
+        for entity in entities
+    )
+
+    return IngestRecord(
+        chat_id=event.chat.id,
+        message_id=event.message_id,
+        text=text,
+        document=document,
+        hashtags=hashtags,
+        links=links,
+        mentions=mentions,
+        edited=event.edit_date is not None,
+        # В БД время без зоны, в локальном времени (как datetime.now() в выборках)
+        date=event.date.astimezone().replace(tzinfo=None) if event.date else None,
+    )
 
 class CollectorMiddleware(BaseMiddleware):
+    """
+    Собирает сущности из сообщений и отдаёт их в IngestPool.
+    Активность чата и поиск задач выполняют воркеры пула, поэтому обработка
+    апдейта не ждёт ни БД, ни записи. Сообщения из чатов, которые уже
+    известны как неактивные, в очередь не попадают; правки остальных — всегда, даже без сущностей.
+    """
+    def __init__(self, ingest: IngestPool, cache: ChatStateCache = chat_cache):
+        super().__init__()
+        self.ingest = ingest
+        self.cache = cache
+
     async def __call__(
         self,
         handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
         event: Message,
         data: Dict[str, Any]
     ) -> Any:
-        if not isinstance(event, Message) or "session" not in data:
+        if not isinstance(event, Message):
             return await handler(event, data)
 
-        session: AsyncSession = data["session"]
         text = event.text or event.caption or ""
-        chat_id = event.chat.id
-        message_id = event.message_id
+        edited = event.edit_date is not None
 
-        if text.startswith("/"):
+        if text.startswith("/") and not edited:
             return await handler(event, data)
 
-        res = await session.execute(select(Chat).where(Chat.chat_id == chat_id))
-        chat_entry = res.scalar_one_or_none()
-        
-        if not chat_entry or not chat_entry.is_active:
+        state = self.cache.peek(event.chat.id)
+        if state is not None and not state.is_active:
             return await handler(event, data)
 
-        if event.document:
-            new_doc = Document(
-                chat_id=chat_id,
-                message_id=message_id,
-                document_name=event.document.file_name or "Без названия",
-                file_id=event.document.file_id,
-                context=text
-            )
-            session.add(new_doc)
-
-        if event.entities or event.caption_entities:
-            entities = event.entities or event.caption_entities
-            for entity in entities:
-                entity_value = entity.extract_from(text)
-
-                if entity.type == "hashtag":
-                    session.add(Hashtag(
-                        chat_id=chat_id,
-                        message_id=message_id,
-                        hashtag=entity_value,
-                        context=text
-                    ))
-
-                elif entity.type in ["url", "text_link"]:
-                    url = entity.url if entity.type == "text_link" else entity_value
-                    session.add(Link(
-                        chat_id=chat_id,
-                        message_id=message_id,
-                        url=url,
-                        context=text
-                    ))
-                
-                elif entity.type in ["mention", "text_mention"]:
-                     session.add(Mention(
-                        chat_id=chat_id,
-                        message_id=message_id,
-                        mention=entity_value,
-                        context=text
-                    ))
-
-        keywords = ["надо", "сделать", "дедлайн", "deadline", "task", "задание"]
-        if any(word in text.lower() for word in keywords):
-            if len(text) > 4:
-                session.add(Task(
-                    chat_id=chat_id,
-                    message_id=message_id,
-                    task_name=text, 
-                    context=text
-                ))
-
-        try:
-            await session.commit()
-        except Exception as e:
-            await session.rollback()
-            pass
+        record = build_record(event, text)
+        # Правка уходит в пул всегда: даже без сущностей она должна удалить
+        # сохранённую версию сообщения (database.ingest.drop_changed_messages)
+        if edited or worth_ingesting(record):
+            await self.ingest.submit(record)
 
         return await handler(event, data)
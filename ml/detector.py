@@ -0,0 +1,129 @@
+import re
+from functools import lru_cache
+from typing import Iterable, Optional, Tuple
+
+DEFAULT_TASK_KEYWORDS = ("надо", "сделать", "дедлайн", "deadline", "task", "задание")
+
+# Окончания русских слов, которые срезаются перед построением шаблона.
+# Длинные окончания проверяются первыми.
+RU_ENDINGS = sorted([
+    "айте", "яйте", "ите", "ать", "ять", "ить", "еть", "уть", "ешь", "ете", "ют", "ут",
+    "ала", "али", "ало", "ила", "или", "ило", "ал", "ил",
+    "ами", "ями", "ого", "его", "ому", "ему", "ов", "ев", "ей", "ам", "ям", "ах", "ях",
+    "ом", "ем", "ой", "ый", "ий", "ая", "яя", "ое", "ее", "ые", "ие", "ия", "ию",
+    "ы", "и", "а", "я", "о", "е", "у", "ю", "ь",
+], key=len, reverse=True)
+
+# Окончания, которые допускаются после короткой основы ("лаб-у", "над-о")
+SHORT_ENDINGS = ("а", "я", "о", "е", "у", "ю", "ы", "и", "ой", "ей", "ою", "ам", "ям", "ами", "ями", "ах", "ях", "ом", "ем")
+
+MIN_STEM_LENGTH = 4
+MIN_SHORT_STEM_LENGTH = 3
+MIN_TASK_LENGTH = 5
+
+
+def split_word(word: str) -> Tuple[str, str]:
+    """
+    Грубый стеммер: делит слово на основу и окончание.
+    Основа короче MIN_SHORT_STEM_LENGTH не отделяется — слово остаётся целым.
+    """
+    word = word.lower()
+    for ending in RU_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_SHORT_STEM_LENGTH:
+            return word[:-len(ending)], ending
+    return word, ""
+
+
+def parse_keywords(raw: Optional[str]) -> Tuple[str, ...]:
+    """
+    Разбирает пользовательский список ключевых слов из Chat.task_keywords ("слово1, слово2").
+    """
+    if not raw:
+        return ()
+    words = (w.strip().lower() for w in raw.split(","))
+    return tuple(sorted({w for w in words if w}))
+
+
+def _trie_regex(words: Iterable[str]) -> str:
+    """
+    Собирает из набора строк регулярку по префиксному дереву,
+    чтобы у слов с общим началом не было отдельных веток в альтернативе.
+    """
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node: dict) -> str:
+        is_end = node.get("") is True
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if is_end:
+            return "(?:" + body + ")?"
+        return body
+
+    return build(trie)
+
+
+def compile_keywords(keywords: Iterable[str]) -> "re.Pattern[str]":
+    """
+    Компилирует ключевые слова в одну регулярку.
+    Длинная основа ищется по началу слова с любым продолжением ("сделайте", "дедлайны"),
+    короткая — только с типовым окончанием ("лаба" -> "лабу", но не "лабиринт"),
+    слова без окончания и короче MIN_STEM_LENGTH — целиком.
+    """
+    stems, short_stems, exact = set(), set(), set()
+    for keyword in keywords:
+        keyword = keyword.strip().lower()
+        if not keyword:
+            continue
+        base, ending = split_word(keyword)
+        if len(base) >= MIN_STEM_LENGTH:
+            stems.add(base)
+        elif ending:
+            short_stems.add(base)
+        else:
+            exact.add(keyword)
+
+    parts = []
+    if stems:
+        parts.append(r"\b" + _trie_regex(stems) + r"\w*")
+    if short_stems:
+        parts.append(r"\b" + _trie_regex(short_stems) + _trie_regex(SHORT_ENDINGS) + r"\b")
+    if exact:
+        parts.append(r"\b" + _trie_regex(exact) + r"\b")
+    if not parts:
+        return re.compile(r"(?!)")
+    return re.compile("|".join(parts), re.IGNORECASE)
+
+
+class TaskDetector:
+    """
+    Эвристика «похоже на задачу»: один проход скомпилированной регулярки по тексту.
+    """
+
+    def __init__(self, keywords: Iterable[str] = DEFAULT_TASK_KEYWORDS):
+        self.keywords = tuple(keywords)
+        self.pattern = compile_keywords(self.keywords)
+
+    def is_task(self, text: str) -> bool:
+        if len(text) < MIN_TASK_LENGTH:
+            return False
+        return self.pattern.search(text) is not None
+
+
+@lru_cache(maxsize=1024)
+def _detector_for(custom_keywords: Tuple[str, ...]) -> TaskDetector:
+    return TaskDetector(DEFAULT_TASK_KEYWORDS + custom_keywords)
+
+
+def get_task_detector(task_keywords: Optional[str] = None) -> TaskDetector:
+    """
+    Детектор для чата: стандартные слова плюс Chat.task_keywords.
+    Скомпилированные детекторы кэшируются по набору слов.
+    """
+    return _detector_for(parse_keywords(task_keywords))
@@ -0,0 +1,172 @@
+"""
+Ограничение запросов к Gemini на процесс.
+
+Запрос занимает слот (не больше ML_CONCURRENCY одновременно) и берёт из двух
+корзин (token bucket): один запрос из ML_REQUESTS_PER_MINUTE и оценку своих токенов
+из ML_TOKENS_PER_MINUTE. Корзины пополняются равномерно, полная корзина — минутный лимит.
+
+Ожидающие запросы стоят в очереди по полосам: сначала interactive (команды
+пользователя), потом scheduled (сводки по расписанию), потом background; внутри
+полосы — по порядку прихода. Полоса задаётся контекстом (llm_lane, LlmLaneMiddleware):
+вне апдейта запрос идёт в background.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+from configs.config import ML_CONCURRENCY, ML_REQUESTS_PER_MINUTE, ML_TOKENS_PER_MINUTE
+
+LANES = ("interactive", "scheduled", "background")
+
+current_lane: ContextVar[str] = ContextVar("llm_lane", default="background")
+
+
+@contextmanager
+def llm_lane(lane: str) -> Iterator[None]:
+    """
+    Запросы к LLM внутри блока идут в полосе lane.
+    """
+    token = current_lane.set(lane)
+    try:
+        yield
+    finally:
+        current_lane.reset(token)
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "tokens", "wakeup")
+
+    def __init__(self, priority: int, seq: int, tokens: int, wakeup: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.wakeup = wakeup
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class RateLimiter:
+    """
+    Слоты и корзины запросов и токенов с очередью по полосам. Лимит 0 — без ограничения.
+    Очередь строгая: пока первый в ней ждёт, следующие его не обгоняют, даже если им хватило бы.
+    """
+
+    def __init__(
+            self,
+            concurrency: int,
+            requests_per_minute: float = 0,
+            tokens_per_minute: float = 0,
+            clock=time.monotonic
+    ):
+        self.concurrency = concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.clock = clock
+        self.requests = float(requests_per_minute)
+        self.tokens = float(tokens_per_minute)
+        self._updated = clock()
+        self._queue: list = []
+        self._seq = itertools.count()
+        self.in_flight = 0
+        self.acquired = dict.fromkeys(LANES, 0)
+        self.wait_total = dict.fromkeys(LANES, 0.0)
+        self.wait_max = dict.fromkeys(LANES, 0.0)
+
+    def _refill(self) -> None:
+        now = self.clock()
+        elapsed, self._updated = now - self._updated, now
+        if self.requests_per_minute:
+            self.requests = min(self.requests_per_minute, self.requests + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self.tokens = min(self.tokens_per_minute, self.tokens + elapsed * self.tokens_per_minute / 60)
+
+    def _delay(self, tokens: int) -> Optional[float]:
+        """
+        Через сколько секунд корзины наполнятся для запроса; None — ждать освобождения слота.
+        """
+        if self.in_flight >= self.concurrency:
+            return None
+        self._refill()
+        delay = 0.0
+        if self.requests_per_minute and self.requests < 1:
+            delay = (1 - self.requests) * 60 / self.requests_per_minute
+        if self.tokens_per_minute and self.tokens < tokens:
+            delay = max(delay, (tokens - self.tokens) * 60 / self.tokens_per_minute)
+        return delay
+
+    def _wake_first(self) -> None:
+        if self._queue and not self._queue[0].wakeup.done():
+            self._queue[0].wakeup.set_result(None)
+
+    async def acquire(self, tokens: int, lane: Optional[str] = None) -> None:
+        """
+        Ждёт очереди, слота и наполнения корзин и забирает из них запрос и tokens токенов.
+        Запрос больше минутного лимита токенов ждёт полную корзину.
+        """
+        lane = lane or current_lane.get()
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(LANES.index(lane), next(self._seq), tokens, loop.create_future())
+        heapq.heappush(self._queue, waiter)
+        start = self.clock()
+        try:
+            while True:
+                if self._queue[0] is waiter:
+                    delay = self._delay(tokens)
+                    if delay is not None and delay <= 0:
+                        break
+                else:
+                    delay = None
+                if waiter.wakeup.done():
+                    waiter.wakeup = loop.create_future()
+                await asyncio.wait((waiter.wakeup,), timeout=delay)
+        finally:
+            self._queue.remove(waiter)
+            heapq.heapify(self._queue)
+            self._wake_first()
+
+        self.in_flight += 1
+        if self.requests_per_minute:
+            self.requests -= 1
+        if self.tokens_per_minute:
+            self.tokens -= tokens
+        waited = self.clock() - start
+        self.acquired[lane] += 1
+        self.wait_total[lane] += waited
+        self.wait_max[lane] = max(self.wait_max[lane], waited)
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake_first()
+
+    @asynccontextmanager
+    async def slot(self, tokens: int, lane: Optional[str] = None) -> AsyncIterator[None]:
+        await self.acquire(tokens, lane)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        self._refill()
+        stats = {
+            "in_flight": self.in_flight,
+            "waiting": len(self._queue),
+            "requests_available": self.requests,
+            "tokens_available": self.tokens,
+        }
+        for lane in LANES:
+            stats[f"{lane}_waiting"] = sum(1 for waiter in self._queue if LANES[waiter.priority] == lane)
+            stats[f"{lane}_acquired"] = self.acquired[lane]
+            stats[f"{lane}_wait_seconds_total"] = self.wait_total[lane]
+            stats[f"{lane}_wait_seconds_max"] = self.wait_max[lane]
+        return stats
+
+
+llm_limiter = RateLimiter(ML_CONCURRENCY, ML_REQUESTS_PER_MINUTE, ML_TOKENS_PER_MINUTE)
@@ -1,7 +1,13 @@
-from typing import List, Any, Literal
+import asyncio
+import hashlib
+from typing import Dict, List, Any, Literal, NamedTuple, Optional, Set, Tuple
 from langchain_google_genai import ChatGoogleGenerativeAI
 from pydantic import BaseModel, Field
 
+from configs.config import ML_CHUNK_ITEMS, ML_CHUNK_TOKENS
+from ml.limiter import llm_limiter
+from ml.verdicts import CachedVerdict, verdict_cache, verdict_key
+
 
 class ItemAnalysis(BaseModel):
     id: int = Field(description="ID объекта из базы")
@@ -14,12 +20,27 @@ class BatchAnalysis(BaseModel):
     items: List[ItemAnalysis]
 
 
+ItemType = Literal["link", "doc", "task", "mention", "hashtag"]
+
+
+class CategoryAnalysis(BaseModel):
+    category: ItemType = Field(description="Вид элементов из заголовка раздела: link, doc, task, hashtag или mention")
+    items: List[ItemAnalysis]
+
+
+class CombinedAnalysis(BaseModel):
+    categories: List[CategoryAnalysis]
+
+
+MODEL_NAME = "gemini-2.5-flash"
+
 llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
+    model=MODEL_NAME,
     temperature=0,
 )
 
 structured_llm = llm.with_structured_output(BatchAnalysis)
+combined_llm = llm.with_structured_output(CombinedAnalysis)
 
 PROMPTS = {
     "link": """
@@ -116,50 +137,269 @@ PROMPTS = {
 }
 
 
+DEFAULT_PROMPT = "Filter specific important items."
+
+# Общий запрос по нескольким видам (analyze_categories): дальше разделы «### Раздел: <вид>»
+# с критериями из PROMPTS и списком элементов
+COMBINED_PROMPT = """
+    Ты помощник студента. Ниже несколько разделов с элементами из чата, у каждого раздела свои критерии.
+    Разбери каждый раздел по его критериям и верни по нему запись в categories:
+    category — вид из заголовка раздела, items — вердикты по ID из этого раздела.
+    """
+
+# Версия промпта для ключей кэша вердиктов (ml/verdicts.py): меняется вместе с текстом промпта или моделью.
+# Общий запрос несёт те же критерии, поэтому его вердикты кэшируются под версией вида
+PROMPT_VERSIONS = {
+    item_type: hashlib.sha1(f"{MODEL_NAME}\n{prompt}".encode("utf-8")).hexdigest()[:12]
+    for item_type, prompt in PROMPTS.items()
+}
+
+# Грубая оценка без токенизатора: около трёх символов на токен для смеси кириллицы и латиницы
+CHARS_PER_TOKEN = 3
+# Обвязка одного вердикта в ответе: id, is_important, ключи JSON
+VERDICT_OVERHEAD_TOKENS = 15
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def item_content(item: Any, item_type: str) -> str:
+    if item_type == "link":
+        return item.url
+    if item_type == "doc":
+        return item.document_name
+    if item_type == "task":
+        return item.task_name
+    if item_type == "mention":
+        return item.mention
+    if item_type == "hashtag":
+        return item.hashtag
+    return ""
+
+
+# Оценка поля about в ответе (до 12 слов) — для лимита токенов в минуту
+ABOUT_TOKENS = 25
+
+
+def request_tokens(prompt: str, items: int) -> int:
+    """
+    Оценка токенов запроса и ответа на items вердиктов для ml.limiter.
+    """
+    return estimate_tokens(prompt) + items * (VERDICT_OVERHEAD_TOKENS + ABOUT_TOKENS)
+
+
+def split_by_tokens(lines: Dict[str, str], max_tokens: int, max_items: int) -> List[Dict[str, str]]:
+    """
+    Делит строки промпта на чанки по оценке токенов (не больше max_tokens)
+    и не больше max_items строк, сохраняя порядок. Строка длиннее лимита — отдельный чанк.
+    """
+    chunks, chunk, size = [], {}, 0
+    for key, line in lines.items():
+        tokens = estimate_tokens(line)
+        if chunk and (size + tokens > max_tokens or len(chunk) >= max_items):
+            chunks.append(chunk)
+            chunk, size = {}, 0
+        chunk[key] = line
+        size += tokens
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+class ItemBatch(NamedTuple):
+    """
+    Элементы одного вида после поиска в кэше вердиктов.
+    """
+    item_type: str
+    items: List[Any]
+    # id элемента -> ключ кэша
+    keys: Dict[int, str]
+    cached: Dict[str, CachedVerdict]
+    # Строки промпта для элементов без вердикта: ключ -> строка (из одинаковых элементов одна)
+    lines: Dict[str, str]
+    pending: Dict[str, Any]
+
+
+async def lookup_batch(items: List[Any], item_type: str) -> ItemBatch:
+    prompt_version = PROMPT_VERSIONS.get(item_type, "")
+    keys = {
+        item.id: verdict_key(item_type, item_content(item, item_type), item.context, prompt_version)
+        for item in items
+    }
+    cached = await verdict_cache.get_many(keys[item.id] for item in items)
+
+    pending = {}
+    for item in items:
+        if keys[item.id] not in cached:
+            pending.setdefault(keys[item.id], item)
+    lines = {
+        key: f"ID: {item.id} | Content: {item_content(item, item_type)} | User Context: {item.context}"
+        for key, item in pending.items()
+    }
+    return ItemBatch(item_type, items, keys, cached, lines, pending)
+
+
+def read_verdicts(lines: Dict[str, str], pending: Dict[str, Any], answers: List[ItemAnalysis]) -> Dict[str, CachedVerdict]:
+    """
+    Вердикты ответа LLM по ключам кэша. Элемент, о котором LLM промолчал, вердикта не получает.
+    """
+    answer_map = {answer.id: answer for answer in answers}
+    verdicts = {}
+    for key, line in lines.items():
+        answer = answer_map.get(pending[key].id)
+        if answer is not None:
+            tokens = estimate_tokens(line) + estimate_tokens(answer.about) + VERDICT_OVERHEAD_TOKENS
+            verdicts[key] = CachedVerdict(answer.is_important, answer.about, tokens)
+    return verdicts
+
+
+async def judge_chunk(
+        system_prompt: str,
+        lines: Dict[str, str],
+        pending: Dict[str, Any]
+) -> Optional[Dict[str, CachedVerdict]]:
+    """
+    Один запрос к LLM по чанку строк. Возвращает вердикты по ключам кэша
+    или None, если запрос не удался.
+    """
+    full_prompt = f"{system_prompt}\n\nList to analyze:\n" + "\n".join(lines.values())
+    async with llm_limiter.slot(request_tokens(full_prompt, len(lines))):
+        try:
+            result = await structured_llm.ainvoke(full_prompt)
+        except Exception as e:
+            print(f"ML Error: {e}")
+            return None
+    return read_verdicts(lines, pending, result.items)
+
+
+async def judge_batch(batch: ItemBatch) -> Tuple[Dict[str, CachedVerdict], Set[str]]:
+    """
+    Разбирает элементы пачки без вердикта: чанки по ML_CHUNK_TOKENS оценочных токенов
+    уходят в LLM параллельно. Возвращает новые вердикты и ключи упавших чанков.
+    """
+    system_prompt = PROMPTS.get(batch.item_type, DEFAULT_PROMPT)
+    chunks = split_by_tokens(batch.lines, ML_CHUNK_TOKENS, ML_CHUNK_ITEMS)
+    results = await asyncio.gather(*(judge_chunk(system_prompt, chunk, batch.pending) for chunk in chunks))
+
+    fresh, failed = {}, set()
+    for chunk, chunk_verdicts in zip(chunks, results):
+        if chunk_verdicts is None:
+            failed.update(chunk)
+        else:
+            fresh.update(chunk_verdicts)
+    return fresh, failed
+
+
+def combined_prompt(batches: List[ItemBatch]) -> str:
+    sections = [
+        f"### Раздел: {batch.item_type}\n{PROMPTS.get(batch.item_type, DEFAULT_PROMPT)}\n"
+        f"List to analyze:\n" + "\n".join(batch.lines.values())
+        for batch in batches
+    ]
+    return COMBINED_PROMPT + "\n\n" + "\n\n".join(sections)
+
+
+async def judge_combined(batches: List[ItemBatch]) -> Optional[Dict[str, Dict[str, CachedVerdict]]]:
+    """
+    Один запрос к LLM по нескольким видам сразу: раздел на вид со своими критериями.
+    Возвращает вердикты по видам, в которых нет разделов, пропущенных в ответе,
+    или None, если запрос не удался.
+    """
+    full_prompt = combined_prompt(batches)
+    async with llm_limiter.slot(request_tokens(full_prompt, sum(len(batch.lines) for batch in batches))):
+        try:
+            result = await combined_llm.ainvoke(full_prompt)
+        except Exception as e:
+            print(f"ML Error: {e}")
+            return None
+
+    answers = {}
+    for category in result.categories:
+        answers.setdefault(category.category, []).extend(category.items)
+    return {
+        batch.item_type: read_verdicts(batch.lines, batch.pending, answers[batch.item_type])
+        for batch in batches if batch.item_type in answers
+    }
+
+
+async def finish_batch(
+        batch: ItemBatch,
+        fresh: Dict[str, CachedVerdict],
+        failed: Set[str]
+) -> Optional[List[dict]]:
+    """
+    Сохраняет новые вердикты в кэш и собирает ответ analyze_items по пачке.
+    """
+    if not batch.pending:
+        verdict_cache.skip_call(estimate_tokens(PROMPTS.get(batch.item_type, DEFAULT_PROMPT)))
+    if fresh:
+        await verdict_cache.put_many(batch.item_type, fresh)
+    if batch.pending and len(failed) == len(batch.pending) and not batch.cached:
+        return None
+    verdicts = batch.cached | fresh
+
+    filtered = []
+    for item in batch.items:
+        key = batch.keys[item.id]
+        verdict = verdicts.get(key)
+        if key in failed:
+            filtered.append({"original": item, "failed": True})
+        elif verdict and verdict.is_important:
+            filtered.append({
+                "original": item,
+                "about": verdict.about
+            })
+    return filtered
+
+
 async def analyze_items(
         items: List[Any],
-        item_type: Literal["link", "doc", "task", "mention", "hashtag"]
-) -> List[dict]:
+        item_type: ItemType
+) -> Optional[List[dict]]:
+    """
+    Возвращает важные элементы с about. Элементы, уже разобранные в любом чате
+    (кэш вердиктов), в LLM не отправляются; из одинаковых элементов пачки
+    отправляется один. Остальные делятся на чанки по ML_CHUNK_TOKENS оценочных
+    токенов, и чанки разбираются параллельно в пределах лимитов ml.limiter.
+
+    Элементы чанка, запрос по которому не удался, приходят как {"original": item, "failed": True}:
+    их нельзя отмечать проверенными. None — не удалось разобрать ни одного элемента.
+    """
     if not items:
         return []
 
-    input_lines = []
-    for item in items:
-        main_content = ""
-        if item_type == "link":
-            main_content = item.url
-        elif item_type == "doc":
-            main_content = item.document_name
-        elif item_type == "task":
-            main_content = item.task_name
-        elif item_type == "mention":
-            main_content = item.mention
-        elif item_type == "hashtag":
-            main_content = item.hashtag
-
-        input_lines.append(f"ID: {item.id} | Content: {main_content} | User Context: {item.context}")
-
-    text_block = "\n".join(input_lines)
-
-    system_prompt = PROMPTS.get(item_type, "Filter specific important items.")
-
-    full_prompt = f"{system_prompt}\n\nList to analyze:\n{text_block}"
-
-    try:
-        result = await structured_llm.ainvoke(full_prompt)
-
-        verdict_map = {v.id: v for v in result.items}
-        filtered = []
-
-        for item in items:
-            verdict = verdict_map.get(item.id)
-            if verdict and verdict.is_important:
-                filtered.append({
-                    "original": item,
-                    "about": verdict.about
-                })
-        return filtered
-
-    except Exception as e:
-        print(f"ML Error: {e}")
-        return []
+    batch = await lookup_batch(items, item_type)
+    fresh, failed = await judge_batch(batch) if batch.pending else ({}, set())
+    return await finish_batch(batch, fresh, failed)
+
+
+async def analyze_categories(batches: Dict[str, List[Any]]) -> Dict[str, Optional[List[dict]]]:
+    """
+    analyze_items для нескольких видов сразу: {item_type: элементы} -> {item_type: ответ analyze_items}.
+    Если элементы без вердикта есть у нескольких видов и вместе укладываются в один чанк
+    (ML_CHUNK_TOKENS, ML_CHUNK_ITEMS), они уходят в LLM одним запросом с разделом на вид,
+    иначе — отдельными запросами по видам, как в analyze_items. Виды, которых нет
+    в ответе на общий запрос, тоже разбираются отдельными запросами.
+    """
+    looked = await asyncio.gather(*(lookup_batch(items, item_type) for item_type, items in batches.items() if items))
+    pending = [batch for batch in looked if batch.pending]
+
+    judged = {}
+    lines = {key: line for batch in pending for key, line in batch.lines.items()}
+    if len(pending) > 1 and len(split_by_tokens(lines, ML_CHUNK_TOKENS, ML_CHUNK_ITEMS)) == 1:
+        fresh = await judge_combined(pending)
+        if fresh is None:
+            judged = {batch.item_type: ({}, set(batch.pending)) for batch in pending}
+        else:
+            judged = {item_type: (verdicts, set()) for item_type, verdicts in fresh.items()}
+        # Раздел, пропущенный в ответе, не значит «всё неважно»: такой вид разбирается отдельно
+        pending = [batch for batch in pending if batch.item_type not in judged]
+
+    results = await asyncio.gather(*(judge_batch(batch) for batch in pending))
+    judged |= {batch.item_type: result for batch, result in zip(pending, results)}
+
+    analyzed = {item_type: [] for item_type in batches}
+    for batch in looked:
+        analyzed[batch.item_type] = await finish_batch(batch, *judged.get(batch.item_type, ({}, set())))
+    return analyzed
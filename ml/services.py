@@ -1,6 +1,49 @@
-from typing import List, Type, Optional, Any
-from database.crud import save_analysis_results
-from ml.ml import analyze_items
+import asyncio
+from contextlib import aclosing
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Set, Type, Optional, Any, Tuple
+from configs.config import ML_COMBINED
+from database.crud import save_analysis_results, attach_context, stream_daily_data
+from database.digests import WINDOW, decode_items, drop_digest, merge_items, open_digest, save_digest
+from database.models import DIGEST_REBUILD, Digest
+from database.session import release_session
+from ml.ml import analyze_categories, analyze_items
+
+
+async def apply_analysis(new_items: List[Any], analyzed_data: List[dict], model_class: Type) -> None:
+    """
+    Отмечает элементы разобранными по ответу ML в памяти и в БД.
+    Элементы упавшего чанка остаются непроверенными и уйдут в ML в следующий раз.
+    """
+    failed_ids = {item['original'].id for item in analyzed_data if item.get('failed')}
+    important_map = {item['original'].id: item['about'] for item in analyzed_data if not item.get('failed')}
+    results_to_save = []
+
+    for item in new_items:
+        if item.id in failed_ids:
+            continue
+        is_imp = item.id in important_map
+        about_text = important_map.get(item.id, None)
+
+        results_to_save.append({
+            'id': item.id,
+            'is_checked': True,
+            'is_important': is_imp,
+            'about': about_text
+        })
+
+        item.is_checked = True
+        item.is_important = is_imp
+        item.about = about_text
+
+    await save_analysis_results(model_class, results_to_save)
+
+
+def needs_context(item: Any) -> bool:
+    """
+    Текст сообщения нужен элементам, которые уйдут в ML, и важным, показанным без about.
+    """
+    return not item.is_checked or (item.is_important and not item.about)
 
 
 async def process_items_pipeline(
@@ -10,9 +53,9 @@ async def process_items_pipeline(
 ) -> Optional[List[Any]]:
     """
     Универсальный конвейер:
-    1. Находит непроверенные элементы.
-    2. Отправляет их в ML.
-    3. Обновляет объекты в памяти.
+    1. Находит непроверенные элементы и подгружает им текст сообщения.
+    2. Отправляет их в ML, вернув соединение апдейта в пул на время запроса.
+    3. Обновляет объекты в памяти (кроме элементов, запрос по которым не удался).
     4. Сохраняет изменения в БД.
     5. Возвращает итоговый список ВАЖНЫХ элементов.
 
@@ -21,31 +64,152 @@ async def process_items_pipeline(
 
     new_items = [i for i in all_items if not i.is_checked]
 
+    await attach_context([i for i in all_items if needs_context(i)])
+
     if new_items:
+        await release_session()
         analyzed_data = await analyze_items(new_items, item_type=item_type)
 
         if analyzed_data is None:
             return None
 
-        important_map = {item['original'].id: item['about'] for item in analyzed_data}
-        results_to_save = []
+        await apply_analysis(new_items, analyzed_data, model_class)
 
-        for item in new_items:
-            is_imp = item.id in important_map
-            about_text = important_map.get(item.id, None)
+    items_to_show = [i for i in all_items if i.is_important]
 
-            results_to_save.append({
-                'id': item.id,
-                'is_important': is_imp,
-                'about': about_text
-            })
+    return items_to_show
 
-            item.is_checked = True
-            item.is_important = is_imp
-            item.about = about_text
 
-        await save_analysis_results(model_class, results_to_save)
+async def process_categories_pipeline(
+        batches: Dict[str, List[Any]],
+        categories: Dict[str, Tuple[str, Type]]
+) -> Dict[str, Optional[List[Any]]]:
+    """
+    process_items_pipeline для нескольких категорий сразу: текст сообщений
+    подгружается одним запросом, а непроверенные элементы всех категорий
+    разбираются одним analyze_categories (общий запрос к LLM, если пачка
+    небольшая). Возвращает важные элементы или None по каждой категории.
+    """
+    new_items = {key: [i for i in items if not i.is_checked] for key, items in batches.items()}
 
-    items_to_show = [i for i in all_items if i.is_important]
+    await attach_context([i for items in batches.values() for i in items if needs_context(i)])
+
+    await release_session()
+    analyzed = await analyze_categories({
+        categories[key][0]: items for key, items in new_items.items() if items
+    })
 
+    results = {}
+    for key, items in batches.items():
+        item_type, model_class = categories[key]
+        if new_items[key]:
+            if analyzed[item_type] is None:
+                results[key] = None
+                continue
+            await apply_analysis(new_items[key], analyzed[item_type], model_class)
+        results[key] = [i for i in items if i.is_important]
+    return results
+
+
+async def process_items_stream(
+        chunks: AsyncIterator[List[Any]],
+        item_type: str,
+        model_class: Type,
+        incomplete: Optional[Set[str]] = None
+) -> Optional[List[Any]]:
+    """
+    Потоковый вариант process_items_pipeline для пачек из database.crud.stream_records:
+    каждая пачка проходит конвейер целиком, а дальше живут только важные элементы.
+    Память не растёт с числом сообщений в чате.
+
+    Возвращает None, если ML вернул ошибку; непрочитанные пачки не запрашиваются.
+    В incomplete добавляется item_type, если часть элементов осталась непроверенной.
+    """
+    items_to_show = []
+    async with aclosing(chunks):
+        async for chunk in chunks:
+            important = await process_items_pipeline(chunk, item_type, model_class)
+            if important is None:
+                return None
+            items_to_show.extend(important)
+            if incomplete is not None and not all(item.is_checked for item in chunk):
+                incomplete.add(item_type)
     return items_to_show
+
+
+async def process_categories_stream(
+        chunks: AsyncIterator[Dict[str, List[Any]]],
+        categories: Dict[str, Tuple[str, Type]],
+        incomplete: Optional[Set[str]] = None
+) -> Dict[str, Optional[List[Any]]]:
+    """
+    Потоковый конвейер сводки для пачек из database.crud.stream_daily_data.
+    categories — {категория: (item_type, модель)}. Категории одной пачки
+    разбираются вместе (process_categories_pipeline), а с ML_COMBINED=0 —
+    параллельными process_items_pipeline.
+
+    В результате только категории, в которых были элементы: список важных
+    или None, если ML вернул ошибку (дальше такая категория не обрабатывается).
+    В incomplete добавляются категории, часть элементов которых осталась
+    непроверенной (не удался один из запросов к LLM).
+    """
+    results: Dict[str, Optional[List[Any]]] = {}
+    async with aclosing(chunks):
+        async for chunk in chunks:
+            keys = [
+                key for key in categories
+                if chunk.get(key) and results.setdefault(key, []) is not None
+            ]
+            if ML_COMBINED:
+                combined = await process_categories_pipeline({key: chunk[key] for key in keys}, categories)
+                processed = [combined[key] for key in keys]
+            else:
+                processed = await asyncio.gather(*(
+                    process_items_pipeline(chunk[key], *categories[key]) for key in keys
+                ))
+            for key, important in zip(keys, processed):
+                if important is None:
+                    results[key] = None
+                else:
+                    results[key].extend(important)
+                    if incomplete is not None and not all(item.is_checked for item in chunk[key]):
+                        incomplete.add(key)
+    return results
+
+
+async def refresh_digest(
+        chat_id: int,
+        digest: Optional[Digest],
+        categories: Dict[str, Tuple[str, Type]]
+) -> Dict[str, Optional[List[Any]]]:
+    """
+    Досчитывает сводку чата (database/digests.py). Без сводки или с пометкой
+    DIGEST_REBUILD разбираются все элементы за сутки, иначе только не проверенные
+    ML — остальные уже в ней. Новые важные элементы добавляются к сохранённым.
+    Строка сводки создаётся до чтения элементов: если за время сборки version
+    изменилась, сводка не сохраняется как свежая.
+
+    Категория, на которой ML вернул ошибку, приходит как None; тогда сводка
+    не сохраняется, и следующий /summary повторит разбор. Если не удалась
+    только часть запросов, сводка удаляется.
+    """
+    if digest is None:
+        digest = await open_digest(chat_id)
+    rebuild = digest.built_version == DIGEST_REBUILD
+    base = {} if rebuild else decode_items(digest.items, datetime.now() - WINDOW)
+    incomplete = set()
+    processed = await process_categories_stream(
+        stream_daily_data(chat_id, unchecked_only=not rebuild), categories, incomplete
+    )
+
+    failed = {kind for kind, items in processed.items() if items is None}
+    merged = {kind: items for kind, items in processed.items() if items is not None}
+    if not rebuild:
+        merged = merge_items(base, merged)
+    if incomplete:
+        # Часть элементов не разобрана: следующий /summary соберёт сводку заново,
+        # в ML уйдут только они (остальные уже отмечены проверенными)
+        await drop_digest(chat_id)
+    elif not failed:
+        await save_digest(chat_id, merged, built_version=digest.version)
+    return merged | dict.fromkeys(failed)
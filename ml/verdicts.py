@@ -0,0 +1,145 @@
+"""
+Кэш вердиктов LLM по содержимому элемента.
+
+Одна и та же ссылка, документ или хэштег с тем же текстом сообщения разбираются
+одинаково в любом чате. Ключ — sha256 от вида элемента, нормализованных
+содержимого и контекста и версии промпта (ml.ml.PROMPT_VERSIONS): правка промпта
+или смена модели сама делает старые вердикты недостижимыми.
+
+Перед БД (таблица verdicts, database/verdicts.py) стоит LRU в памяти процесса.
+Ошибки БД кэша не ломают разбор: элемент просто уходит в LLM.
+"""
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, NamedTuple, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+from configs.config import VERDICT_CACHE_SIZE
+from database.verdicts import load_verdicts, save_verdicts
+
+logger = logging.getLogger(__name__)
+
+
+class CachedVerdict(NamedTuple):
+    is_important: bool
+    about: Optional[str]
+    # Оценка токенов запроса и ответа, которые стоил разбор элемента
+    tokens: int
+
+
+def normalize_text(value: Optional[str]) -> str:
+    return " ".join((value or "").split()).casefold()
+
+
+def normalize_url(url: str) -> str:
+    """
+    Схема и хост без учёта регистра, без фрагмента и завершающего слэша; путь и query как есть.
+    """
+    parts = urlsplit(url.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/"), parts.query, ""))
+
+
+def verdict_key(item_type: str, content: str, context: Optional[str], prompt_version: str) -> str:
+    normalized = normalize_url(content) if item_type == "link" else normalize_text(content)
+    raw = "\x1f".join((item_type, normalized, normalize_text(context), prompt_version))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class VerdictCache:
+    """
+    LRU в памяти на `maxsize` вердиктов поверх таблицы verdicts.
+    load и save — функции чтения и записи БД (подменяются в тестах и бенчмарках).
+    """
+
+    def __init__(self, maxsize: int = 50000, load=load_verdicts, save=save_verdicts):
+        self.maxsize = maxsize
+        self.load = load
+        self.save = save
+        self._data: "OrderedDict[str, CachedVerdict]" = OrderedDict()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+        self.calls_skipped = 0
+
+    def _remember(self, key: str, verdict: CachedVerdict) -> None:
+        self._data[key] = verdict
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, CachedVerdict]:
+        """
+        Найденные вердикты по ключам. Каждый ключ из keys (с повторами) учитывается
+        в статистике как отдельный элемент; попадания добавляют свои токены в tokens_saved.
+        """
+        keys = list(keys)
+        found: Dict[str, CachedVerdict] = {}
+        for key in keys:
+            verdict = self._data.get(key)
+            if verdict is not None:
+                self._data.move_to_end(key)
+                found[key] = verdict
+
+        missing = list(dict.fromkeys(key for key in keys if key not in found))
+        from_db = {}
+        if missing:
+            try:
+                rows = await self.load(missing)
+            except Exception:
+                logger.exception("Не удалось прочитать кэш вердиктов")
+                rows = {}
+            for key, row in rows.items():
+                from_db[key] = CachedVerdict(row.is_important, row.about, row.tokens)
+                self._remember(key, from_db[key])
+
+        for key in keys:
+            verdict = found.get(key) or from_db.get(key)
+            if verdict is None:
+                self.misses += 1
+                continue
+            if key in found:
+                self.memory_hits += 1
+            else:
+                self.db_hits += 1
+            self.tokens_saved += verdict.tokens
+        return found | from_db
+
+    async def put_many(self, item_type: str, verdicts: Dict[str, CachedVerdict]) -> None:
+        for key, verdict in verdicts.items():
+            self._remember(key, verdict)
+        try:
+            await self.save(
+                dict(key=key, item_type=item_type, **verdict._asdict()) for key, verdict in verdicts.items()
+            )
+        except Exception:
+            logger.exception("Не удалось записать %d вердиктов в кэш", len(verdicts))
+
+    def skip_call(self, prompt_tokens: int) -> None:
+        """
+        Все элементы пачки нашлись в кэше: запрос к LLM с промптом не отправлялся.
+        """
+        self.calls_skipped += 1
+        self.tokens_saved += prompt_tokens
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.memory_hits = self.db_hits = self.misses = 0
+        self.tokens_saved = self.calls_skipped = 0
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.memory_hits + self.db_hits
+        total = hits + self.misses
+        return {
+            "size": len(self._data),
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "tokens_saved": self.tokens_saved,
+            "calls_skipped": self.calls_skipped,
+        }
+
+
+verdict_cache = VerdictCache(maxsize=VERDICT_CACHE_SIZE)
@@ -1,48 +1,53 @@
 from aiogram import Router, types, F
-from sqlalchemy import select
-from database.session import async_session
+from sqlalchemy import Select
+from database.crud import has_rows, stream_records
+from database.digests import drop_digest, replace_digest_category
 from database.models import Document
+from database.records import select_records
 import datetime
 import html
 
-from ml.services import process_items_pipeline
+from ml.services import process_items_stream
 
 router = Router()
 
 
-async def get_daily_documents(chat_id: int) -> list[Document]:
+def daily_documents_query(chat_id: int) -> Select:
     yesterday = datetime.datetime.now() - datetime.timedelta(days=1)
 
-    async with async_session() as session:
-        query = select(Document).where(
-            Document.chat_id == chat_id,
-            Document.created_at >= yesterday
-        ).order_by(Document.created_at.desc())
-
-        result = await session.execute(query)
-        return result.scalars().all()
+    return select_records(Document).where(
+        Document.chat_id == chat_id,
+        Document.created_at >= yesterday
+    ).order_by(Document.created_at.desc())
 
 
 @router.message(F.text == "/docs")
 async def get_documents_handler(message: types.Message):
-    all_docs = await get_daily_documents(chat_id=message.chat.id)
+    query = daily_documents_query(chat_id=message.chat.id)
 
-    if not all_docs:
+    if not await has_rows(query):
         await message.answer("📭 Документов за последние сутки не было.")
         return
 
     status_msg = await message.answer("🔎 Анализирую файлы...")
 
-    docs_to_show = await process_items_pipeline(
-        all_items=all_docs,
+    incomplete = set()
+    docs_to_show = await process_items_stream(
+        chunks=stream_records(query),
         item_type="doc",
-        model_class=Document
+        model_class=Document,
+        incomplete=incomplete
     )
 
     if docs_to_show is None:
         await status_msg.edit_text("⚠️ Временная ошибка мозга (OpenAI). Попробуй через минуту.")
         return
 
+    if incomplete:
+        # Часть элементов не разобрана: /summary соберёт сводку заново
+        await drop_digest(message.chat.id)
+    else:
+        await replace_digest_category(message.chat.id, "documents", docs_to_show)
 
     if not docs_to_show:
         await status_msg.edit_text("🤷‍♂️ Файлы были, но ничего важного (мемы или стикеры).")
@@ -1,48 +1,54 @@
 from aiogram import Router, types, F
-from sqlalchemy import select
-from database.session import async_session
+from sqlalchemy import Select
+from database.crud import has_rows, stream_records
+from database.digests import drop_digest, replace_digest_category
 from database.models import Hashtag
+from database.records import select_records
 import datetime
 import html
 
-from ml.services import process_items_pipeline
+from ml.services import process_items_stream
 
 router = Router()
 
 
-async def get_daily_hashtags(chat_id: int) -> list[Hashtag]:
+def daily_hashtags_query(chat_id: int) -> Select:
     yesterday = datetime.datetime.now() - datetime.timedelta(days=1)
 
-    async with async_session() as session:
-        query = select(Hashtag).where(
-            Hashtag.chat_id == chat_id,
-            Hashtag.created_at >= yesterday
-        ).order_by(Hashtag.created_at.desc())
-
-        result = await session.execute(query)
-        return result.scalars().all()
+    return select_records(Hashtag).where(
+        Hashtag.chat_id == chat_id,
+        Hashtag.created_at >= yesterday
+    ).order_by(Hashtag.created_at.desc())
 
 
 @router.message(F.text == "/hashtags")
 async def get_hashtags_handler(message: types.Message):
-    all_hashtags = await get_daily_hashtags(chat_id=message.chat.id)
+    query = daily_hashtags_query(chat_id=message.chat.id)
 
-    if not all_hashtags:
+    if not await has_rows(query):
         await message.answer("#️⃣ Хэштегов за сутки не найдено.")
         return
 
     status_msg = await message.answer("🔎 Анализирую хэштеги...")
 
-    hashtags_to_show = await process_items_pipeline(
-        all_items=all_hashtags,
+    incomplete = set()
+    hashtags_to_show = await process_items_stream(
+        chunks=stream_records(query),
         item_type="hashtag",
-        model_class=Hashtag
+        model_class=Hashtag,
+        incomplete=incomplete
     )
 
     if hashtags_to_show is None:
         await status_msg.edit_text("⚠️ Временная ошибка Gemini. Попробуй через минуту.")
         return
 
+    if incomplete:
+        # Часть элементов не разобрана: /summary соберёт сводку заново
+        await drop_digest(message.chat.id)
+    else:
+        await replace_digest_category(message.chat.id, "hashtags", hashtags_to_show)
+
     if not hashtags_to_show:
         await status_msg.edit_text("🤷‍♂️ Хэштеги были, но ничего важного (оффтоп).")
         return
@@ -1,51 +1,57 @@
 from aiogram import Router, types, F
-from sqlalchemy import select
-from database.session import async_session
+from sqlalchemy import Select
+from database.crud import has_rows, stream_records
+from database.digests import drop_digest, replace_digest_category
 from database.models import Link
+from database.records import select_records
 import datetime
 import html
 
-from ml.services import process_items_pipeline
+from ml.services import process_items_stream
 
 router = Router()
 
 
-async def get_daily_links(chat_id: int) -> list[Link]:
+def daily_links_query(chat_id: int) -> Select:
     """
     Достаем ссылки за последние 24 часа.
     """
     yesterday = datetime.datetime.now() - datetime.timedelta(days=1)
-    
-    async with async_session() as session:
-        query = select(Link).where(
-            Link.chat_id == chat_id,
-            Link.created_at >= yesterday
-        ).order_by(Link.created_at.desc())
-        
-        result = await session.execute(query)
-        return result.scalars().all()
+
+    return select_records(Link).where(
+        Link.chat_id == chat_id,
+        Link.created_at >= yesterday
+    ).order_by(Link.created_at.desc())
 
 
 @router.message(F.text == "/links")
 async def get_links_handler(message: types.Message):
-    all_links = await get_daily_links(chat_id=message.chat.id)
+    query = daily_links_query(chat_id=message.chat.id)
 
-    if not all_links:
+    if not await has_rows(query):
         await message.answer("📭 Ссылок за последние сутки не было.")
         return
 
     status_msg = await message.answer("🔎 Проверяю ссылки...")
 
-    links_to_show = await process_items_pipeline(
-        all_items=all_links,
+    incomplete = set()
+    links_to_show = await process_items_stream(
+        chunks=stream_records(query),
         item_type="link",
-        model_class=Link
+        model_class=Link,
+        incomplete=incomplete
     )
 
     if links_to_show is None:
         await status_msg.edit_text("⚠️ Временная ошибка Gemini. Попробуй через минуту.")
         return
 
+    if incomplete:
+        # Часть элементов не разобрана: /summary соберёт сводку заново
+        await drop_digest(message.chat.id)
+    else:
+        await replace_digest_category(message.chat.id, "links", links_to_show)
+
     if not links_to_show:
         await status_msg.edit_text("🤷‍♂️ Ссылки за сутки были, но ничего важного (мемы, спам или оффтоп).")
         return
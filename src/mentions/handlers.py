@@ -1,48 +1,54 @@
 from aiogram import Router, types, F
-from sqlalchemy import select
-from database.session import async_session
+from sqlalchemy import Select
+from database.crud import has_rows, stream_records
+from database.digests import drop_digest, replace_digest_category
 from database.models import Mention
+from database.records import select_records
 import datetime
 import html
 
-from ml.services import process_items_pipeline
+from ml.services import process_items_stream
 
 router = Router()
 
 
-async def get_daily_mentions(chat_id: int) -> list[Mention]:
+def daily_mentions_query(chat_id: int) -> Select:
     yesterday = datetime.datetime.now() - datetime.timedelta(days=1)
 
-    async with async_session() as session:
-        query = select(Mention).where(
-            Mention.chat_id == chat_id,
-            Mention.created_at >= yesterday
-        ).order_by(Mention.created_at.desc())
-
-        result = await session.execute(query)
-        return result.scalars().all()
+    return select_records(Mention).where(
+        Mention.chat_id == chat_id,
+        Mention.created_at >= yesterday
+    ).order_by(Mention.created_at.desc())
 
 
 @router.message(F.text == "/mentions")
 async def get_mentions_handler(message: types.Message):
-    all_mentions = await get_daily_mentions(chat_id=message.chat.id)
+    query = daily_mentions_query(chat_id=message.chat.id)
 
-    if not all_mentions:
+    if not await has_rows(query):
         await message.answer("🔕 Упоминаний за сутки не найдено.")
         return
 
     status_msg = await message.answer("🔎 Проверяю, кого звали по делу...")
 
-    mentions_to_show = await process_items_pipeline(
-        all_items=all_mentions,
+    incomplete = set()
+    mentions_to_show = await process_items_stream(
+        chunks=stream_records(query),
         item_type="mention",
-        model_class=Mention
+        model_class=Mention,
+        incomplete=incomplete
     )
 
     if mentions_to_show is None:
         await status_msg.edit_text("⚠️ Временная ошибка Gemini. Попробуй через минуту.")
         return
 
+    if incomplete:
+        # Часть элементов не разобрана: /summary соберёт сводку заново
+        await drop_digest(message.chat.id)
+    else:
+        await replace_digest_category(message.chat.id, "mentions", mentions_to_show)
+
     if not mentions_to_show:
         await status_msg.edit_text("🤷‍♂️ Упоминания были, но ничего важного.")
         return
@@ -1,6 +1,6 @@
 import re
 from aiogram import Router, F, types, Bot
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 
 from database.crud import get_chat_settings, update_settings_field, activate_chat
@@ -12,6 +12,7 @@ from src.settings.keyboards import (
 )
 from src.settings.utils import format_status_text
 from utils.admin import is_user_admin
+from ml.detector import DEFAULT_TASK_KEYWORDS, parse_keywords
 
 router = Router()
 
@@ -29,6 +30,36 @@ async def cmd_settings(message: types.Message, bot: Bot):
     await message.answer(text, reply_markup=get_main_settings_kb())
 
 
+@router.message(Command("keywords"))
+async def cmd_keywords(message: types.Message, command: CommandObject, bot: Bot):
+    """
+    /keywords — показать слова, по которым сообщение считается задачей.
+    /keywords лаба, сдать — задать свои слова для чата, /keywords - — сбросить.
+    """
+    if not await is_user_admin(message.chat, message.from_user.id, bot):
+        await message.reply("⛔️ Настройку бота может осуществлять только админ.")
+        return
+
+    chat = await get_chat_settings(message.chat.id)
+    if not chat:
+        chat = await activate_chat(message.chat)
+
+    if not command.args:
+        custom = ", ".join(parse_keywords(chat.task_keywords)) or "нет"
+        await message.answer(
+            f"📝 <b>Слова-маркеры задач</b>\n"
+            f"Стандартные: {', '.join(DEFAULT_TASK_KEYWORDS)}\n"
+            f"Свои: {custom}\n\n"
+            f"Изменить: /keywords слово1, слово2\n"
+            f"Сбросить: /keywords -"
+        )
+        return
+
+    keywords = None if command.args.strip() == "-" else ", ".join(parse_keywords(command.args)) or None
+    await update_settings_field(message.chat.id, task_keywords=keywords)
+    await message.answer(f"✅ Свои слова-маркеры: {keywords or 'нет'}")
+
+
 @router.callback_query(F.data.startswith(("settings_", "set_mode_", "toggle_field_", "delete_message")))
 async def settings_callback_router(callback: types.CallbackQuery, state: FSMContext, bot: Bot):
     if callback.data == "delete_message":
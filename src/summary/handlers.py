@@ -1,15 +1,40 @@
 from aiogram import Router, types
 from aiogram.filters import Command
 import html
-import asyncio
-from database.crud import get_daily_data, get_chat_settings
+from datetime import datetime
+from database.crud import get_chat_settings, has_daily_data
+from database.digests import WINDOW, decode_items, is_fresh, load_digest
 from database.models import Task, Link, Document, Mention, Hashtag
 
-from ml.services import process_items_pipeline
+from ml.services import refresh_digest
 
 router = Router()
 
 
+def summary_categories(settings) -> dict:
+    """
+    Включённые в настройках категории сводки: {категория: (item_type, модель)}.
+    """
+    categories = {}
+
+    if settings.include_tasks:
+        categories["tasks"] = ("task", Task)
+
+    if settings.include_links:
+        categories["links"] = ("link", Link)
+
+    if settings.include_docs:
+        categories["documents"] = ("doc", Document)
+
+    if settings.include_mentions:
+        categories["mentions"] = ("mention", Mention)
+
+    if settings.include_hashtags:
+        categories["hashtags"] = ("hashtag", Hashtag)
+
+    return categories
+
+
 @router.message(Command("summary"))
 async def cmd_summary(message: types.Message):
     # 1. Проверки настроек
@@ -18,45 +43,36 @@ async def cmd_summary(message: types.Message):
         await message.answer("❌ Бот не активирован. Напишите /on")
         return
 
-    data = await get_daily_data(message.chat.id)
+    digest = await load_digest(message.chat.id)
+    now = datetime.now()
+    fresh = is_fresh(digest, now)
+    status_msg = None
 
-    if not any(data.values()):
+    if not fresh and not await has_daily_data(message.chat.id):
         await message.answer("📭 За последние 24 часа данных не найдено.")
         return
 
-    status_msg = await message.answer("🧠 Собираю полную сводку (анализирую всё сразу)...")
+    categories = summary_categories(settings)
 
-    tasks_map = {}
+    if fresh:
+        # Новых сущностей с прошлой сводки не было: ответ из digests одним чтением
+        processed_data = decode_items(digest.items, now - WINDOW)
+    else:
+        status_msg = await message.answer("🧠 Собираю полную сводку (анализирую всё сразу)...")
 
-    if settings.include_tasks and data.get("tasks"):
-        tasks_map["tasks"] = process_items_pipeline(data["tasks"], "task", Task)
+        if not categories:
+            await status_msg.edit_text("🤷‍♂️ Данные есть, но все категории отключены в настройках.")
+            return
 
-    if settings.include_links and data.get("links"):
-        tasks_map["links"] = process_items_pipeline(data["links"], "link", Link)
+        # Строки за сутки читаются пачками, в памяти остаются только важные элементы
+        processed_data = await refresh_digest(message.chat.id, digest, categories)
 
-    if settings.include_docs and data.get("documents"):
-        tasks_map["docs"] = process_items_pipeline(data["documents"], "doc", Document)
+        if processed_data and all(res is None for res in processed_data.values()):
+            await status_msg.edit_text("⚠️ Временная ошибка Gemini. Попробуйте позже.")
+            return
 
-    if settings.include_mentions and data.get("mentions"):
-        tasks_map["mentions"] = process_items_pipeline(data["mentions"], "mention", Mention)
-
-    if settings.include_hashtags and data.get("hashtags"):
-        tasks_map["hashtags"] = process_items_pipeline(data["hashtags"], "hashtag", Hashtag)
-
-    if not tasks_map:
-        await status_msg.edit_text("🤷‍♂️ Данные есть, но все категории отключены в настройках.")
-        return
-
-    keys = list(tasks_map.keys())
-    coroutines = list(tasks_map.values())
-
-    results_list = await asyncio.gather(*coroutines)
-
-    processed_data = dict(zip(keys, results_list))
-
-    if all(res is None for res in results_list):
-        await status_msg.edit_text("⚠️ Временная ошибка Gemini. Попробуйте позже.")
-        return
+    processed_data = {kind: items for kind, items in processed_data.items() if kind in categories}
+    reply = status_msg.edit_text if status_msg else message.answer
 
     report = [f"<b>📊 СВОДКА ЗА 24 ЧАСА</b>\n"]
 
@@ -85,7 +101,7 @@ async def cmd_summary(message: types.Message):
             report.append(f"🔹 <a href='{l.url}'>{about}</a>")
         report.append("")
 
-    docs = processed_data.get("docs")
+    docs = processed_data.get("documents")
     if docs:
         report.append("📂 <b>Файлы:</b>")
         for d in docs:
@@ -129,9 +145,9 @@ async def cmd_summary(message: types.Message):
         report.append("")
 
     if len(report) <= 1:
-        await status_msg.edit_text(
+        await reply(
             "🤷‍♂️ За сутки было много активности, но нейросеть посчитала всё это неважным.")
         return
 
     final_text = "\n".join(report)
-    await status_msg.edit_text(final_text, disable_web_page_preview=True, parse_mode="HTML")
+    await reply(final_text, disable_web_page_preview=True, parse_mode="HTML")
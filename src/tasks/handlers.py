@@ -1,48 +1,55 @@
 from aiogram import Router, types, F
-from sqlalchemy import select
-from database.session import async_session
+from sqlalchemy import Select
+from database.crud import has_rows, stream_records
+from database.digests import drop_digest, replace_digest_category
 from database.models import Task
+from database.records import select_records
 import datetime
 import html
 
-from ml.services import process_items_pipeline
+from ml.services import process_items_stream
 
 router = Router()
 
 
-async def get_daily_tasks(chat_id: int) -> list[Task]:
+def daily_tasks_query(chat_id: int) -> Select:
     yesterday = datetime.datetime.now() - datetime.timedelta(days=1)
 
-    async with async_session() as session:
-        query = select(Task).where(
-            Task.chat_id == chat_id,
-            Task.created_at >= yesterday
-        )
-        result = await session.execute(query)
-        return result.scalars().all()
+    return select_records(Task).where(
+        Task.chat_id == chat_id,
+        Task.created_at >= yesterday
+    )
 
 
 @router.message(F.text == "/tasks")
 async def get_tasks_handler(message: types.Message):
     # 1. Получаем всё
-    all_tasks = await get_daily_tasks(chat_id=message.chat.id)
+    query = daily_tasks_query(chat_id=message.chat.id)
 
-    if not all_tasks:
+    if not await has_rows(query):
         await message.answer("✅ Задач за последние 24 часа не найдено.")
         return
 
     status_msg = await message.answer("🔎 Анализирую задачи и дедлайны...")
 
-    tasks_to_show = await process_items_pipeline(
-        all_items=all_tasks,
+    incomplete = set()
+    tasks_to_show = await process_items_stream(
+        chunks=stream_records(query),
         item_type="task",
-        model_class=Task
+        model_class=Task,
+        incomplete=incomplete
     )
 
     if tasks_to_show is None:
         await status_msg.edit_text("⚠️ Временная ошибка Gemini. Попробуй через минуту.")
         return
 
+    if incomplete:
+        # Часть элементов не разобрана: /summary соберёт сводку заново
+        await drop_digest(message.chat.id)
+    else:
+        await replace_digest_category(message.chat.id, "tasks", tasks_to_show)
+
     if not tasks_to_show:
         await status_msg.edit_text("🤷‍♂️ Похоже, это были просто обсуждения, а не реальные задачи.")
         return
@@ -1,9 +1,13 @@
 import asyncio
 import pytest
 import pytest_asyncio
+from types import SimpleNamespace
 
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from database.models import Base
+import ml.ml
+from ml.ml import BatchAnalysis, CategoryAnalysis, CombinedAnalysis, ItemAnalysis
+from ml.verdicts import VerdictCache
 
 # -------------------------
 # 1. EVENT LOOP
@@ -43,3 +47,101 @@ async def db_session(test_engine) -> AsyncSession:
     async with async_session() as session:
         yield session
         await session.rollback()
+
+# -------------------------
+# 4. DAILY ITEMS FOR HANDLERS
+# -------------------------
+@pytest.fixture
+def daily_items(monkeypatch):
+    """
+    Подменяет чтение сущностей в модуле хендлера (has_rows и stream_records):
+    переданные элементы приходят одной пачкой, без is_checked — уже проверенными.
+    Сводка чата не обновляется: use возвращает список вызовов replace/drop.
+    """
+    def use(module: str, items: list) -> list:
+        digest_calls = []
+        for item in items:
+            vars(item).setdefault("is_checked", True)
+
+        async def has_rows(query):
+            return bool(items)
+
+        async def stream_records(query):
+            yield items
+
+        async def replace_digest_category(chat_id, kind, items):
+            digest_calls.append(("replace", kind))
+
+        async def drop_digest(chat_id):
+            digest_calls.append(("drop",))
+
+        monkeypatch.setattr(f"{module}.has_rows", has_rows)
+        monkeypatch.setattr(f"{module}.stream_records", stream_records)
+        monkeypatch.setattr(f"{module}.replace_digest_category", replace_digest_category)
+        monkeypatch.setattr(f"{module}.drop_digest", drop_digest)
+        return digest_calls
+
+    return use
+
+# -------------------------
+# 5. LLM
+# -------------------------
+class FakeLLM:
+    """
+    Вместо structured_llm и combined_llm: важны элементы, в содержимом которых есть «лекция».
+    """
+
+    def __init__(self):
+        self.prompts = []
+
+    @staticmethod
+    def judge(lines):
+        verdicts = []
+        for line in lines.strip().splitlines():
+            item_id, content, _ = line.split(" | ")
+            content = content.removeprefix("Content: ")
+            verdicts.append(ItemAnalysis(
+                id=int(item_id.removeprefix("ID: ")), is_important="лекция" in content, about=f"о {content}",
+            ))
+        return verdicts
+
+    async def ainvoke(self, prompt):
+        self.prompts.append(prompt)
+        if "### Раздел: " not in prompt:
+            return BatchAnalysis(items=self.judge(prompt.split("List to analyze:\n")[1]))
+        return CombinedAnalysis(categories=[
+            CategoryAnalysis(
+                category=section.split("\n", 1)[0], items=self.judge(section.split("List to analyze:\n")[1]),
+            )
+            for section in prompt.split("### Раздел: ")[1:]
+        ])
+
+
+@pytest.fixture
+def verdict_storage():
+    """
+    Таблица verdicts в словаре: (строки, load, save) для VerdictCache.
+    """
+    rows = {}
+
+    async def load(keys):
+        return {key: rows[key] for key in keys if key in rows}
+
+    async def save(new_rows):
+        for row in new_rows:
+            rows.setdefault(row["key"], SimpleNamespace(**row))
+
+    return rows, load, save
+
+
+@pytest.fixture
+def llm(monkeypatch, verdict_storage):
+    """
+    analyze_items и analyze_categories без Gemini и без БД: FakeLLM и кэш вердиктов в памяти.
+    """
+    _, load, save = verdict_storage
+    fake = FakeLLM()
+    monkeypatch.setattr(ml.ml, "structured_llm", fake)
+    monkeypatch.setattr(ml.ml, "combined_llm", fake)
+    monkeypatch.setattr(ml.ml, "verdict_cache", VerdictCache(maxsize=100, load=load, save=save))
+    return fake
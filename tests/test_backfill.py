@@ -0,0 +1,151 @@
+import json
+import pytest
+import pytest_asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from database.migrations import migrate
+from database.models import Chat, ChatMessage, Digest, Document, Hashtag, Link, Mention, Task
+from utils.backfill import Backfill, ExportReader, export_chat_id, export_record
+
+CHAT_ID = -1001234567
+
+
+def unixtime(days_ago: float = 0) -> str:
+    return str(int((datetime.now() - timedelta(days=days_ago)).timestamp()))
+
+
+MESSAGES = [
+    {"id": 1, "type": "service", "action": "create_group", "date_unixtime": unixtime(1), "text": ""},
+    {
+        "id": 2, "type": "message", "date_unixtime": unixtime(1), "text": "",
+        "text_entities": [
+            {"type": "plain", "text": "Лекция "},
+            {"type": "link", "text": "https://example.com/lecture"},
+            {"type": "plain", "text": " и "},
+            {"type": "text_link", "text": "слайды", "href": "https://example.com/slides"},
+            {"type": "plain", "text": " по "},
+            {"type": "hashtag", "text": "#матан"},
+        ],
+    },
+    {
+        "id": 3, "type": "message", "date_unixtime": unixtime(1),
+        "text": ["", {"type": "mention_name", "text": "Иван", "user_id": 42}, " надо сдать лабу до пятницы"],
+    },
+    {
+        "id": 4, "type": "message", "date_unixtime": unixtime(1), "file": "files/lab1.pdf",
+        "file_name": "lab1.pdf", "mime_type": "application/pdf", "text": "",
+        "text_entities": [{"type": "mention", "text": "@metteix"}],
+    },
+    {"id": 5, "type": "message", "date_unixtime": unixtime(1), "file": "stickers/s.webp",
+     "media_type": "sticker", "text": "", "text_entities": []},
+    {"id": 6, "type": "message", "date_unixtime": unixtime(1), "text": "/summary",
+     "text_entities": [{"type": "bot_command", "text": "/summary"}]},
+    {"id": 7, "type": "message", "date_unixtime": unixtime(90), "text": "",
+     "text_entities": [{"type": "hashtag", "text": "#старое"}]},
+]
+
+
+def write_export(path, messages=MESSAGES):
+    export = {"name": "Группа ИТ 😀", "type": "private_supergroup", "id": 1234567, "messages": messages}
+    path.write_text(json.dumps(export, ensure_ascii=False, indent=1), encoding="utf-8")
+    return str(path)
+
+
+@pytest_asyncio.fixture
+async def session_pool(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'backfill.db'}", echo=False)
+    await migrate(engine)
+    yield async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    await engine.dispose()
+
+
+async def count_rows(session_pool, model):
+    async with session_pool() as session:
+        return await session.scalar(select(func.count()).select_from(model).where(model.chat_id == CHAT_ID))
+
+
+@pytest.mark.parametrize("read_size", [7, 1 << 20])
+def test_reader_streams_messages(tmp_path, read_size):
+    reader = ExportReader(write_export(tmp_path / "result.json"), read_size=read_size)
+    try:
+        header = reader.open()
+        messages = list(reader)
+    finally:
+        reader.close()
+
+    assert header == {"name": "Группа ИТ 😀", "type": "private_supergroup", "id": 1234567}
+    assert messages == MESSAGES
+    assert reader.bytes_read == reader.size
+
+
+def test_reader_rejects_truncated_export(tmp_path):
+    path = tmp_path / "result.json"
+    content = open(write_export(path), encoding="utf-8").read()
+    path.write_text(content[:-40], encoding="utf-8")
+    reader = ExportReader(str(path), read_size=64)
+    reader.open()
+    with pytest.raises(ValueError):
+        list(reader)
+    reader.close()
+
+
+def test_export_chat_id():
+    assert export_chat_id({"type": "private_supergroup", "id": 1234567}) == -1001234567
+    assert export_chat_id({"type": "private_group", "id": 555}) == -555
+
+
+def test_export_record_entities():
+    links = export_record(MESSAGES[1], CHAT_ID)
+    assert links.text == "Лекция https://example.com/lecture и слайды по #матан"
+    assert links.links == ("https://example.com/lecture", "https://example.com/slides")
+    assert links.hashtags == ("#матан",)
+
+    mention = export_record(MESSAGES[2], CHAT_ID)
+    assert (mention.text, mention.mentions) == ("Иван надо сдать лабу до пятницы", ("Иван",))
+
+    document = export_record(MESSAGES[3], CHAT_ID)
+    assert document.document == ("files/lab1.pdf", "lab1.pdf")
+    assert export_record(MESSAGES[4], CHAT_ID).document is None
+
+    # служебные сообщения и команды не импортируются
+    assert export_record(MESSAGES[0], CHAT_ID) is None
+    assert export_record(MESSAGES[5], CHAT_ID) is None
+
+
+@pytest.mark.asyncio
+async def test_backfill_writes_and_is_idempotent(tmp_path, session_pool):
+    async with session_pool() as session:
+        session.add_all([
+            Chat(chat_id=CHAT_ID, type="supergroup"),
+            Digest(chat_id=CHAT_ID, window_key="24h", items="{}", updated_at=datetime.now()),
+        ])
+        await session.commit()
+
+    path = write_export(tmp_path / "result.json")
+    for _ in range(2):
+        reader = ExportReader(path, read_size=64)
+        reader.open()
+        reports = []
+        stats = await Backfill(session_pool, CHAT_ID, batch_size=3).run(reader, progress=reports.append)
+        reader.close()
+
+    assert stats["messages_read"] == 7
+    assert stats["messages_skipped"] == 3  # служебное, стикер без текста, команда
+    assert stats["messages_expired"] == 1
+    assert stats["batches"] == 3 and reports
+
+    assert await count_rows(session_pool, ChatMessage) == 3
+    assert await count_rows(session_pool, Link) == 2
+    assert await count_rows(session_pool, Hashtag) == 1
+    assert await count_rows(session_pool, Mention) == 2
+    assert await count_rows(session_pool, Document) == 1
+    assert await count_rows(session_pool, Task) == 1
+
+    async with session_pool() as session:
+        created_at = await session.scalar(select(Link.created_at).where(Link.chat_id == CHAT_ID).limit(1))
+        digest = await session.scalar(select(Digest).where(Digest.chat_id == CHAT_ID))
+    assert datetime.now() - timedelta(days=2) < created_at < datetime.now() - timedelta(hours=12)
+    # готовая сводка устарела: следующий /summary доразберёт импортированное
+    assert digest.version == 6  # по одному на каждую пачку двух импортов
@@ -0,0 +1,89 @@
+import pytest
+from types import SimpleNamespace
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+
+import database.crud as crud
+from database.cache import ChatStateCache, chat_cache
+
+
+def test_miss_then_hit():
+    cache = ChatStateCache()
+
+    assert cache.get(1) is None
+    cache.set(1, True)
+    assert cache.get(1) is True
+
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_false_value_is_a_hit():
+    cache = ChatStateCache()
+    cache.set(1, False)
+
+    assert cache.get(1) is False
+    assert cache.hits == 1
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("database.cache.time.monotonic", lambda: now[0])
+
+    cache = ChatStateCache(ttl=10)
+    cache.set(1, True)
+
+    now[0] += 5
+    assert cache.get(1) is True
+
+    now[0] += 6
+    assert cache.get(1) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_lru_eviction():
+    cache = ChatStateCache(maxsize=2)
+    cache.set(1, True)
+    cache.set(2, True)
+
+    cache.get(1)
+    cache.set(3, True)
+
+    assert cache.get(2) is None
+    assert cache.get(1) is True
+    assert cache.get(3) is True
+
+
+def test_invalidate():
+    cache = ChatStateCache()
+    cache.set(1, True)
+    cache.invalidate(1)
+    cache.invalidate(2)
+
+    assert cache.get(1) is None
+
+
+# ---------- invalidation from crud ----------
+
+@pytest.fixture
+def crud_session(test_engine, monkeypatch):
+    session_pool = async_sessionmaker(bind=test_engine, class_=AsyncSession, expire_on_commit=False)
+    monkeypatch.setattr("database.session.async_session", session_pool)
+    chat_cache.clear()
+    yield
+    chat_cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_crud_invalidates_cache(crud_session):
+    tg_chat = SimpleNamespace(id=7001, title="Группа", first_name=None, username=None, type="group")
+
+    chat_cache.set(7001, False)
+    await crud.activate_chat(tg_chat)
+    assert chat_cache.get(7001) is None
+
+    chat_cache.set(7001, True)
+    await crud.deactivate_chat(7001)
+    assert chat_cache.get(7001) is None
+
+    chat_cache.set(7001, True)
+    await crud.update_settings_field(7001, include_links=False)
+    assert chat_cache.get(7001) is None
@@ -1,18 +1,21 @@
 import pytest
-from database.models import Mention, Hashtag, Document, Link, Task
+from database.models import Chat, ChatMessage, Mention, Hashtag, Document, Link, Task
+from database.records import DocumentRecord
+from sqlalchemy import select
+from sqlalchemy.orm import undefer
 from sqlalchemy.exc import IntegrityError
 
 CRUD_TEST_CASES = [
-    (Mention, {"chat_id": 1, "message_id": 10, "mention": "@user", "context": "Привет @user"},
-               {"mention": "@new", "context": "Новый контекст"}),
-    (Hashtag, {"chat_id": 2, "message_id": 20, "hashtag": "#test", "context": "Тест #test"},
-               {"hashtag": "#new", "context": "Новый контекст"}),
-    (Document, {"chat_id": 3, "message_id": 30, "file_id": "file_1", "document_name": "doc.pdf", "context": "Документ"},
-               {"document_name": "new.pdf", "context": "Новый документ"}),
-    (Link, {"chat_id": 4, "message_id": 40, "url": "https://example.com", "context": "Ссылка"},
-          {"url": "https://new.com", "context": "Новая ссылка"}),
-    (Task, {"chat_id": 5, "message_id": 50, "task_name": "Сделать тест", "context": "До пятницы"},
-           {"task_name": "Новое задание", "context": "Новый контекст"}),
+    (Mention, {"chat_id": 1, "message_id": 10, "mention": "@user", "about": "Привет @user"},
+               {"mention": "@new", "about": "Новый контекст"}),
+    (Hashtag, {"chat_id": 2, "message_id": 20, "hashtag": "#test", "about": "Тест #test"},
+               {"hashtag": "#new", "about": "Новый контекст"}),
+    (Document, {"chat_id": 3, "message_id": 30, "file_id": "file_1", "document_name": "doc.pdf", "about": "Документ"},
+               {"document_name": "new.pdf", "about": "Новый документ"}),
+    (Link, {"chat_id": 4, "message_id": 40, "url": "https://example.com", "about": "Ссылка"},
+          {"url": "https://new.com", "about": "Новая ссылка"}),
+    (Task, {"chat_id": 5, "message_id": 50, "task_name": "Сделать тест", "about": "До пятницы"},
+           {"task_name": "Новое задание", "about": "Новый контекст"}),
 ]
 
 @pytest.mark.asyncio
@@ -64,21 +67,250 @@ async def test_crud_bulk_create(db_session, model, create_data):
 async def test_crud_edge_cases(db_session, model, create_data):
     """
     Дополнительные логические проверки:
-    - Объект с пустым контекстом
+    - Объект с пустым описанием
     - Объект с очень длинным текстом
     """
-    # Пустой контекст
-    obj_empty = model(**{**create_data, "context": ""})
+    # Сущность уникальна в пределах сообщения, поэтому у объектов свои message_id
+    message_id = create_data["message_id"] + 100
+
+    # Пустое описание
+    obj_empty = model(**{**create_data, "message_id": message_id, "about": ""})
     db_session.add(obj_empty)
 
     # Длинный текст
     long_text = "x" * 1000
-    obj_long = model(**{**create_data, "context": long_text})
+    obj_long = model(**{**create_data, "message_id": message_id + 1, "about": long_text})
     db_session.add(obj_long)
 
     await db_session.commit()
 
     fetched_empty = await db_session.get(model, obj_empty.id)
     fetched_long = await db_session.get(model, obj_long.id)
-    assert fetched_empty.context == ""
-    assert fetched_long.context == long_text
+    assert fetched_empty.about == ""
+    assert fetched_long.about == long_text
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("model, create_data", [(m, c) for m, c, _ in CRUD_TEST_CASES])
+async def test_context_comes_from_messages(db_session, model, create_data):
+    """
+    Текст хранится один раз в messages, а context сущности читается оттуда.
+    """
+    data = {**create_data, "chat_id": create_data["chat_id"] + 100}
+    db_session.add(ChatMessage(chat_id=data["chat_id"], message_id=data["message_id"], text="Текст сообщения"))
+    db_session.add(model(**data))
+    await db_session.commit()
+    db_session.expunge_all()
+
+    result = await db_session.execute(
+        select(model).where(model.chat_id == data["chat_id"]).options(undefer(model.context))
+    )
+    fetched = result.scalar_one()
+    assert fetched.context == "Текст сообщения"
+
+
+@pytest.mark.asyncio
+async def test_attach_context(db_session, test_engine, monkeypatch):
+    import database.crud as crud
+    from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+
+    monkeypatch.setattr("database.session.async_session", async_sessionmaker(bind=test_engine, class_=AsyncSession))
+
+    db_session.add_all([
+        ChatMessage(chat_id=600, message_id=1, text="первое #тег"),
+        ChatMessage(chat_id=600, message_id=2, text="второе #тег"),
+        Hashtag(chat_id=600, message_id=1, hashtag="#тег"),
+        Hashtag(chat_id=600, message_id=2, hashtag="#тег"),
+        Hashtag(chat_id=600, message_id=3, hashtag="#тег"),
+    ])
+    await db_session.commit()
+    db_session.expunge_all()
+
+    items = (await db_session.execute(
+        select(Hashtag).where(Hashtag.chat_id == 600).order_by(Hashtag.message_id)
+    )).scalars().all()
+
+    await crud.attach_context(items)
+
+    assert [item.context for item in items] == ["первое #тег", "второе #тег", None]
+
+
+@pytest.mark.asyncio
+async def test_get_daily_data_single_query(db_session, test_engine, monkeypatch):
+    import database.crud as crud
+    from datetime import datetime, timedelta
+    from sqlalchemy import event
+    from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+
+    monkeypatch.setattr("database.session.async_session", async_sessionmaker(bind=test_engine, class_=AsyncSession))
+
+    db_session.add_all([
+        Chat(chat_id=700, type="group", include_links=False),
+        Chat(chat_id=701, type="group"),
+        Task(chat_id=700, message_id=1, task_name="сдать отчет"),
+        Mention(chat_id=700, message_id=2, mention="@user"),
+        Hashtag(chat_id=700, message_id=3, hashtag="#тег"),
+        Link(chat_id=700, message_id=4, url="https://example.com"),
+        Document(chat_id=700, message_id=5, file_id="f5", document_name="отчет.pdf", is_checked=True),
+        Task(chat_id=700, message_id=6, task_name="старое", created_at=datetime.now() - timedelta(days=2)),
+        Task(chat_id=701, message_id=1, task_name="другой чат"),
+    ])
+    await db_session.commit()
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(test_engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        data = await crud.get_daily_data(700)
+    finally:
+        event.remove(test_engine.sync_engine, "before_cursor_execute", listener)
+
+    assert len(statements) == 1
+    assert [t.task_name for t in data["tasks"]] == ["сдать отчет"]
+    assert [m.mention for m in data["mentions"]] == ["@user"]
+    assert [h.hashtag for h in data["hashtags"]] == ["#тег"]
+    assert data["links"] == []  # категория выключена
+
+    document = data["documents"][0]
+    assert isinstance(document, DocumentRecord)
+    assert (document.file_id, document.document_name, document.is_checked) == ("f5", "отчет.pdf", True)
+
+    # объекты годятся для сохранения результатов анализа по id
+    await crud.save_analysis_results(Task, [{"id": data["tasks"][0].id, "is_important": True}])
+    db_session.expunge_all()
+    assert (await db_session.get(Task, data["tasks"][0].id)).is_important is True
+
+
+@pytest.mark.asyncio
+async def test_get_daily_data_without_chat(db_session, test_engine, monkeypatch):
+    import database.crud as crud
+    from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+
+    monkeypatch.setattr("database.session.async_session", async_sessionmaker(bind=test_engine, class_=AsyncSession))
+
+    db_session.add(Task(chat_id=702, message_id=1, task_name="надо сделать"))
+    await db_session.commit()
+
+    data = await crud.get_daily_data(702)
+    assert not any(data.values())
+
+
+@pytest.mark.asyncio
+async def test_save_analysis_results_bulk(db_session, test_engine, monkeypatch):
+    import database.crud as crud
+    from sqlalchemy import event
+    from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+
+    monkeypatch.setattr("database.session.async_session", async_sessionmaker(bind=test_engine, class_=AsyncSession))
+
+    links = [Link(chat_id=710, message_id=i, url=f"https://example.com/{i}") for i in range(50)]
+    db_session.add_all(links)
+    await db_session.commit()
+
+    results = [
+        {"id": link.id, "is_important": i % 2 == 0, "about": f"ссылка {i}" if i % 2 == 0 else None}
+        for i, link in enumerate(links)
+    ]
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(test_engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        await crud.save_analysis_results(Link, results)
+        await crud.save_analysis_results(Link, [])
+    finally:
+        event.remove(test_engine.sync_engine, "before_cursor_execute", listener)
+
+    assert len(statements) == 1  # один executemany на всю пачку
+
+    db_session.expunge_all()
+    rows = (await db_session.execute(
+        select(Link.is_checked, Link.is_important, Link.about).where(Link.chat_id == 710).order_by(Link.message_id)
+    )).all()
+    assert rows[0] == (True, True, "ссылка 0")
+    assert rows[1] == (True, False, None)
+    assert all(is_checked for is_checked, _, _ in rows)
+
+
+@pytest.mark.asyncio
+async def test_stream_scalars_in_chunks(db_session, test_engine, monkeypatch):
+    import database.crud as crud
+    from sqlalchemy import inspect
+    from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+
+    monkeypatch.setattr("database.session.async_session", async_sessionmaker(bind=test_engine, class_=AsyncSession))
+
+    db_session.add_all([Link(chat_id=720, message_id=i, url=f"https://example.com/{i}") for i in range(5)])
+    await db_session.commit()
+
+    query = select(Link).where(Link.chat_id == 720).order_by(Link.message_id)
+    chunks = [chunk async for chunk in crud.stream_scalars(query, chunk_size=2)]
+
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    assert [link.message_id for chunk in chunks for link in chunk] == [0, 1, 2, 3, 4]
+    # объекты отсоединены: сессия потока не копит их в identity map
+    assert all(inspect(link).detached for chunk in chunks for link in chunk)
+
+    assert await crud.has_rows(query) is True
+    assert await crud.has_rows(select(Link).where(Link.chat_id == 721)) is False
+
+
+@pytest.mark.asyncio
+async def test_stream_daily_data_in_chunks(db_session, test_engine, monkeypatch):
+    import database.crud as crud
+    from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+
+    monkeypatch.setattr("database.session.async_session", async_sessionmaker(bind=test_engine, class_=AsyncSession))
+
+    db_session.add_all([
+        Chat(chat_id=722, type="group"),
+        *(Task(chat_id=722, message_id=i, task_name=f"задача {i}") for i in range(3)),
+        *(Link(chat_id=722, message_id=10 + i, url=f"https://example.com/{i}") for i in range(2)),
+    ])
+    await db_session.commit()
+
+    chunks = [chunk async for chunk in crud.stream_daily_data(722, chunk_size=2)]
+    data = await crud.get_daily_data(722)
+
+    assert len(chunks) == 3
+    for kind, items in data.items():
+        streamed = [item for chunk in chunks for item in chunk[kind]]
+        assert [item.id for item in streamed] == [item.id for item in items]
+
+    assert await crud.has_daily_data(722) is True
+    assert await crud.has_daily_data(723) is False
+
+
+@pytest.mark.asyncio
+async def test_stream_records_in_chunks(db_session, test_engine, monkeypatch):
+    import database.crud as crud
+    from database.records import LinkRecord, select_records
+    from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+
+    monkeypatch.setattr("database.session.async_session", async_sessionmaker(bind=test_engine, class_=AsyncSession))
+
+    db_session.add_all([
+        *(ChatMessage(chat_id=724, message_id=i, text=f"смотрите {i}") for i in range(5)),
+        *(Link(chat_id=724, message_id=i, url=f"https://example.com/{i}") for i in range(5)),
+    ])
+    await db_session.commit()
+
+    query = select_records(Link).where(Link.chat_id == 724).order_by(Link.message_id.desc())
+    chunks = [chunk async for chunk in crud.stream_records(query, chunk_size=2)]
+
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    links = [link for chunk in chunks for link in chunk]
+    assert [link.message_id for link in links] == [4, 3, 2, 1, 0]
+    assert all(type(link) is LinkRecord for link in links)
+    assert (links[0].url, links[0].is_checked, links[0].about, links[0].context) == (
+        "https://example.com/4", False, None, None,
+    )
+    # только слоты, без __dict__ и состояния ORM
+    assert not hasattr(links[0], "__dict__")
+
+    await crud.attach_context(links[:1])
+    assert links[0].context == "смотрите 4"
+
+    await crud.save_analysis_results(Link, [{"id": links[0].id, "is_important": True}])
+    db_session.expunge_all()
+    assert (await db_session.get(Link, links[0].id)).is_important is True
@@ -0,0 +1,57 @@
+import pytest
+from ml.detector import TaskDetector, get_task_detector, parse_keywords, split_word
+
+
+@pytest.mark.parametrize("text", [
+    "надо сделать домашку",
+    "Сделайте до пятницы, пожалуйста",
+    "дедлайны горят",
+    "DEADLINE tomorrow",
+    "new tasks for you",
+    "заданий на завтра много",
+    "Задание по матану",
+])
+def test_task_detected(text):
+    assert TaskDetector().is_task(text)
+
+
+@pytest.mark.parametrize("text", [
+    "привет всем",
+    "понадобится зонтик",
+    "надо",
+    "",
+])
+def test_task_not_detected(text):
+    assert not TaskDetector().is_task(text)
+
+
+def test_split_word():
+    assert split_word("сделать") == ("сдел", "ать")
+    assert split_word("надо") == ("над", "о")
+    assert split_word("Дедлайн") == ("дедлайн", "")
+    assert split_word("да") == ("да", "")
+
+
+def test_short_stem_needs_ending():
+    detector = TaskDetector(["лаба"])
+
+    assert detector.is_task("сдаём лабу завтра")
+    assert not detector.is_task("какой-то лабиринт")
+
+
+def test_parse_keywords():
+    assert parse_keywords(None) == ()
+    assert parse_keywords(" Лаба, сдать,,лаба ") == ("лаба", "сдать")
+
+
+def test_custom_keywords_extend_defaults():
+    detector = get_task_detector("лаба, коллоквиум")
+
+    assert detector.is_task("кто уже начал лабу?")
+    assert detector.is_task("коллоквиумы перенесли")
+    assert detector.is_task("надо сделать домашку")
+    assert not get_task_detector(None).is_task("кто уже начал лабу?")
+
+
+def test_detectors_are_cached():
+    assert get_task_detector("лаба, сдать") is get_task_detector("сдать,лаба")
@@ -0,0 +1,246 @@
+import asyncio
+import pytest
+import pytest_asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+import database.session
+from database.cache import ChatState, ChatStateCache
+from database.crud import update_settings_field
+from database.digests import (
+    WINDOW, decode_items, encode_items, is_fresh, load_digest, replace_digest_category,
+)
+from database.ingest import IngestPool, IngestRecord, mark_digests
+from database.migrations import migrate
+from database.models import DIGEST_REBUILD, Chat, ChatMessage, Digest, Link, Task
+from ml.services import refresh_digest
+
+CATEGORIES = {"links": ("link", Link), "tasks": ("task", Task)}
+
+
+@pytest_asyncio.fixture
+async def db_session(tmp_path, monkeypatch):
+    """
+    Отдельная БД в файле: категории сводки обрабатываются параллельно,
+    и каждой нужно своё соединение.
+    """
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'digests.db'}", echo=False)
+    await migrate(engine)
+    session_pool = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    monkeypatch.setattr("database.session.async_session", session_pool)
+    async with session_pool() as session:
+        yield session
+    await engine.dispose()
+
+
+@pytest.fixture(autouse=True)
+def per_category(monkeypatch):
+    """
+    ML подменяется через analyze_items: категории разбираются отдельными запросами.
+    """
+    monkeypatch.setattr("ml.services.ML_COMBINED", False)
+
+
+def fake_analyze(important_ids, calls):
+    async def analyze_items(items, item_type):
+        calls.extend(item.message_id for item in items)
+        return [
+            {"original": item, "about": f"{item_type} {item.message_id}"}
+            for item in items if item.message_id in important_ids
+        ]
+    return analyze_items
+
+
+async def add_links(db_session, chat_id, message_ids):
+    db_session.add_all([
+        *(ChatMessage(chat_id=chat_id, message_id=i, text=f"смотрите {i}") for i in message_ids),
+        *(Link(chat_id=chat_id, message_id=i, url=f"https://example.com/{i}") for i in message_ids),
+    ])
+    await db_session.commit()
+
+
+async def build_digest(db_session, chat_id, monkeypatch, important_ids, calls):
+    db_session.add(Chat(chat_id=chat_id, type="group"))
+    await add_links(db_session, chat_id, range(4))
+    monkeypatch.setattr("ml.services.analyze_items", fake_analyze(important_ids, calls))
+    return await refresh_digest(chat_id, None, CATEGORIES)
+
+
+@pytest.mark.asyncio
+async def test_digest_built_once(db_session, monkeypatch):
+    calls = []
+    shown = await build_digest(db_session, 740, monkeypatch, {1, 3}, calls)
+
+    assert [link.url for link in shown["links"]] == ["https://example.com/1", "https://example.com/3"]
+    assert sorted(calls) == [0, 1, 2, 3]
+
+    digest = await load_digest(740)
+    assert is_fresh(digest, datetime.now())
+    # повторный /summary читает только строку digests
+    data = decode_items(digest.items, datetime.now() - WINDOW)
+    assert [(link.url, link.about) for link in data["links"]] == [
+        ("https://example.com/1", "link 1"), ("https://example.com/3", "link 3"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_new_items_refreshed_incrementally(db_session, monkeypatch):
+    calls = []
+    await build_digest(db_session, 741, monkeypatch, {1, 5}, calls)
+
+    await add_links(db_session, 741, [4, 5])
+    await mark_digests(db_session, [(Link.__table__, {"chat_id": 741})], [])
+    await db_session.commit()
+
+    digest = await load_digest(741)
+    assert (digest.version, digest.built_version) == (1, 0)
+    assert not is_fresh(digest, datetime.now())
+
+    calls.clear()
+    shown = await refresh_digest(741, digest, CATEGORIES)
+
+    # в ML ушли только новые элементы, старые важные взяты из сводки
+    assert calls == [4, 5]
+    assert [link.message_id for link in shown["links"]] == [1, 5]
+    assert is_fresh(await load_digest(741), datetime.now())
+
+
+@pytest.mark.asyncio
+async def test_failed_category_not_saved(db_session, monkeypatch):
+    async def broken_analyze(items, item_type):
+        return None
+
+    db_session.add(Chat(chat_id=742, type="group"))
+    await add_links(db_session, 742, range(2))
+    monkeypatch.setattr("ml.services.analyze_items", broken_analyze)
+
+    assert await refresh_digest(742, None, CATEGORIES) == {"links": None}
+    digest = await load_digest(742)
+    assert digest.built_version == DIGEST_REBUILD
+    assert not is_fresh(digest, datetime.now())
+
+
+@pytest.mark.asyncio
+async def test_partial_failure_drops_digest(db_session, monkeypatch):
+    calls = []
+    await build_digest(db_session, 746, monkeypatch, {1}, calls)
+    await add_links(db_session, 746, [4, 5])
+    await mark_digests(db_session, [(Link.__table__, {"chat_id": 746})], [])
+    await db_session.commit()
+
+    async def flaky_analyze(items, item_type):
+        return [{"original": item, "failed": True} for item in items if item.message_id == 5]
+
+    monkeypatch.setattr("ml.services.analyze_items", flaky_analyze)
+    await refresh_digest(746, await load_digest(746), CATEGORIES)
+
+    # ссылка 5 не разобрана: сводки нет, следующий /summary соберёт её заново
+    assert await load_digest(746) is None
+    calls.clear()
+    monkeypatch.setattr("ml.services.analyze_items", fake_analyze({1, 5}, calls))
+    shown = await refresh_digest(746, None, CATEGORIES)
+
+    assert calls == [5]
+    assert [link.message_id for link in shown["links"]] == [1, 5]
+
+
+@pytest.mark.asyncio
+async def test_edit_rebuilds_and_settings_drop_digest(db_session, monkeypatch):
+    calls = []
+    await build_digest(db_session, 743, monkeypatch, {1}, calls)
+    await mark_digests(db_session, [(Link.__table__, {"chat_id": 743})], [(743, 1)])
+    await db_session.commit()
+    digest = await load_digest(743)
+    assert (digest.version, digest.built_version) == (1, DIGEST_REBUILD)
+
+    # сводка собирается заново по всем элементам, проверенные в ML не уходят
+    calls.clear()
+    shown = await refresh_digest(743, digest, CATEGORIES)
+    assert calls == []
+    assert [link.message_id for link in shown["links"]] == [1]
+    assert is_fresh(await load_digest(743), datetime.now())
+
+    await update_settings_field(743, include_links=False)
+    assert await load_digest(743) is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("existing", [False, True])
+async def test_ingest_and_edit_during_refresh(db_session, monkeypatch, existing):
+    chat_id = 747 + existing
+    calls = []
+    if existing:
+        await build_digest(db_session, chat_id, monkeypatch, {1, 5}, calls)
+        await add_links(db_session, chat_id, [4])
+        await mark_digests(db_session, [(Link.__table__, {"chat_id": chat_id})], [])
+        await db_session.commit()
+    else:
+        db_session.add(Chat(chat_id=chat_id, type="group"))
+        await add_links(db_session, chat_id, range(4))
+    digest = await load_digest(chat_id)
+
+    entered, resume = asyncio.Event(), asyncio.Event()
+    judge = fake_analyze({1, 5}, calls)
+
+    async def slow_analyze(items, item_type):
+        entered.set()
+        await resume.wait()
+        return await judge(items, item_type)
+
+    monkeypatch.setattr("ml.services.analyze_items", slow_analyze)
+    refresh = asyncio.create_task(refresh_digest(chat_id, digest, CATEGORIES))
+    await entered.wait()
+
+    # пока сборка ждёт LLM, приходят новое сообщение и правка уже прочитанного
+    cache = ChatStateCache()
+    cache.set(chat_id, ChatState(is_active=True))
+    pool = IngestPool(database.session.async_session, workers=1, flush_interval_ms=10, cache=cache)
+    await pool.start()
+    await pool.submit(IngestRecord(chat_id, 5, "новая", links=("https://example.com/5",)))
+    await pool.submit(IngestRecord(chat_id, 1, "правка", links=("https://example.com/1?v=2",), edited=True))
+    await pool.stop()
+    resume.set()
+    await refresh
+
+    # сводка без новой ссылки и со старой версией правленой не считается свежей
+    digest = await load_digest(chat_id)
+    assert digest.built_version == DIGEST_REBUILD
+    assert not is_fresh(digest, datetime.now())
+
+    monkeypatch.setattr("ml.services.analyze_items", judge)
+    shown = await refresh_digest(chat_id, digest, CATEGORIES)
+    assert sorted(link.url for link in shown["links"]) == ["https://example.com/1?v=2", "https://example.com/5"]
+    assert is_fresh(await load_digest(chat_id), datetime.now())
+
+
+@pytest.mark.asyncio
+async def test_replace_digest_category(db_session, monkeypatch):
+    await build_digest(db_session, 744, monkeypatch, {1}, [])
+    links = (await db_session.execute(
+        select(Link).where(Link.chat_id == 744, Link.message_id.in_([2, 3])).order_by(Link.message_id)
+    )).scalars().all()
+
+    await replace_digest_category(744, "links", links)
+
+    data = decode_items((await load_digest(744)).items, datetime.now() - WINDOW)
+    assert [link.message_id for link in data["links"]] == [2, 3]
+    # без готовой сводки ничего не создаётся
+    await replace_digest_category(745, "links", links)
+    assert await load_digest(745) is None
+
+
+def test_decode_drops_items_out_of_window():
+    now = datetime.now()
+    old = Task(id=1, chat_id=1, message_id=1, task_name="старая", created_at=now - timedelta(days=2))
+    new = Task(id=2, chat_id=1, message_id=2, task_name="новая", created_at=now)
+
+    data = decode_items(encode_items({"tasks": [old, new]}), now - WINDOW)
+
+    assert [(task.id, task.task_name, task.created_at) for task in data["tasks"]] == [(2, "новая", now)]
+
+
+@pytest.mark.asyncio
+async def test_digest_table_migrated(db_session):
+    result = await db_session.execute(select(Digest))
+    assert result.scalars().all() == []
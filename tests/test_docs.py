@@ -17,7 +17,7 @@ def mock_message():
 
 
 @pytest.mark.asyncio
-async def test_get_documents_handler_with_docs(mock_message, monkeypatch):
+async def test_get_documents_handler_with_docs(mock_message, monkeypatch, daily_items):
     # Данные для теста
     fake_docs = [
         SimpleNamespace(
@@ -35,14 +35,11 @@ async def test_get_documents_handler_with_docs(mock_message, monkeypatch):
     ]
 
     # Мокаем функции получения данных и пайплайна
-    async def fake_get_daily_documents(chat_id: int):
-        return fake_docs
-
     async def fake_process_items_pipeline(all_items, item_type, model_class):
         return all_items
 
-    monkeypatch.setattr("src.docs.handlers.get_daily_documents", fake_get_daily_documents)
-    monkeypatch.setattr("src.docs.handlers.process_items_pipeline", fake_process_items_pipeline)
+    daily_items("src.docs.handlers", fake_docs)
+    monkeypatch.setattr("ml.services.process_items_pipeline", fake_process_items_pipeline)
 
     # Запуск хендлера
     await get_documents_handler(mock_message)
@@ -67,11 +64,8 @@ async def test_get_documents_handler_with_docs(mock_message, monkeypatch):
 
 
 @pytest.mark.asyncio
-async def test_get_documents_handler_no_docs(mock_message, monkeypatch):
-    async def empty_docs(chat_id: int):
-        return []
-
-    monkeypatch.setattr("src.docs.handlers.get_daily_documents", empty_docs)
+async def test_get_documents_handler_no_docs(mock_message, daily_items):
+    daily_items("src.docs.handlers", [])
 
     await get_documents_handler(mock_message)
 
@@ -79,17 +73,14 @@ async def test_get_documents_handler_no_docs(mock_message, monkeypatch):
 
 
 @pytest.mark.asyncio
-async def test_get_documents_handler_pipeline_error(mock_message, monkeypatch):
+async def test_get_documents_handler_pipeline_error(mock_message, monkeypatch, daily_items):
     fake_docs = [SimpleNamespace(message_id=1, document_name="doc1.pdf", about="Документ", created_at=None)]
 
-    async def fake_get_daily_documents(chat_id: int):
-        return fake_docs
-
     async def fake_process_items_pipeline(all_items, item_type, model_class):
         return None
 
-    monkeypatch.setattr("src.docs.handlers.get_daily_documents", fake_get_daily_documents)
-    monkeypatch.setattr("src.docs.handlers.process_items_pipeline", fake_process_items_pipeline)
+    daily_items("src.docs.handlers", fake_docs)
+    monkeypatch.setattr("ml.services.process_items_pipeline", fake_process_items_pipeline)
 
     await get_documents_handler(mock_message)
 
@@ -98,17 +89,14 @@ async def test_get_documents_handler_pipeline_error(mock_message, monkeypatch):
 
 
 @pytest.mark.asyncio
-async def test_get_documents_handler_empty_after_filter(mock_message, monkeypatch):
+async def test_get_documents_handler_empty_after_filter(mock_message, monkeypatch, daily_items):
     fake_docs = [SimpleNamespace(message_id=1, document_name="doc1.pdf", about="Документ", created_at=None)]
 
-    async def fake_get_daily_documents(chat_id: int):
-        return fake_docs
-
     async def fake_process_items_pipeline(all_items, item_type, model_class):
         return []
 
-    monkeypatch.setattr("src.docs.handlers.get_daily_documents", fake_get_daily_documents)
-    monkeypatch.setattr("src.docs.handlers.process_items_pipeline", fake_process_items_pipeline)
+    daily_items("src.docs.handlers", fake_docs)
+    monkeypatch.setattr("ml.services.process_items_pipeline", fake_process_items_pipeline)
 
     await get_documents_handler(mock_message)
 
@@ -117,21 +105,18 @@ async def test_get_documents_handler_empty_after_filter(mock_message, monkeypatc
 
 
 @pytest.mark.asyncio
-async def test_get_documents_handler_without_username(mock_message, monkeypatch):
+async def test_get_documents_handler_without_username(mock_message, monkeypatch, daily_items):
     # Тест случая без юзернейма (ссылка через -100...)
     mock_message.chat.username = None
     mock_message.chat.id = -1001234567890
 
     fake_docs = [SimpleNamespace(message_id=42, document_name="doc.pdf", about="Документ", created_at=None)]
 
-    async def fake_get_daily_documents(chat_id: int):
-        return fake_docs
-
     async def fake_process_items_pipeline(all_items, item_type, model_class):
         return all_items
 
-    monkeypatch.setattr("src.docs.handlers.get_daily_documents", fake_get_daily_documents)
-    monkeypatch.setattr("src.docs.handlers.process_items_pipeline", fake_process_items_pipeline)
+    daily_items("src.docs.handlers", fake_docs)
+    monkeypatch.setattr("ml.services.process_items_pipeline", fake_process_items_pipeline)
 
     await get_documents_handler(mock_message)
 
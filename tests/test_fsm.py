@@ -0,0 +1,134 @@
+import pytest
+from datetime import timedelta
+from sqlalchemy import event, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+from aiogram.fsm.storage.base import StorageKey
+
+from database.fsm import SqlStorage, utcnow
+from database.models import FsmState
+from src.settings.states import SettingsStates
+
+
+@pytest.fixture
+def session_pool(test_engine, monkeypatch):
+    session_pool = async_sessionmaker(bind=test_engine, class_=AsyncSession, expire_on_commit=False)
+    monkeypatch.setattr("database.session.async_session", session_pool)
+    return session_pool
+
+
+def make_key(chat_id, user_id=1, **kwargs):
+    return StorageKey(bot_id=42, chat_id=chat_id, user_id=user_id, **kwargs)
+
+
+async def stored_row(session_pool, storage, key):
+    async with session_pool() as session:
+        return await session.get(FsmState, storage.key_builder.build(key))
+
+
+@pytest.mark.asyncio
+async def test_state_and_data_roundtrip(session_pool):
+    storage = SqlStorage()
+    key = make_key(8101)
+
+    await storage.set_state(key, SettingsStates.waiting_for_time)
+    await storage.set_data(key, {"message_id": 5, "поле": "время"})
+
+    assert await storage.get_state(key) == SettingsStates.waiting_for_time.state
+    assert await storage.get_data(key) == {"message_id": 5, "поле": "время"}
+    assert await storage.update_data(key, {"extra": True}) == {"message_id": 5, "поле": "время", "extra": True}
+
+
+@pytest.mark.asyncio
+async def test_state_survives_restart(session_pool):
+    key = make_key(8102)
+    await SqlStorage().set_state(key, "SettingsStates:waiting_for_time")
+
+    # новый экземпляр (рестарт или другой процесс) читает из БД
+    other = SqlStorage()
+    assert await other.get_state(key) == "SettingsStates:waiting_for_time"
+    assert await other.get_data(key) == {}
+
+
+@pytest.mark.asyncio
+async def test_clear_deletes_row(session_pool):
+    storage = SqlStorage()
+    key = make_key(8103)
+    await storage.set_state(key, "SettingsStates:waiting_for_time")
+    await storage.set_data(key, {"a": 1})
+
+    await storage.set_state(key, None)
+    await storage.set_data(key, {})
+
+    assert await storage.get_state(key) is None
+    assert await stored_row(session_pool, storage, key) is None
+
+
+@pytest.mark.asyncio
+async def test_reads_are_cached(session_pool):
+    storage = SqlStorage()
+    key = make_key(8104)
+    await storage.set_state(key, "S:a")
+
+    assert await SqlStorage().get_state(key) == "S:a"
+    for _ in range(3):
+        assert await storage.get_state(key) == "S:a"
+
+    # после записи в холодный кэш первое чтение идёт в БД, остальные — из кэша
+    assert storage.cache.stats()["misses"] == 1
+    assert storage.cache.stats()["hits"] == 2
+
+
+@pytest.mark.asyncio
+async def test_absent_state_is_cached(session_pool, test_engine):
+    storage = SqlStorage(cache_ttl=0)
+    key = make_key(8107)
+    selects = []
+
+    def on_execute(conn, cursor, statement, *args):
+        if statement.startswith("SELECT") and "fsm_states" in statement:
+            selects.append(statement)
+
+    event.listen(test_engine.sync_engine, "before_cursor_execute", on_execute)
+    try:
+        # aiogram читает состояние на каждом апдейте: пустое берётся из БД один раз
+        for _ in range(5):
+            assert await storage.get_state(key) is None
+        assert len(selects) == 1
+
+        # запись сбрасывает кэш отсутствия
+        await storage.set_state(key, "S:a")
+        assert await storage.get_state(key) == "S:a"
+        await storage.set_state(key, None)
+        assert await storage.get_state(key) is None
+        assert len(selects) == 3
+    finally:
+        event.remove(test_engine.sync_engine, "before_cursor_execute", on_execute)
+
+
+@pytest.mark.asyncio
+async def test_keys_are_isolated(session_pool):
+    storage = SqlStorage()
+    await storage.set_state(make_key(8105, user_id=1), "S:a")
+
+    assert await storage.get_state(make_key(8105, user_id=2)) is None
+    assert await storage.get_state(make_key(8105, user_id=1, thread_id=7)) is None
+    assert await storage.get_state(make_key(8105, user_id=1, destiny="other")) is None
+
+
+@pytest.mark.asyncio
+async def test_stale_state_expires(session_pool):
+    storage = SqlStorage(state_ttl=3600, cache_ttl=0)
+    key = make_key(8106)
+    await storage.set_state(key, "S:a")
+
+    async with session_pool() as session:
+        await session.execute(
+            update(FsmState)
+            .where(FsmState.key == storage.key_builder.build(key))
+            .values(updated_at=utcnow() - timedelta(hours=2))
+        )
+        await session.commit()
+
+    assert await storage.get_state(key) is None
+    assert await storage.purge_expired() >= 1
+    assert await stored_row(session_pool, storage, key) is None
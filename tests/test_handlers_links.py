@@ -15,20 +15,17 @@ def mock_message():
 
 
 @pytest.mark.asyncio
-async def test_get_links_handler_with_links(mock_message, monkeypatch):
+async def test_get_links_handler_with_links(mock_message, monkeypatch, daily_items):
     fake_links = [
         SimpleNamespace(url="https://example.com/1", about="Первый линк", context=None),
         SimpleNamespace(url="https://example.com/2", about=None, context="Второй линк")
     ]
 
-    async def fake_get_daily_links(chat_id: int):
-        return fake_links
-
     async def fake_process_items_pipeline(all_items, item_type, model_class):
         return all_items
 
-    monkeypatch.setattr("src.links.handlers.get_daily_links", fake_get_daily_links)
-    monkeypatch.setattr("src.links.handlers.process_items_pipeline", fake_process_items_pipeline)
+    daily_items("src.links.handlers", fake_links)
+    monkeypatch.setattr("ml.services.process_items_pipeline", fake_process_items_pipeline)
 
     await get_links_handler(mock_message)
 
@@ -43,28 +40,22 @@ async def test_get_links_handler_with_links(mock_message, monkeypatch):
 
 
 @pytest.mark.asyncio
-async def test_get_links_handler_no_links(mock_message, monkeypatch):
-    async def empty_links(chat_id: int):
-        return []
-
-    monkeypatch.setattr("src.links.handlers.get_daily_links", empty_links)
+async def test_get_links_handler_no_links(mock_message, daily_items):
+    daily_items("src.links.handlers", [])
 
     await get_links_handler(mock_message)
     mock_message.answer.assert_called_once_with("📭 Ссылок за последние сутки не было.")
 
 
 @pytest.mark.asyncio
-async def test_get_links_handler_pipeline_error(mock_message, monkeypatch):
+async def test_get_links_handler_pipeline_error(mock_message, monkeypatch, daily_items):
     fake_links = [SimpleNamespace(url="https://ex.com", about="Link", context=None)]
 
-    async def fake_get_daily_links(chat_id: int):
-        return fake_links
-
     async def fake_process_items_pipeline(all_items, item_type, model_class):
         return None
 
-    monkeypatch.setattr("src.links.handlers.get_daily_links", fake_get_daily_links)
-    monkeypatch.setattr("src.links.handlers.process_items_pipeline", fake_process_items_pipeline)
+    daily_items("src.links.handlers", fake_links)
+    monkeypatch.setattr("ml.services.process_items_pipeline", fake_process_items_pipeline)
 
     await get_links_handler(mock_message)
 
@@ -73,19 +64,16 @@ async def test_get_links_handler_pipeline_error(mock_message, monkeypatch):
 
 
 @pytest.mark.asyncio
-async def test_get_links_handler_special_characters(mock_message, monkeypatch):
+async def test_get_links_handler_special_characters(mock_message, monkeypatch, daily_items):
     fake_links = [
         SimpleNamespace(url="https://example.com", about="Тест <открытый тег>", context=None)
     ]
 
-    async def fake_get_daily_links(chat_id: int):
-        return fake_links
-
     async def fake_process_items_pipeline(all_items, item_type, model_class):
         return all_items
 
-    monkeypatch.setattr("src.links.handlers.get_daily_links", fake_get_daily_links)
-    monkeypatch.setattr("src.links.handlers.process_items_pipeline", fake_process_items_pipeline)
+    daily_items("src.links.handlers", fake_links)
+    monkeypatch.setattr("ml.services.process_items_pipeline", fake_process_items_pipeline)
 
     await get_links_handler(mock_message)
 
@@ -97,20 +85,17 @@ async def test_get_links_handler_special_characters(mock_message, monkeypatch):
 
 
 @pytest.mark.asyncio
-async def test_get_links_handler_many_links(mock_message, monkeypatch):
+async def test_get_links_handler_many_links(mock_message, monkeypatch, daily_items):
     fake_links = [
         SimpleNamespace(url=f"https://example.com/{i}", about=f"Описание {i}", context=None)
         for i in range(10)
     ]
 
-    async def fake_get_daily_links(chat_id: int):
-        return fake_links
-
     async def fake_process_items_pipeline(all_items, item_type, model_class):
         return all_items
 
-    monkeypatch.setattr("src.links.handlers.get_daily_links", fake_get_daily_links)
-    monkeypatch.setattr("src.links.handlers.process_items_pipeline", fake_process_items_pipeline)
+    daily_items("src.links.handlers", fake_links)
+    monkeypatch.setattr("ml.services.process_items_pipeline", fake_process_items_pipeline)
 
     await get_links_handler(mock_message)
 
@@ -118,4 +103,26 @@ async def test_get_links_handler_many_links(mock_message, monkeypatch):
     sent_text = status_msg.edit_text.call_args[0][0]
 
     assert "Описание 0" in sent_text
-    assert "Описание 9" in sent_text
\ No newline at end of file
+    assert "Описание 9" in sent_text
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("failed, expected", [(False, [("replace", "links")]), (True, [("drop",)])])
+async def test_get_links_handler_partial_failure_drops_digest(mock_message, monkeypatch, daily_items, failed, expected):
+    fake_links = [
+        SimpleNamespace(url="https://example.com/1", about="Первый линк", context=None, is_checked=False),
+        SimpleNamespace(url="https://example.com/2", about=None, context=None, is_checked=False),
+    ]
+
+    async def fake_process_items_pipeline(all_items, item_type, model_class):
+        # при failed запрос по второй ссылке не удался, она осталась непроверенной
+        for link in all_items[:1] if failed else all_items:
+            link.is_checked = True
+        return all_items[:1]
+
+    digest_calls = daily_items("src.links.handlers", fake_links)
+    monkeypatch.setattr("ml.services.process_items_pipeline", fake_process_items_pipeline)
+
+    await get_links_handler(mock_message)
+
+    assert digest_calls == expected
+    assert "Первый линк" in mock_message.answer.return_value.edit_text.call_args[0][0]
@@ -0,0 +1,430 @@
+import asyncio
+import json
+import pytest
+from datetime import datetime
+from sqlalchemy import select, func, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+
+from database.cache import ChatState, ChatStateCache
+from database.ingest import IngestPool, IngestRecord, record_rows, text_hash
+from database.models import Chat, ChatMessage, Hashtag, Item, Link, Task
+
+ACTIVE = ChatState(is_active=True)
+
+
+@pytest.fixture
+def session_pool(test_engine):
+    return async_sessionmaker(bind=test_engine, class_=AsyncSession, expire_on_commit=False)
+
+
+@pytest.fixture
+def cache():
+    cache = ChatStateCache()
+    for chat_id in range(9001, 9020):
+        cache.set(chat_id, ACTIVE)
+    return cache
+
+
+async def count_rows(session_pool, model, chat_id):
+    async with session_pool() as session:
+        result = await session.execute(
+            select(func.count()).select_from(model).where(model.chat_id == chat_id)
+        )
+        return result.scalar_one()
+
+
+# ---------- record_rows ----------
+
+def test_record_rows():
+    sent = datetime(2024, 5, 1, 12, 0)
+    record = IngestRecord(
+        chat_id=1, message_id=2, text="надо сделать #отчет @user",
+        document=("f1", "отчет.pdf"), hashtags=("#отчет",), links=("https://example.com",), mentions=("@user",),
+        date=sent,
+    )
+    rows = record_rows(record, ACTIVE)
+
+    assert rows[0][0] is ChatMessage.__table__
+    assert {table for table, _ in rows[1:]} == {Item.__table__}
+    assert [(row["kind"], row["content"]) for _, row in rows[1:]] == [
+        ("document", "отчет.pdf"), ("hashtag", "#отчет"), ("link", "https://example.com"),
+        ("mention", "@user"), ("task", "надо сделать #отчет @user"),
+    ]
+    assert rows[0][1] == {
+        "chat_id": 1, "message_id": 2, "text": "надо сделать #отчет @user",
+        "text_hash": text_hash("надо сделать #отчет @user"), "created_at": sent,
+    }
+    assert rows[1][1]["file_id"] == "f1"
+    # сообщение и сущности попадают в секцию дня отправки
+    assert {row["created_at"] for _, row in rows} == {sent}
+
+
+def test_record_rows_positions():
+    record = IngestRecord(1, 2, "#a #b #a https://e.com", hashtags=("#a", "#b", "#a"), links=("https://e.com",))
+    rows = record_rows(record, ACTIVE)[1:]
+
+    # повтор хэштега записывается один раз, номера идут по видам отдельно
+    assert [(row["kind"], row["position"], row["content"]) for _, row in rows] == [
+        ("hashtag", 0, "#a"), ("hashtag", 1, "#b"), ("link", 0, "https://e.com"),
+    ]
+
+
+def test_record_rows_without_date():
+    rows = record_rows(IngestRecord(1, 2, "#a", hashtags=("#a",)), ACTIVE)
+    assert len({row["created_at"] for _, row in rows}) == 1
+
+
+def test_record_rows_plain_text_is_empty():
+    assert record_rows(IngestRecord(1, 2, "обычный текст"), ACTIVE) == []
+
+
+def test_record_rows_custom_keywords():
+    record = IngestRecord(1, 2, "кто уже начал лабу?")
+
+    assert record_rows(record, ACTIVE) == []
+    rows = record_rows(record, ChatState(is_active=True, task_keywords="лаба"))
+    assert rows[-1][0] is Task.__table__
+
+
+def test_record_json_roundtrip():
+    record = IngestRecord(
+        1, 2, "текст", document=("f", "имя"), hashtags=("#a",), links=("u",), edited=True,
+        date=datetime(2024, 5, 1, 12, 0),
+    )
+    assert IngestRecord.from_json(record.to_json()) == record
+
+
+def test_record_json_without_date():
+    # строка спилла, записанная до появления даты
+    line = json.dumps([1, 2, "текст", None, ["#a"], [], [], False], ensure_ascii=False)
+    assert IngestRecord.from_json(line) == IngestRecord(1, 2, "текст", hashtags=("#a",))
+
+
+# ---------- pool ----------
+
+@pytest.mark.asyncio
+async def test_stop_drains_queues(session_pool, cache):
+    pool = IngestPool(session_pool, workers=3, batch_size=1000, flush_interval_ms=10_000, cache=cache)
+    await pool.start()
+
+    for i in range(25):
+        await pool.submit(IngestRecord(9001, i, "ссылка", links=("https://example.com",)))
+        await pool.submit(IngestRecord(9002, i, "тег", hashtags=("#drain",)))
+
+    await pool.stop()
+
+    assert await count_rows(session_pool, Link, 9001) == 25
+    assert await count_rows(session_pool, Hashtag, 9002) == 25
+    stats = pool.stats()
+    assert stats["depth"] == 0
+    assert stats["records_written"] == 50
+    assert stats["rows_written"] == 100
+
+
+@pytest.mark.asyncio
+async def test_flush_by_batch_size(session_pool, cache):
+    pool = IngestPool(session_pool, workers=1, batch_size=10, flush_interval_ms=10_000, cache=cache)
+    await pool.start()
+
+    for i in range(30):
+        await pool.submit(IngestRecord(9003, i, "сдать задание"))
+
+    for _ in range(100):
+        if pool.flushes >= 3:
+            break
+        await asyncio.sleep(0.01)
+
+    assert await count_rows(session_pool, Task, 9003) == 30
+    await pool.stop()
+    assert pool.flushes == 3
+
+
+@pytest.mark.asyncio
+async def test_flush_by_interval(session_pool, cache):
+    pool = IngestPool(session_pool, workers=2, batch_size=1000, flush_interval_ms=20, cache=cache)
+    await pool.start()
+
+    await pool.submit(IngestRecord(9004, 1, "дедлайн завтра"))
+    await asyncio.sleep(0.2)
+
+    assert await count_rows(session_pool, Task, 9004) == 1
+    await pool.stop()
+
+
+@pytest.mark.asyncio
+async def test_chats_resolved_in_worker(session_pool, test_engine):
+    async with session_pool() as session:
+        session.add_all([
+            Chat(chat_id=9101, type="group", is_active=True, task_keywords="лаба"),
+            Chat(chat_id=9102, type="group", is_active=False),
+        ])
+        await session.commit()
+
+    cache = ChatStateCache()
+    pool = IngestPool(session_pool, workers=1, batch_size=1000, flush_interval_ms=10_000, cache=cache)
+    await pool.start()
+    await pool.submit(IngestRecord(9101, 1, "кто уже начал лабу?"))
+    await pool.submit(IngestRecord(9102, 1, "надо сделать отчет"))
+    await pool.submit(IngestRecord(9103, 1, "надо сделать отчет"))  # чата нет в БД
+    await pool.stop()
+
+    assert await count_rows(session_pool, Task, 9101) == 1
+    assert await count_rows(session_pool, Task, 9102) == 0
+    assert await count_rows(session_pool, Task, 9103) == 0
+    assert cache.peek(9102) == ChatState(is_active=False)
+    assert cache.peek(9103) == ChatState(is_active=False)
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_is_counted(session_pool, cache):
+    pool = IngestPool(session_pool, workers=1, batch_size=1000, flush_interval_ms=10, cache=cache)
+    await pool.start()
+
+    # hashtag NOT NULL: пачка падает, но воркер продолжает работать
+    await pool.submit(IngestRecord(9005, 1, "тег", hashtags=(None,)))
+    await asyncio.sleep(0.1)
+    await pool.submit(IngestRecord(9005, 2, "задание на завтра"))
+    await pool.stop()
+
+    assert pool.records_failed == 1
+    assert pool.rows_written == 2
+    assert await count_rows(session_pool, Task, 9005) == 1
+
+
+@pytest.mark.asyncio
+async def test_batch_spilled_when_db_is_down(session_pool, cache, tmp_path):
+    spill_path = tmp_path / "spill.jsonl"
+    outage = [True]
+
+    def flaky_pool():
+        if outage[0]:
+            outage[0] = False
+            raise OperationalError("SELECT 1", {}, ConnectionRefusedError("БД недоступна"))
+        return session_pool()
+
+    pool = IngestPool(flaky_pool, workers=1, flush_interval_ms=10, spill_path=str(spill_path), cache=cache)
+    await pool.start()
+    await pool.submit(IngestRecord(9017, 1, "задание на завтра"))
+    await pool.submit(IngestRecord(9017, 2, "надо сдать отчет"))
+    for _ in range(300):
+        if pool.replayed == 2 and pool.depth == 0:
+            break
+        await asyncio.sleep(0.01)
+    await pool.stop()
+
+    # пачка не потерялась: ушла в спилл и записалась, когда БД вернулась
+    assert pool.records_failed == 2
+    assert pool.stats()["spilled"] == 2
+    assert await count_rows(session_pool, Task, 9017) == 2
+    assert not spill_path.exists()
+
+
+@pytest.mark.asyncio
+async def test_duplicate_message_does_not_fail_batch(session_pool, cache):
+    pool = IngestPool(session_pool, workers=1, batch_size=1000, flush_interval_ms=10_000, cache=cache)
+    await pool.start()
+
+    await pool.submit(IngestRecord(9006, 1, "ссылка", links=("https://a.example",)))
+    # повтор того же сообщения, например после правки
+    await pool.submit(IngestRecord(9006, 1, "ссылка", links=("https://b.example",)))
+    await pool.stop()
+
+    assert pool.records_failed == 0
+    assert await count_rows(session_pool, ChatMessage, 9006) == 1
+
+
+@pytest.mark.asyncio
+async def test_chat_routed_to_single_queue(session_pool, cache):
+    pool = IngestPool(session_pool, workers=4, cache=cache)
+
+    for i in range(10):
+        await pool.submit(IngestRecord(9007, i, "текст сообщения"))
+
+    assert sorted(pool.stats()["queue_depths"]) == [0, 0, 0, 10]
+    assert pool.max_depth == 10
+
+
+def test_unknown_overflow_policy(session_pool):
+    with pytest.raises(ValueError):
+        IngestPool(session_pool, overflow="ignore")
+
+
+# ---------- edits ----------
+
+async def ingest_all(session_pool, cache, *records):
+    pool = IngestPool(session_pool, workers=1, batch_size=1000, flush_interval_ms=10_000, cache=cache)
+    await pool.start()
+    for record in records:
+        await pool.submit(record)
+    await pool.stop()
+    return pool
+
+
+async def hashtags_of(session_pool, chat_id):
+    async with session_pool() as session:
+        result = await session.execute(
+            select(Hashtag.hashtag, Hashtag.is_checked).where(Hashtag.chat_id == chat_id).order_by(Hashtag.hashtag)
+        )
+        return result.all()
+
+
+@pytest.mark.asyncio
+async def test_unchanged_edit_is_skipped(session_pool, cache):
+    await ingest_all(session_pool, cache, IngestRecord(9011, 1, "текст #a", hashtags=("#a",)))
+    async with session_pool() as session:
+        await session.execute(update(Hashtag).where(Hashtag.chat_id == 9011).values(is_checked=True))
+        await session.commit()
+
+    pool = await ingest_all(session_pool, cache, IngestRecord(9011, 1, "текст #a", hashtags=("#a",), edited=True))
+
+    assert pool.edits_skipped == 1
+    assert pool.rows_written == 0
+    assert await hashtags_of(session_pool, 9011) == [("#a", True)]
+
+
+@pytest.mark.asyncio
+async def test_changed_edit_replaces_entities(session_pool, cache):
+    await ingest_all(session_pool, cache, IngestRecord(9012, 1, "текст #a #b", hashtags=("#a", "#b")))
+    async with session_pool() as session:
+        await session.execute(update(Hashtag).where(Hashtag.chat_id == 9012).values(is_checked=True))
+        await session.commit()
+
+    pool = await ingest_all(
+        session_pool, cache,
+        IngestRecord(9012, 1, "текст #b #c", hashtags=("#b", "#c"), edited=True),
+    )
+
+    assert pool.edits_replaced == 1
+    assert await hashtags_of(session_pool, 9012) == [("#b", False), ("#c", False)]
+    async with session_pool() as session:
+        text = await session.scalar(select(ChatMessage.text).where(ChatMessage.chat_id == 9012))
+    assert text == "текст #b #c"
+
+
+@pytest.mark.asyncio
+async def test_edit_removing_entities_deletes_message(session_pool, cache):
+    await ingest_all(session_pool, cache, IngestRecord(9013, 1, "текст #a", hashtags=("#a",)))
+    await ingest_all(session_pool, cache, IngestRecord(9013, 1, "просто текст", edited=True))
+
+    assert await count_rows(session_pool, Hashtag, 9013) == 0
+    assert await count_rows(session_pool, ChatMessage, 9013) == 0
+
+
+@pytest.mark.asyncio
+async def test_edit_to_short_text_removes_items(session_pool, cache):
+    await ingest_all(session_pool, cache, IngestRecord(9016, 1, "надо сделать отчет #x", hashtags=("#x",)))
+    assert await count_rows(session_pool, Task, 9016) == 1
+
+    pool = await ingest_all(session_pool, cache, IngestRecord(9016, 1, "ок", edited=True))
+
+    assert pool.edits_replaced == 1
+    assert await count_rows(session_pool, Task, 9016) == 0
+    assert await count_rows(session_pool, Hashtag, 9016) == 0
+    assert await count_rows(session_pool, ChatMessage, 9016) == 0
+
+
+@pytest.mark.asyncio
+async def test_last_version_in_batch_wins(session_pool, cache):
+    await ingest_all(
+        session_pool, cache,
+        IngestRecord(9014, 1, "текст #a", hashtags=("#a",)),
+        IngestRecord(9014, 1, "текст #b", hashtags=("#b",), edited=True),
+    )
+
+    assert await hashtags_of(session_pool, 9014) == [("#b", False)]
+
+
+@pytest.mark.asyncio
+async def test_repeated_entity_in_message_stored_once(session_pool, cache):
+    pool = await ingest_all(session_pool, cache, IngestRecord(9015, 1, "#a и снова #a", hashtags=("#a", "#a")))
+
+    assert pool.records_failed == 0
+    assert await count_rows(session_pool, Hashtag, 9015) == 1
+
+
+# ---------- overflow ----------
+
+@pytest.mark.asyncio
+async def test_block_policy_waits(session_pool, cache):
+    pool = IngestPool(session_pool, workers=1, max_queue_size=2, overflow="block", cache=cache)
+
+    assert await pool.submit(IngestRecord(9008, 1, "задание один"))
+    assert await pool.submit(IngestRecord(9008, 2, "задание два"))
+
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(pool.submit(IngestRecord(9008, 3, "задание три")), timeout=0.05)
+
+    await pool.start()
+    await pool.stop()
+    assert await count_rows(session_pool, Task, 9008) == 2
+
+
+@pytest.mark.asyncio
+async def test_drop_policy(session_pool, cache):
+    pool = IngestPool(session_pool, workers=1, max_queue_size=2, overflow="drop", cache=cache)
+
+    results = [await pool.submit(IngestRecord(9009, i, "задание")) for i in range(5)]
+
+    assert results == [True, True, False, False, False]
+    assert pool.stats()["dropped"] == 3
+    assert pool.stats()["depth"] == 2
+
+
+@pytest.mark.asyncio
+async def test_spill_policy_replays(session_pool, cache, tmp_path):
+    spill_path = str(tmp_path / "spill.jsonl")
+    pool = IngestPool(
+        session_pool, workers=1, max_queue_size=2, flush_interval_ms=10,
+        overflow="spill", spill_path=spill_path, cache=cache,
+    )
+
+    for i in range(5):
+        await pool.submit(IngestRecord(9010, i, "задание на неделю"))
+    assert pool.stats()["spilled"] == 3
+
+    # на старте спилл дочитывается в очередь
+    await pool.start()
+    for _ in range(100):
+        if pool.replayed == 3:
+            break
+        await asyncio.sleep(0.01)
+    await pool.stop()
+
+    assert pool.replayed == 3
+    assert await count_rows(session_pool, Task, 9010) == 5
+    assert not (tmp_path / "spill.jsonl").exists()
+
+
+@pytest.mark.asyncio
+async def test_spill_file_per_shard(session_pool, cache, tmp_path):
+    spill_path = str(tmp_path / "spill.jsonl")
+    pool = IngestPool(session_pool, workers=1, overflow="spill", spill_path=spill_path, cache=cache)
+
+    await pool.start(shard_index=1)
+    await pool.stop()
+
+    assert pool.spill_path == spill_path + ".1"
+
+
+@pytest.mark.asyncio
+async def test_replay_loop_survives_errors(session_pool, cache, tmp_path):
+    spill_path = tmp_path / "spill.jsonl"
+    spill_path.write_text("")
+    pool = IngestPool(session_pool, workers=1, overflow="spill", spill_path=str(spill_path), cache=cache)
+    calls = []
+
+    async def replay_spill():
+        calls.append(1)
+        # файл забрал другой процесс между проверкой и чтением
+        raise FileNotFoundError(str(spill_path))
+
+    pool.replay_spill = replay_spill
+    loop = asyncio.create_task(pool._replay_loop(interval=0.01))
+    for _ in range(100):
+        if len(calls) >= 2:
+            break
+        await asyncio.sleep(0.01)
+    loop.cancel()
+
+    assert len(calls) >= 2
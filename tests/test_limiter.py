@@ -0,0 +1,85 @@
+import asyncio
+import time
+import pytest
+
+from ml.limiter import RateLimiter, current_lane, llm_lane
+
+
+@pytest.mark.asyncio
+async def test_interactive_lane_goes_first():
+    limiter = RateLimiter(concurrency=1)
+    order = []
+
+    async def request(name, lane):
+        async with limiter.slot(10, lane):
+            order.append(name)
+
+    await limiter.acquire(10, "interactive")
+    waiting = [
+        asyncio.create_task(request("фон", "background")),
+        asyncio.create_task(request("расписание", "scheduled")),
+        asyncio.create_task(request("команда", "interactive")),
+    ]
+    await asyncio.sleep(0)
+    assert limiter.stats()["waiting"] == 3
+    assert limiter.stats()["background_waiting"] == 1
+
+    limiter.release()
+    await asyncio.gather(*waiting)
+
+    assert order == ["команда", "расписание", "фон"]
+    stats = limiter.stats()
+    assert (stats["in_flight"], stats["waiting"], stats["interactive_acquired"]) == (0, 0, 2)
+    assert stats["background_wait_seconds_max"] > 0
+
+
+@pytest.mark.asyncio
+async def test_request_and_token_buckets():
+    # 600 запросов и 6000 токенов в минуту: 10 запросов и 100 токенов в секунду
+    limiter = RateLimiter(concurrency=10, requests_per_minute=600, tokens_per_minute=6000)
+    limiter.requests, limiter.tokens = 0, 6000
+
+    start = time.monotonic()
+    async with limiter.slot(10):
+        pass
+    assert time.monotonic() - start >= 0.09
+
+    limiter.requests, limiter.tokens = 600, 0
+    start = time.monotonic()
+    async with limiter.slot(10):
+        pass
+    assert time.monotonic() - start >= 0.09
+    assert limiter.stats()["background_acquired"] == 2
+
+
+@pytest.mark.asyncio
+async def test_request_larger_than_token_limit():
+    limiter = RateLimiter(concurrency=1, tokens_per_minute=100)
+
+    # больше минутного лимита: ждёт полную корзину, а не вечно
+    await asyncio.wait_for(limiter.acquire(500), timeout=1)
+    assert limiter.tokens == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_queue():
+    limiter = RateLimiter(concurrency=1)
+    await limiter.acquire(1)
+
+    cancelled = asyncio.create_task(limiter.acquire(1, "interactive"))
+    waiting = asyncio.create_task(limiter.acquire(1, "background"))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await asyncio.sleep(0)
+    assert limiter.stats()["waiting"] == 1
+
+    limiter.release()
+    await asyncio.wait_for(waiting, timeout=1)
+    assert limiter.stats()["interactive_acquired"] == 0
+
+
+def test_lane_context():
+    assert current_lane.get() == "background"
+    with llm_lane("interactive"):
+        assert current_lane.get() == "interactive"
+    assert current_lane.get() == "background"
@@ -21,17 +21,14 @@ async def fake_process_items_pipeline(all_items, item_type, model_class):
 
 
 @pytest.mark.asyncio
-async def test_get_mentions_handler_with_mentions(mock_message, monkeypatch):
+async def test_get_mentions_handler_with_mentions(mock_message, monkeypatch, daily_items):
     fake_mentions = [
         SimpleNamespace(message_id=1, mention="@user1", about="Тема 1", context=None),
         SimpleNamespace(message_id=2, mention="@user2", about=None, context="Тема 2")
     ]
 
-    async def fake_get_daily_mentions(chat_id: int):
-        return fake_mentions
-
-    monkeypatch.setattr("src.mentions.handlers.get_daily_mentions", fake_get_daily_mentions)
-    monkeypatch.setattr("src.mentions.handlers.process_items_pipeline", fake_process_items_pipeline)
+    daily_items("src.mentions.handlers", fake_mentions)
+    monkeypatch.setattr("ml.services.process_items_pipeline", fake_process_items_pipeline)
 
     await get_mentions_handler(mock_message)
 
@@ -46,11 +43,8 @@ async def test_get_mentions_handler_with_mentions(mock_message, monkeypatch):
 
 
 @pytest.mark.asyncio
-async def test_get_mentions_handler_no_mentions(mock_message, monkeypatch):
-    async def empty_mentions(chat_id: int):
-        return []
-
-    monkeypatch.setattr("src.mentions.handlers.get_daily_mentions", empty_mentions)
+async def test_get_mentions_handler_no_mentions(mock_message, daily_items):
+    daily_items("src.mentions.handlers", [])
 
     await get_mentions_handler(mock_message)
 
@@ -59,17 +53,14 @@ async def test_get_mentions_handler_no_mentions(mock_message, monkeypatch):
 
 
 @pytest.mark.asyncio
-async def test_get_hashtags_handler_with_hashtags(mock_message, monkeypatch):
+async def test_get_hashtags_handler_with_hashtags(mock_message, monkeypatch, daily_items):
     fake_hashtags = [
         SimpleNamespace(message_id=10, hashtag="#отчет", about="Работа сделана", context=None),
         SimpleNamespace(message_id=20, hashtag="#важно", about=None, context="Срочный апдейт")
     ]
 
-    async def fake_get_daily_hashtags(chat_id: int):
-        return fake_hashtags
-
-    monkeypatch.setattr("src.hashtags.handlers.get_daily_hashtags", fake_get_daily_hashtags)
-    monkeypatch.setattr("src.hashtags.handlers.process_items_pipeline", fake_process_items_pipeline)
+    daily_items("src.hashtags.handlers", fake_hashtags)
+    monkeypatch.setattr("ml.services.process_items_pipeline", fake_process_items_pipeline)
 
     await get_hashtags_handler(mock_message)
 
@@ -85,11 +76,8 @@ async def test_get_hashtags_handler_with_hashtags(mock_message, monkeypatch):
 
 
 @pytest.mark.asyncio
-async def test_get_hashtags_handler_no_hashtags(mock_message, monkeypatch):
-    async def empty_hashtags(chat_id: int):
-        return []
-
-    monkeypatch.setattr("src.hashtags.handlers.get_daily_hashtags", empty_hashtags)
+async def test_get_hashtags_handler_no_hashtags(mock_message, daily_items):
+    daily_items("src.hashtags.handlers", [])
 
     await get_hashtags_handler(mock_message)
 
@@ -97,16 +85,13 @@ async def test_get_hashtags_handler_no_hashtags(mock_message, monkeypatch):
 
 
 @pytest.mark.asyncio
-async def test_get_hashtags_handler_special_chars(mock_message, monkeypatch):
+async def test_get_hashtags_handler_special_chars(mock_message, monkeypatch, daily_items):
     fake_hashtags = [
         SimpleNamespace(message_id=1, hashtag="#тест", about="Запрос <script>", context=None)
     ]
 
-    async def fake_get_daily_hashtags(chat_id: int):
-        return fake_hashtags
-
-    monkeypatch.setattr("src.hashtags.handlers.get_daily_hashtags", fake_get_daily_hashtags)
-    monkeypatch.setattr("src.hashtags.handlers.process_items_pipeline", fake_process_items_pipeline)
+    daily_items("src.hashtags.handlers", fake_hashtags)
+    monkeypatch.setattr("ml.services.process_items_pipeline", fake_process_items_pipeline)
 
     await get_hashtags_handler(mock_message)
 
@@ -117,15 +102,12 @@ async def test_get_hashtags_handler_special_chars(mock_message, monkeypatch):
 
 
 @pytest.mark.asyncio
-async def test_get_mentions_handler_pipeline_error(mock_message, monkeypatch):
-    async def fake_get_daily_mentions(chat_id: int):
-        return [SimpleNamespace(message_id=1, mention="@u", about="x", context="y")]
-
+async def test_get_mentions_handler_pipeline_error(mock_message, monkeypatch, daily_items):
     async def fake_pipeline_error(all_items, item_type, model_class):
         return None
 
-    monkeypatch.setattr("src.mentions.handlers.get_daily_mentions", fake_get_daily_mentions)
-    monkeypatch.setattr("src.mentions.handlers.process_items_pipeline", fake_pipeline_error)
+    daily_items("src.mentions.handlers", [SimpleNamespace(message_id=1, mention="@u", about="x", context="y")])
+    monkeypatch.setattr("ml.services.process_items_pipeline", fake_pipeline_error)
 
     await get_mentions_handler(mock_message)
 
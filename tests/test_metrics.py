@@ -0,0 +1,70 @@
+import asyncio
+import pytest
+import pytest_asyncio
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from database.pool import TimedQueuePool, pool_stats
+from utils.metrics import MetricsRegistry
+
+
+def test_render():
+    metrics = MetricsRegistry()
+    metrics.register("ingest", lambda: {"depth": 2, "queue_depths": [1, 1], "hit_rate": 0.5, "mode": "spill"})
+
+    assert metrics.render().splitlines() == [
+        "bot_ingest_depth 2.0",
+        'bot_ingest_queue_depths{index="0"} 1.0',
+        'bot_ingest_queue_depths{index="1"} 1.0',
+        "bot_ingest_hit_rate 0.5",
+    ]
+
+
+def test_broken_source_skipped():
+    metrics = MetricsRegistry()
+    metrics.register("broken", lambda: 1 / 0)
+    metrics.register("ok", lambda: {"value": 1})
+
+    assert metrics.render() == "bot_ok_value 1.0\n"
+
+
+@pytest_asyncio.fixture
+async def engine(tmp_path):
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+        poolclass=TimedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.1,
+    )
+    yield engine
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_pool_wait_is_measured(engine):
+    held = await engine.connect()
+
+    async def release():
+        await asyncio.sleep(0.05)
+        await held.close()
+
+    release_task = asyncio.create_task(release())
+    async with engine.connect():
+        stats = pool_stats(engine.pool)
+        assert stats["checked_out"] == 1
+    await release_task
+
+    stats = pool_stats(engine.pool)
+    assert stats["waits"] == 2
+    assert stats["wait_seconds_max"] >= 0.04
+    assert stats["timeouts"] == 0
+
+
+@pytest.mark.asyncio
+async def test_pool_timeout_is_counted(engine):
+    async with engine.connect():
+        with pytest.raises(PoolTimeoutError):
+            await engine.connect()
+
+    assert pool_stats(engine.pool)["timeouts"] == 1
@@ -1,9 +1,13 @@
 import pytest
+from datetime import datetime, timezone
 from unittest.mock import AsyncMock
 from types import SimpleNamespace
 
 from aiogram.types import Message
-from middlewares.middleware import CollectorMiddleware
+from middlewares.middleware import CollectorMiddleware, LlmLaneMiddleware
+from ml.limiter import current_lane
+from database.cache import ChatState, ChatStateCache
+from database.ingest import IngestRecord
 
 
 # ---------- helpers ----------
@@ -16,6 +20,8 @@ def make_message(
     document=None,
     entities=None,
     caption_entities=None,
+    edit_date=None,
+    date=None,
 ):
     msg = AsyncMock(spec=Message)
     msg.text = text
@@ -25,6 +31,8 @@ def make_message(
     msg.document = document
     msg.entities = entities
     msg.caption_entities = caption_entities
+    msg.edit_date = edit_date
+    msg.date = date
     return msg
 
 
@@ -36,27 +44,20 @@ def handler():
 
 
 @pytest.fixture
-def session():
-    session = AsyncMock()
+def ingest():
+    ingest = AsyncMock()
+    ingest.submit = AsyncMock(return_value=True)
+    return ingest
 
-    session.add = AsyncMock()
-    session.commit = AsyncMock()
-    session.rollback = AsyncMock()
 
-    chat = SimpleNamespace(chat_id=123, is_active=True)
-
-    result = SimpleNamespace(
-        scalar_one_or_none=lambda: chat
-    )
-
-    session.execute = AsyncMock(return_value=result)
-
-    return session
+@pytest.fixture
+def middleware(ingest):
+    return CollectorMiddleware(ingest, cache=ChatStateCache())
 
 
-@pytest.fixture
-def middleware():
-    return CollectorMiddleware()
+def submitted(ingest) -> IngestRecord:
+    ingest.submit.assert_called_once()
+    return ingest.submit.call_args.args[0]
 
 
 # ---------- early exits ----------
@@ -68,65 +69,66 @@ async def test_skip_non_message(middleware, handler):
 
 
 @pytest.mark.asyncio
-async def test_skip_without_session(middleware, handler):
-    msg = make_message()
+async def test_works_without_session(middleware, handler, ingest):
+    msg = make_message(text="надо сделать отчет")
     await middleware(handler, msg, {})
+
+    ingest.submit.assert_called_once()
     handler.assert_called_once()
 
 
 @pytest.mark.asyncio
-async def test_skip_command_message(middleware, handler, session):
+async def test_skip_command_message(middleware, handler, ingest):
     msg = make_message(text="/start")
-    await middleware(handler, msg, {"session": session})
+    await middleware(handler, msg, {})
 
-    session.add.assert_not_called()
-    session.commit.assert_not_called()
+    ingest.submit.assert_not_called()
     handler.assert_called_once()
 
 
 @pytest.mark.asyncio
-async def test_skip_inactive_chat(middleware, handler, session):
-    session.execute.return_value = SimpleNamespace(
-        scalar_one_or_none=lambda: SimpleNamespace(is_active=False)
-    )
+async def test_skip_known_inactive_chat(middleware, handler, ingest):
+    middleware.cache.set(123, ChatState(is_active=False))
 
-    msg = make_message(text="обычный текст")
-    await middleware(handler, msg, {"session": session})
+    msg = make_message(text="надо сделать отчет")
+    await middleware(handler, msg, {})
 
-    session.add.assert_not_called()
-    session.commit.assert_not_called()
+    ingest.submit.assert_not_called()
     handler.assert_called_once()
 
 
 @pytest.mark.asyncio
-async def test_skip_chat_not_found(middleware, handler, session):
-    session.execute.return_value = SimpleNamespace(
-        scalar_one_or_none=lambda: None
-    )
-
+async def test_unknown_chat_goes_to_workers(middleware, handler, ingest):
     msg = make_message(text="обычный текст")
-    await middleware(handler, msg, {"session": session})
+    await middleware(handler, msg, {})
 
-    session.add.assert_not_called()
-    session.commit.assert_not_called()
-    handler.assert_called_once()
+    ingest.submit.assert_called_once()
+    # peek не портит статистику кэша, её ведут воркеры
+    assert middleware.cache.stats()["misses"] == 0
+
+
+@pytest.mark.asyncio
+async def test_short_plain_text_skipped(middleware, handler, ingest):
+    msg = make_message(text="ок")
+    await middleware(handler, msg, {})
+
+    ingest.submit.assert_not_called()
 
 
 # ---------- collecting ----------
 
 @pytest.mark.asyncio
-async def test_document_collected(middleware, handler, session):
+async def test_document_collected(middleware, handler, ingest):
     document = SimpleNamespace(file_name="file.pdf", file_id="123")
 
-    msg = make_message(text="описание", document=document)
-    await middleware(handler, msg, {"session": session})
+    msg = make_message(text="", document=document)
+    await middleware(handler, msg, {})
 
-    session.add.assert_called()
-    session.commit.assert_called_once()
+    assert submitted(ingest).document == ("123", "file.pdf")
 
 
 @pytest.mark.asyncio
-async def test_hashtag_collected(middleware, handler, session):
+async def test_hashtag_collected(middleware, handler, ingest):
     entity = SimpleNamespace(
         type="hashtag",
         extract_from=lambda text: "#test"
@@ -137,32 +139,30 @@ async def test_hashtag_collected(middleware, handler, session):
         entities=[entity]
     )
 
-    await middleware(handler, msg, {"session": session})
+    await middleware(handler, msg, {})
 
-    session.add.assert_called()
-    session.commit.assert_called_once()
+    assert submitted(ingest).hashtags == ("#test",)
 
 
 @pytest.mark.asyncio
-async def test_link_collected(middleware, handler, session):
-    entity = SimpleNamespace(
-        type="url",
-        extract_from=lambda text: "https://example.com"
-    )
+async def test_link_collected(middleware, handler, ingest):
+    entities = [
+        SimpleNamespace(type="url", extract_from=lambda text: "https://example.com"),
+        SimpleNamespace(type="text_link", url="https://docs.example.com", extract_from=lambda text: "тут"),
+    ]
 
     msg = make_message(
-        text="https://example.com",
-        entities=[entity]
+        text="https://example.com тут",
+        entities=entities
     )
 
-    await middleware(handler, msg, {"session": session})
+    await middleware(handler, msg, {})
 
-    session.add.assert_called()
-    session.commit.assert_called_once()
+    assert submitted(ingest).links == ("https://example.com", "https://docs.example.com")
 
 
 @pytest.mark.asyncio
-async def test_mention_collected(middleware, handler, session):
+async def test_mention_collected(middleware, handler, ingest):
     entity = SimpleNamespace(
         type="mention",
         extract_from=lambda text: "@user"
@@ -173,48 +173,74 @@ async def test_mention_collected(middleware, handler, session):
         entities=[entity]
     )
 
-    await middleware(handler, msg, {"session": session})
+    await middleware(handler, msg, {})
+
+    assert submitted(ingest).mentions == ("@user",)
+
 
-    session.add.assert_called()
-    session.commit.assert_called_once()
+@pytest.mark.asyncio
+async def test_record_fields(middleware, handler, ingest):
+    msg = make_message(text="надо сделать отчет", chat_id=55, message_id=7)
+    await middleware(handler, msg, {})
+
+    assert submitted(ingest) == IngestRecord(chat_id=55, message_id=7, text="надо сделать отчет")
+
+
+@pytest.mark.asyncio
+async def test_edit_marked(middleware, handler, ingest):
+    msg = make_message(text="надо сделать отчет", edit_date=1700000000)
+    await middleware(handler, msg, {})
 
+    assert submitted(ingest).edited is True
 
-# ---------- tasks ----------
 
 @pytest.mark.asyncio
-async def test_task_created_from_keywords(middleware, handler, session):
-    msg = make_message(text="надо сделать домашку")
-    await middleware(handler, msg, {"session": session})
+@pytest.mark.parametrize("text", ["ок", "/summary"])
+async def test_edit_without_entities_submitted(middleware, handler, ingest, text):
+    msg = make_message(text=text, edit_date=1700000000)
+    await middleware(handler, msg, {})
 
-    session.add.assert_called()
-    session.commit.assert_called_once()
+    record = submitted(ingest)
+    assert (record.text, record.edited, record.hashtags) == (text, True, ())
+    handler.assert_called_once()
 
 
 @pytest.mark.asyncio
-async def test_short_text_not_task(middleware, handler, session):
-    msg = make_message(text="надо")
-    await middleware(handler, msg, {"session": session})
+async def test_message_date_is_local_naive(middleware, handler, ingest):
+    sent = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+    msg = make_message(text="надо сделать отчет", date=sent)
+    await middleware(handler, msg, {})
 
-    session.add.assert_not_called()
-    session.commit.assert_called_once()
+    date = submitted(ingest).date
+    assert date.tzinfo is None
+    assert date == sent.astimezone().replace(tzinfo=None)
 
 
-# ---------- transactions ----------
+# ---------- ingest ----------
 
 @pytest.mark.asyncio
-async def test_commit_error_rollbacks(middleware, handler, session):
-    session.commit.side_effect = Exception("DB error")
+async def test_submit_error_propagates(middleware, handler, ingest):
+    ingest.submit.side_effect = RuntimeError("queue closed")
 
     msg = make_message(text="надо сделать отчет")
-    await middleware(handler, msg, {"session": session})
-
-    session.rollback.assert_called_once()
-    handler.assert_called_once()
+    with pytest.raises(RuntimeError):
+        await middleware(handler, msg, {})
 
 
 @pytest.mark.asyncio
-async def test_handler_always_called(middleware, handler, session):
+async def test_handler_always_called(middleware, handler, ingest):
+    ingest.submit.return_value = False
+
     msg = make_message(text="обычный текст")
-    await middleware(handler, msg, {"session": session})
+    await middleware(handler, msg, {})
 
     handler.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_llm_lane_for_handlers():
+    async def handler(event, data):
+        return current_lane.get()
+
+    assert await LlmLaneMiddleware()(handler, object(), {}) == "interactive"
+    assert current_lane.get() == "background"
@@ -0,0 +1,159 @@
+import datetime
+import pytest
+import pytest_asyncio
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from database.migrations import load_migrations, migrate, schema_version
+from database.migrations.utils import column_names, has_unique, table_names
+from database.models import ChatMessage, Document, Hashtag, Item, Link, Mention, Task, Verdict
+
+ENTITY_MODELS = [Mention, Hashtag, Document, Link, Task]
+
+# Схема до появления миграций: текст в context, без уникальных ограничений
+LEGACY_SCHEMA = [
+    "CREATE TABLE chats (id INTEGER PRIMARY KEY, chat_id BIGINT UNIQUE NOT NULL, title VARCHAR(255), "
+    "username VARCHAR(255), type VARCHAR(50) NOT NULL, is_active BOOLEAN, created_at DATETIME, "
+    "is_auto_summary BOOLEAN, summary_time VARCHAR(5), include_tasks BOOLEAN, include_links BOOLEAN, "
+    "include_docs BOOLEAN, include_mentions BOOLEAN, include_hashtags BOOLEAN)",
+    "CREATE TABLE hashtags (id INTEGER PRIMARY KEY, chat_id BIGINT NOT NULL, message_id BIGINT NOT NULL, "
+    "hashtag VARCHAR(50) NOT NULL, context TEXT, is_checked BOOLEAN, is_important BOOLEAN, "
+    "about TEXT, created_at DATETIME)",
+    "INSERT INTO hashtags (chat_id, message_id, hashtag, context, created_at) VALUES "
+    "(1, 1, '#a', 'текст #a', '2026-01-01 10:00:00'), (1, 1, '#a', 'текст #a', '2026-01-01 09:00:00'), "
+    "(1, 2, '#b', 'ещё #b', '2026-01-02 10:00:00')",
+]
+
+# Прежние таблицы ссылок и документов с уже разобранными ML строками
+LEGACY_ENTITIES = [
+    "CREATE TABLE links (id INTEGER PRIMARY KEY, chat_id BIGINT NOT NULL, message_id BIGINT NOT NULL, "
+    "url TEXT NOT NULL, context TEXT, is_checked BOOLEAN, is_important BOOLEAN, about TEXT, created_at DATETIME)",
+    "CREATE TABLE documents (id INTEGER PRIMARY KEY, chat_id BIGINT NOT NULL, message_id BIGINT NOT NULL, "
+    "file_id VARCHAR(255) NOT NULL, document_name VARCHAR(255) NOT NULL, context TEXT, is_checked BOOLEAN, "
+    "is_important BOOLEAN, about TEXT, created_at DATETIME)",
+    "INSERT INTO links (chat_id, message_id, url, context, is_checked, is_important, about, created_at) VALUES "
+    "(1, 5, 'https://b', 'две ссылки', 1, 1, 'лекция', '2026-01-01 10:00:00'), "
+    "(1, 5, 'https://a', 'две ссылки', 1, 0, NULL, '2026-01-01 10:00:00'), "
+    "(1, 6, 'https://c', 'ещё ссылка', NULL, NULL, NULL, NULL)",
+    "INSERT INTO documents (chat_id, message_id, file_id, document_name, context) VALUES "
+    "(1, 7, 'file-1', 'lab1.pdf', 'лабораторная')",
+]
+
+
+@pytest_asyncio.fixture
+async def engine():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
+    yield engine
+    await engine.dispose()
+
+
+async def explain(conn, stmt) -> str:
+    compiled = stmt.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    result = await conn.exec_driver_sql("EXPLAIN QUERY PLAN " + str(compiled), params)
+    return " ".join(row[-1] for row in result)
+
+
+def test_versions_are_sequential():
+    assert [m.VERSION for m in load_migrations()] == list(range(1, len(load_migrations()) + 1))
+
+
+@pytest.mark.asyncio
+async def test_fresh_database(engine):
+    applied = await migrate(engine)
+    assert applied == [m.VERSION for m in load_migrations()]
+
+    async with engine.connect() as conn:
+        versions = (await conn.execute(select(schema_version.c.version))).scalars().all()
+        assert versions == applied
+        assert await has_unique(conn, "items", ["chat_id", "message_id", "kind", "position"])
+        assert not {"tags", "hashtags", "documents", "links", "tasks"} & await table_names(conn)
+
+    # повторный запуск ничего не делает
+    assert await migrate(engine) == []
+
+
+@pytest.mark.asyncio
+async def test_legacy_database_is_upgraded(engine):
+    async with engine.begin() as conn:
+        for statement in LEGACY_SCHEMA:
+            await conn.execute(text(statement))
+
+    await migrate(engine)
+
+    async with engine.connect() as conn:
+        assert "task_keywords" in await column_names(conn, "chats")
+        assert "hashtags" not in await table_names(conn)
+
+        items = (await conn.execute(text(
+            "SELECT kind, message_id, position, content FROM items ORDER BY message_id"
+        ))).all()
+        assert items == [("hashtag", 1, 0, "#a"), ("hashtag", 2, 0, "#b")]
+
+        messages = (await conn.execute(
+            select(ChatMessage.message_id, ChatMessage.text, ChatMessage.created_at).order_by(ChatMessage.message_id)
+        )).all()
+        # дата сообщения — самая ранняя из его сущностей, иначе строка выпала бы из срока хранения
+        assert messages == [
+            (1, "текст #a", datetime.datetime(2026, 1, 1, 9)), (2, "ещё #b", datetime.datetime(2026, 1, 2, 10)),
+        ]
+
+        indexes = (await conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))).scalars().all()
+        assert "ix_items_chat_created" in indexes
+        assert "ix_items_unchecked" in indexes
+
+
+@pytest.mark.asyncio
+async def test_legacy_entities_moved_to_items(engine):
+    async with engine.begin() as conn:
+        for statement in LEGACY_SCHEMA[:1] + LEGACY_ENTITIES:
+            await conn.execute(text(statement))
+
+    await migrate(engine)
+
+    async with engine.connect() as conn:
+        rows = (await conn.execute(
+            select(Item.kind, Item.message_id, Item.position, Item.content, Item.file_id,
+                   Item.is_checked, Item.is_important, Item.about)
+            .order_by(Item.message_id, Item.position)
+        )).all()
+        assert rows == [
+            ("link", 5, 0, "https://b", None, True, True, "лекция"),
+            ("link", 5, 1, "https://a", None, True, False, None),
+            ("link", 6, 0, "https://c", None, False, False, None),
+            ("document", 7, 0, "lab1.pdf", "file-1", False, False, None),
+        ]
+        # прежние имена полей работают через модели-наследники
+        urls = (await conn.execute(select(Link.url).where(Link.message_id == 5).order_by(Link.position))).scalars()
+        assert urls.all() == ["https://b", "https://a"]
+        created_at = await conn.scalar(select(Link.created_at).where(Link.message_id == 5).limit(1))
+        assert created_at == datetime.datetime(2026, 1, 1, 10)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("model", ENTITY_MODELS)
+async def test_daily_query_uses_index(engine, model):
+    await migrate(engine)
+    yesterday = datetime.datetime.now() - datetime.timedelta(days=1)
+    table = model.__tablename__
+
+    async with engine.connect() as conn:
+        plan = await explain(conn, select(model).where(model.chat_id == 1, model.created_at >= yesterday))
+        assert table == "items"
+        assert f"SEARCH {table} USING INDEX ix_{table}_chat_created (chat_id=? AND created_at>?)" in plan
+
+        plan = await explain(conn, select(model).where(
+            model.chat_id == 1, model.created_at >= yesterday, model.is_checked == False,  # noqa: E712
+        ))
+        assert f"SEARCH {table} USING INDEX ix_{table}_unchecked (chat_id=? AND created_at>?)" in plan
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("model", [Item, ChatMessage, Verdict])
+async def test_retention_scan_uses_index(engine, model):
+    await migrate(engine)
+    table = model.__tablename__
+
+    async with engine.connect() as conn:
+        plan = await explain(conn, select(model.id).where(model.created_at < datetime.datetime.now()).limit(10))
+        assert f"SEARCH {table} USING COVERING INDEX ix_{table}_created (created_at<?)" in plan
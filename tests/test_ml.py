@@ -0,0 +1,162 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+
+import ml.ml
+from ml.limiter import RateLimiter
+from ml.ml import CategoryAnalysis, CombinedAnalysis, analyze_categories, analyze_items, estimate_tokens, split_by_tokens
+
+
+def task(item_id, text):
+    return SimpleNamespace(id=item_id, task_name=text, context=text)
+
+
+def link(item_id, url):
+    return SimpleNamespace(id=item_id, url=url, context=None)
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(ml.ml, "ML_CHUNK_ITEMS", 2)
+    monkeypatch.setattr(ml.ml, "llm_limiter", RateLimiter(2))
+
+
+def test_split_by_tokens():
+    lines = {"a": "x" * 30, "b": "x" * 30, "c": "x" * 90, "d": "x", "e": "x", "f": "x"}
+    assert estimate_tokens("x" * 30) == 11
+
+    chunks = split_by_tokens(lines, max_tokens=25, max_items=2)
+
+    # c длиннее лимита и идёт отдельно, d-f режутся по числу строк
+    assert [list(chunk) for chunk in chunks] == [["a", "b"], ["c"], ["d", "e"], ["f"]]
+    assert split_by_tokens({}, max_tokens=25, max_items=2) == []
+
+
+@pytest.mark.asyncio
+async def test_chunks_merged(llm, small_chunks):
+    items = [task(i, f"лекция {i}" if i % 2 else f"мем {i}") for i in range(5)]
+
+    result = await analyze_items(items, "task")
+
+    assert len(llm.prompts) == 3
+    assert [item["original"].id for item in result] == [1, 3]
+
+
+@pytest.mark.asyncio
+async def test_chunks_run_concurrently_within_limit(llm, small_chunks):
+    running, peak = 0, 0
+    ainvoke = llm.ainvoke
+
+    async def slow(prompt):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+        return await ainvoke(prompt)
+
+    llm.ainvoke = slow
+    await analyze_items([task(i, f"лекция {i}") for i in range(12)], "task")
+
+    assert len(llm.prompts) == 6
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_chunk_keeps_others(llm, small_chunks):
+    ainvoke = llm.ainvoke
+
+    async def flaky(prompt):
+        if "ID: 2 " in prompt:
+            raise RuntimeError("timeout")
+        return await ainvoke(prompt)
+
+    llm.ainvoke = flaky
+    items = [task(i, f"лекция {i}") for i in range(5)]
+
+    result = await analyze_items(items, "task")
+
+    # чанк [2, 3] не разобран, остальные вердикты получены и закэшированы
+    assert [(item["original"].id, item.get("failed", False)) for item in result] == [
+        (0, False), (1, False), (2, True), (3, True), (4, False),
+    ]
+    assert ml.ml.verdict_cache.stats()["size"] == 3
+
+
+@pytest.mark.asyncio
+async def test_categories_in_one_request(llm):
+    result = await analyze_categories({
+        "task": [task(1, "лекция в 12"), task(2, "мем")],
+        "link": [link(3, "https://e.com/лекция")],
+        "mention": [],
+    })
+
+    assert len(llm.prompts) == 1
+    assert "### Раздел: task" in llm.prompts[0] and "### Раздел: link" in llm.prompts[0]
+    assert {kind: [item["original"].id for item in items] for kind, items in result.items()} == {
+        "task": [1], "link": [3], "mention": [],
+    }
+    assert ml.ml.verdict_cache.stats()["size"] == 3
+
+
+@pytest.mark.asyncio
+async def test_categories_fall_back_to_separate_requests(llm, small_chunks):
+    await analyze_items([link(3, "https://e.com/лекция")], "link")
+
+    # ссылка уже в кэше: общий запрос не нужен
+    await analyze_categories({"task": [task(1, "лекция")], "link": [link(4, "https://e.com/лекция")]})
+    # три строки не помещаются в один чанк из двух
+    await analyze_categories({"task": [task(6, "лекция 6"), task(7, "мем")], "doc": [SimpleNamespace(
+        id=5, document_name="лекция.pdf", context=None,
+    )]})
+
+    assert len(llm.prompts) == 4
+    assert not any("### Раздел: " in prompt for prompt in llm.prompts)
+
+
+@pytest.mark.asyncio
+async def test_combined_request_error(llm, monkeypatch):
+    async def broken(prompt):
+        raise RuntimeError("quota")
+
+    monkeypatch.setattr(llm, "ainvoke", broken)
+    result = await analyze_categories({"task": [task(1, "лекция")], "link": [link(3, "https://e.com/лекция")]})
+
+    assert result == {"task": None, "link": None}
+    assert ml.ml.verdict_cache.stats()["size"] == 0
+
+
+@pytest.mark.asyncio
+async def test_combined_answer_missing_category(llm):
+    ainvoke = llm.ainvoke
+
+    async def forgetful(prompt):
+        answer = await ainvoke(prompt)
+        if isinstance(answer, CombinedAnalysis):
+            answer.categories = [category for category in answer.categories if category.category != "link"]
+        return answer
+
+    llm.ainvoke = forgetful
+    result = await analyze_categories({"task": [task(1, "лекция")], "link": [link(3, "https://e.com/лекция")]})
+
+    # раздел ссылок пропущен: ссылки переспрашиваются отдельным запросом, а не считаются неважными
+    assert len(llm.prompts) == 2
+    assert "### Раздел: " not in llm.prompts[1] and "ID: 3 " in llm.prompts[1]
+    assert {kind: [item["original"].id for item in items] for kind, items in result.items()} == {
+        "task": [1], "link": [3],
+    }
+
+
+@pytest.mark.asyncio
+async def test_combined_answer_mislabeled_category(llm):
+    async def mislabeled(prompt):
+        llm.prompts.append(prompt)
+        # structured output проверяет ответ по схеме: чужой вид — ошибка разбора
+        return CombinedAnalysis(categories=[CategoryAnalysis(category="links", items=[])])
+
+    llm.ainvoke = mislabeled
+    result = await analyze_categories({"task": [task(1, "лекция")], "link": [link(3, "https://e.com/лекция")]})
+
+    # элементы остаются непроверенными, в кэш ничего не попадает
+    assert result == {"task": None, "link": None}
+    assert ml.ml.verdict_cache.stats()["size"] == 0
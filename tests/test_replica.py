@@ -0,0 +1,114 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+import database.crud as crud
+from database.migrations import migrate
+from database.models import Chat, Link
+from database.replica import ReplicaRouter, replica_lag
+from src.links.handlers import daily_links_query
+
+CHAT_ID = 800
+
+
+async def make_db(path, url):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", echo=False)
+    await migrate(engine)
+    pool = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with pool() as session:
+        session.add_all([Chat(chat_id=CHAT_ID, type="group"), Link(chat_id=CHAT_ID, message_id=1, url=url)])
+        await session.commit()
+    return engine, pool
+
+
+@pytest_asyncio.fixture
+async def databases(tmp_path, monkeypatch):
+    """
+    Основная БД и «реплика» — два файла SQLite с разными ссылками,
+    чтобы было видно, откуда пришло чтение.
+    """
+    primary_engine, primary = await make_db(tmp_path / "primary.db", "https://primary.example")
+    replica_engine, replica = await make_db(tmp_path / "replica.db", "https://replica.example")
+    monkeypatch.setattr("database.session.async_session", primary)
+    yield primary, replica
+    await primary_engine.dispose()
+    await replica_engine.dispose()
+
+
+def use_replica(monkeypatch, session_pool, **kwargs) -> ReplicaRouter:
+    router = ReplicaRouter(session_pool, **kwargs)
+    monkeypatch.setattr("database.session.replica", router)
+    return router
+
+
+async def get_daily_links(chat_id):
+    return [link async for chunk in crud.stream_records(daily_links_query(chat_id)) for link in chunk]
+
+
+def fixed_lag(seconds):
+    async def probe(session):
+        return seconds
+    return probe
+
+
+@pytest.mark.asyncio
+async def test_reads_go_to_replica(databases, monkeypatch):
+    _, replica = databases
+    router = use_replica(monkeypatch, replica)
+
+    links = await get_daily_links(CHAT_ID)
+    data = await crud.get_daily_data(CHAT_ID)
+
+    assert [link.url for link in links] == ["https://replica.example"]
+    assert [link.url for link in data["links"]] == ["https://replica.example"]
+    assert router.stats()["replica_reads"] == 2
+    assert router.lag == 0.0
+
+
+@pytest.mark.asyncio
+async def test_writes_stay_on_primary(databases, monkeypatch):
+    _, replica = databases
+    use_replica(monkeypatch, replica)
+
+    settings = await crud.get_chat_settings(CHAT_ID)
+    assert settings is not None
+
+    link = (await get_daily_links(CHAT_ID))[0]
+    await crud.save_analysis_results(Link, [{"id": link.id, "is_important": True}])
+
+    monkeypatch.setattr("database.session.replica", None)
+    assert (await get_daily_links(CHAT_ID))[0].is_checked is True
+
+
+@pytest.mark.asyncio
+async def test_lagging_replica_falls_back(databases, monkeypatch):
+    _, replica = databases
+    router = use_replica(monkeypatch, replica, max_lag=5, lag_probe=fixed_lag(30.0))
+
+    links = await get_daily_links(CHAT_ID)
+
+    assert [link.url for link in links] == ["https://primary.example"]
+    assert router.stats()["primary_reads"] == 1
+    assert router.stats()["lag_seconds"] == 30.0
+
+
+@pytest.mark.asyncio
+async def test_unreachable_replica_falls_back(databases, monkeypatch):
+    async def broken_probe(session):
+        raise ConnectionRefusedError("replica is down")
+
+    _, replica = databases
+    router = use_replica(monkeypatch, replica, check_interval=60, lag_probe=broken_probe)
+
+    assert [link.url for link in await get_daily_links(CHAT_ID)] == ["https://primary.example"]
+    assert [link.url for link in await get_daily_links(CHAT_ID)] == ["https://primary.example"]
+    # отставание перепроверяется не чаще check_interval
+    assert router.probe_errors == 1
+    assert router.stats()["lag_seconds"] == -1
+
+
+@pytest.mark.asyncio
+async def test_replica_lag_on_sqlite(databases):
+    _, replica = databases
+    async with replica() as session:
+        assert await replica_lag(session) == 0.0
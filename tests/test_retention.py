@@ -0,0 +1,143 @@
+import asyncio
+import pytest
+import pytest_asyncio
+from datetime import date, datetime, timedelta
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from sqlalchemy import func, select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from database.migrations import migrate
+from database.models import ChatMessage, Hashtag, Item, Task
+from database.retention import RetentionJob, drop_partitions, partition_day, partition_name
+
+NOW = datetime(2024, 6, 30, 12, 0)
+
+
+@pytest_asyncio.fixture
+async def engine():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
+    await migrate(engine)
+    yield engine
+    await engine.dispose()
+
+
+async def seed(engine, ages_days, now=NOW):
+    """
+    По сообщению с хэштегом и задачей на каждый возраст (в днях от now).
+    """
+    async with engine.begin() as conn:
+        for message_id, age in enumerate(ages_days):
+            created_at = now - timedelta(days=age)
+            common = dict(chat_id=1, message_id=message_id, created_at=created_at)
+            await conn.execute(ChatMessage.__table__.insert(), dict(common, text="надо сделать #тег"))
+            await conn.execute(Item.__table__.insert(), [
+                dict(common, kind="hashtag", content="#тег"),
+                dict(common, kind="task", content="надо сделать"),
+            ])
+
+
+async def count(engine, model):
+    async with engine.connect() as conn:
+        return await conn.scalar(select(func.count()).select_from(model))
+
+
+def test_partition_names():
+    assert partition_name("tags", date(2024, 6, 1)) == "tags_p20240601"
+    assert partition_day("tags", "tags_p20240601") == date(2024, 6, 1)
+    assert partition_day("tags", "tags_default") is None
+    assert partition_day("tags", "tasks_p20240601") is None
+
+
+def test_too_short_retention():
+    with pytest.raises(ValueError):
+        RetentionJob(None, retention_days=1)
+
+
+@pytest.mark.asyncio
+async def test_expired_rows_deleted(engine):
+    await seed(engine, [0, 1, 6, 8, 40])
+    job = RetentionJob(engine, retention_days=7, batch_size=2)
+
+    stats = await job.run_once(now=NOW)
+
+    assert stats["rows_deleted"] == 6  # сообщение, хэштег и задача для 8 и 40 дней
+    for model in (ChatMessage, Hashtag, Task):
+        assert await count(engine, model) == 3
+    assert job.stats()["runs"] == 1
+
+    # повторный проход ничего не находит
+    assert (await job.run_once(now=NOW))["rows_deleted"] == 0
+
+
+@pytest.mark.asyncio
+async def test_zero_retention_keeps_everything(engine):
+    await seed(engine, [0, 400])
+    job = RetentionJob(engine, retention_days=0)
+
+    assert await job.run_once(now=NOW) == {"partitions_created": 0, "partitions_dropped": 0, "rows_deleted": 0}
+    assert await count(engine, Task) == 2
+
+
+@pytest.mark.asyncio
+async def test_background_loop(engine):
+    await seed(engine, [0, 30], now=datetime.now())
+    job = RetentionJob(engine, retention_days=7, interval=3600)
+
+    await job.start()
+    for _ in range(100):
+        if job.runs:
+            break
+        await asyncio.sleep(0.01)
+    await job.stop()
+
+    assert job.runs == 1
+    assert await count(engine, Task) == 1
+
+
+@pytest.mark.asyncio
+async def test_only_first_shard_runs_retention(engine):
+    job = RetentionJob(engine, retention_days=7)
+
+    await job.start(shard_index=1)
+    assert job._task is None
+
+    await job.start(shard_index=0)
+    assert job._task is not None
+    await job.stop()
+
+
+class LockedConn:
+    """
+    Соединение Postgres, на котором DROP одной секции упирается в lock_timeout.
+    """
+
+    def __init__(self, partitions, locked):
+        self.partitions = partitions
+        self.locked = locked
+        self.dropped = []
+
+    @asynccontextmanager
+    async def begin_nested(self):
+        yield
+
+    async def execute(self, statement, params=None):
+        sql = str(statement)
+        if sql.startswith("DROP TABLE"):
+            name = sql.split()[-1]
+            if name == self.locked:
+                raise DBAPIError(sql, params, Exception("canceling statement due to lock timeout"))
+            self.dropped.append(name)
+        return SimpleNamespace(scalars=lambda: self.partitions)
+
+
+@pytest.mark.asyncio
+async def test_drop_partitions_skips_locked():
+    partitions = [partition_name("items", date(2024, 5, day)) for day in (1, 2, 3)] + ["items_default"]
+    conn = LockedConn(partitions, locked=partition_name("items", date(2024, 5, 2)))
+
+    dropped = await drop_partitions(conn, "items", datetime(2024, 5, 31))
+
+    assert dropped == 2
+    assert conn.dropped == ["items_p20240501", "items_p20240503"]
@@ -0,0 +1,170 @@
+import pytest
+import pytest_asyncio
+from contextlib import aclosing
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+import database.crud as crud
+from database.migrations import migrate
+from database.models import Chat, ChatMessage, Link, Task
+from ml.services import process_categories_stream, process_items_stream
+
+
+@pytest_asyncio.fixture
+async def db_session(tmp_path, monkeypatch):
+    """
+    Отдельная БД в файле: категории сводки обрабатываются параллельно,
+    и каждой нужно своё соединение.
+    """
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'services.db'}", echo=False)
+    await migrate(engine)
+    session_pool = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    monkeypatch.setattr("database.session.async_session", session_pool)
+    async with session_pool() as session:
+        yield session
+    await engine.dispose()
+
+
+@pytest.fixture(autouse=True)
+def per_category(monkeypatch):
+    """
+    ML подменяется через analyze_items: категории разбираются отдельными запросами.
+    """
+    monkeypatch.setattr("ml.services.ML_COMBINED", False)
+
+
+def fake_analyze(important_ids, calls=None):
+    """
+    ML: важны элементы с message_id из important_ids.
+    """
+    async def analyze_items(items, item_type):
+        if calls is not None:
+            calls.append([item.message_id for item in items])
+        return [
+            {"original": item, "about": f"{item_type} {item.message_id}"}
+            for item in items if item.message_id in important_ids
+        ]
+    return analyze_items
+
+
+async def add_links(db_session, chat_id, count):
+    db_session.add_all([
+        *(ChatMessage(chat_id=chat_id, message_id=i, text=f"смотрите {i}") for i in range(count)),
+        *(Link(chat_id=chat_id, message_id=i, url=f"https://example.com/{i}") for i in range(count)),
+    ])
+    await db_session.commit()
+
+
+@pytest.mark.asyncio
+async def test_process_items_stream(db_session, monkeypatch):
+    await add_links(db_session, 730, 5)
+    calls = []
+    monkeypatch.setattr("ml.services.analyze_items", fake_analyze({1, 4}, calls))
+
+    query = select(Link).where(Link.chat_id == 730).order_by(Link.message_id)
+    shown = await process_items_stream(crud.stream_scalars(query, chunk_size=2), "link", Link)
+
+    # в ML уходит каждая пачка отдельно, наружу — только важные
+    assert calls == [[0, 1], [2, 3], [4]]
+    assert [(link.message_id, link.about) for link in shown] == [(1, "link 1"), (4, "link 4")]
+    assert shown[0].context == "смотрите 1"
+
+    db_session.expunge_all()
+    rows = (await db_session.execute(
+        select(Link.is_checked, Link.is_important).where(Link.chat_id == 730).order_by(Link.message_id)
+    )).all()
+    assert rows == [(True, False), (True, True), (True, False), (True, False), (True, True)]
+
+
+@pytest.mark.asyncio
+async def test_failed_items_stay_unchecked(db_session, monkeypatch):
+    await add_links(db_session, 733, 3)
+
+    async def analyze_items(items, item_type):
+        return [
+            {"original": item, "failed": True} if item.message_id == 2 else {"original": item, "about": "важно"}
+            for item in items if item.message_id != 0
+        ]
+
+    monkeypatch.setattr("ml.services.analyze_items", analyze_items)
+    query = select(Link).where(Link.chat_id == 733).order_by(Link.message_id)
+    incomplete = set()
+    shown = await process_items_stream(crud.stream_scalars(query, chunk_size=10), "link", Link, incomplete)
+
+    assert [link.message_id for link in shown] == [1]
+    assert incomplete == {"link"}
+    db_session.expunge_all()
+    rows = (await db_session.execute(
+        select(Link.is_checked, Link.is_important).where(Link.chat_id == 733).order_by(Link.message_id)
+    )).all()
+    assert rows == [(True, False), (True, True), (False, False)]
+
+
+@pytest.mark.asyncio
+async def test_process_items_stream_error_stops_reading(db_session, monkeypatch):
+    await add_links(db_session, 731, 5)
+    read = []
+
+    async def analyze_items(items, item_type):
+        return None
+
+    async def chunks():
+        async with aclosing(crud.stream_scalars(select(Link).where(Link.chat_id == 731), chunk_size=2)) as stream:
+            async for chunk in stream:
+                read.append(len(chunk))
+                yield chunk
+
+    monkeypatch.setattr("ml.services.analyze_items", analyze_items)
+
+    assert await process_items_stream(chunks(), "link", Link) is None
+    assert read == [2]
+
+
+@pytest.mark.asyncio
+async def test_process_categories_stream(db_session, monkeypatch):
+    db_session.add_all([
+        Chat(chat_id=732, type="group"),
+        *(Task(chat_id=732, message_id=i, task_name=f"надо сделать {i}") for i in range(3)),
+        Link(chat_id=732, message_id=10, url="https://example.com"),
+    ])
+    await db_session.commit()
+
+    async def analyze_items(items, item_type):
+        if item_type == "link":
+            return None
+        return await fake_analyze({2})(items, item_type)
+
+    monkeypatch.setattr("ml.services.analyze_items", analyze_items)
+
+    results = await process_categories_stream(
+        crud.stream_daily_data(732, chunk_size=2),
+        {"tasks": ("task", Task), "links": ("link", Link), "mentions": ("mention", None)},
+    )
+
+    # упоминаний не было — категории нет; ошибка ML по ссылкам не мешает задачам
+    assert set(results) == {"tasks", "links"}
+    assert [task.about for task in results["tasks"]] == ["task 2"]
+    assert results["links"] is None
+
+
+@pytest.mark.asyncio
+async def test_process_categories_stream_combined(db_session, monkeypatch, llm):
+    monkeypatch.setattr("ml.services.ML_COMBINED", True)
+    db_session.add_all([
+        Chat(chat_id=734, type="group"),
+        Task(chat_id=734, message_id=1, task_name="лекция в 12"),
+        Task(chat_id=734, message_id=2, task_name="мем"),
+        Link(chat_id=734, message_id=3, url="https://example.com/лекция"),
+    ])
+    await db_session.commit()
+
+    results = await process_categories_stream(
+        crud.stream_daily_data(734), {"tasks": ("task", Task), "links": ("link", Link)},
+    )
+
+    # обе категории разобраны одним запросом и отмечены в БД
+    assert len(llm.prompts) == 1
+    assert [task.about for task in results["tasks"]] == ["о лекция в 12"]
+    assert [link.about for link in results["links"]] == ["о https://example.com/лекция"]
+    checked = await db_session.scalars(select(Task.is_checked).where(Task.chat_id == 734))
+    assert list(checked) == [True, True]
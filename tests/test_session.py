@@ -0,0 +1,133 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+
+import database.crud as crud
+from database.session import LazySession, current_session, release_session, session_scope
+from middlewares.middleware import DbSessionMiddleware
+
+
+@pytest.fixture
+def session_pool(test_engine, monkeypatch):
+    pool = async_sessionmaker(bind=test_engine, class_=AsyncSession, expire_on_commit=False)
+    monkeypatch.setattr("database.session.async_session", pool)
+    return pool
+
+
+@pytest.fixture
+def checkouts(test_engine):
+    counter = {"n": 0}
+
+    def on_checkout(*args):
+        counter["n"] += 1
+
+    event.listen(test_engine.sync_engine, "checkout", on_checkout)
+    yield counter
+    event.remove(test_engine.sync_engine, "checkout", on_checkout)
+
+
+@pytest.mark.asyncio
+async def test_lazy_session_not_created_until_used(session_pool, checkouts):
+    session = LazySession(session_pool)
+    assert not session.started
+
+    await session.close()
+    assert checkouts["n"] == 0
+
+    await session.execute(text("SELECT 1"))
+    assert session.started
+    await session.close()
+    assert checkouts["n"] == 1
+
+
+@pytest.mark.asyncio
+async def test_update_without_db_does_not_checkout(session_pool, checkouts):
+    middleware = DbSessionMiddleware(session_pool)
+
+    async def handler(event, data):
+        assert current_session.get() is data["session"]
+        return "ok"
+
+    assert await middleware(handler, object(), {}) == "ok"
+    assert checkouts["n"] == 0
+    assert current_session.get() is None
+
+
+@pytest.mark.asyncio
+async def test_crud_helpers_reuse_update_session(session_pool, checkouts):
+    middleware = DbSessionMiddleware(session_pool)
+    tg_chat = SimpleNamespace(id=8001, title="Чат", first_name=None, username=None, type="group")
+
+    async def handler(event, data):
+        await crud.activate_chat(tg_chat)
+        await crud.update_settings_field(8001, include_links=False)
+        return await crud.get_chat_settings(8001)
+
+    chat = await middleware(handler, object(), {})
+
+    assert chat.include_links is False
+    assert checkouts["n"] == 1
+
+
+@pytest.mark.asyncio
+async def test_session_scope_serializes_concurrent_use(session_pool):
+    middleware = DbSessionMiddleware(session_pool)
+
+    async def query(n):
+        async with session_scope() as session:
+            result = await session.execute(text(f"SELECT {n}"))
+            await asyncio.sleep(0)
+            return result.scalar_one()
+
+    async def handler(event, data):
+        return await asyncio.gather(*(query(n) for n in range(5)))
+
+    assert await middleware(handler, object(), {}) == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.asyncio
+async def test_session_scope_outside_update(session_pool, checkouts):
+    async with session_scope() as session:
+        assert isinstance(session, AsyncSession)
+        await session.execute(text("SELECT 1"))
+
+    assert checkouts["n"] == 1
+
+
+@pytest.mark.asyncio
+async def test_session_scope_ends_transaction(session_pool, checkouts):
+    middleware = DbSessionMiddleware(session_pool)
+    tg_chat = SimpleNamespace(id=8002, title="Чат", first_name=None, username=None, type="group")
+
+    async def handler(event, data):
+        await crud.activate_chat(tg_chat)
+        chat = await crud.get_chat_settings(8002)
+        # чтение закрыло транзакцию, соединение ещё у апдейта
+        assert not (await data["session"].get()).in_transaction()
+
+        await release_session()
+        assert not data["session"].started
+        # после долгого ожидания crud-хелпер берёт соединение заново
+        assert (await crud.get_chat_settings(8002)).chat_id == 8002
+        return chat
+
+    chat = await middleware(handler, object(), {})
+
+    assert chat.is_active
+    assert checkouts["n"] == 2
+
+
+@pytest.mark.asyncio
+async def test_session_scope_rolls_back_on_error(session_pool):
+    middleware = DbSessionMiddleware(session_pool)
+
+    async def handler(event, data):
+        with pytest.raises(RuntimeError):
+            async with session_scope() as session:
+                await session.execute(text("SELECT 1"))
+                raise RuntimeError("ошибка хелпера")
+        return (await data["session"].get()).in_transaction()
+
+    assert await middleware(handler, object(), {}) is False
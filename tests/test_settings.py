@@ -20,6 +20,7 @@ from src.settings.handlers import (
     cmd_settings,
     settings_callback_router,
     process_time_input,
+    cmd_keywords,
 )
 from src.settings.states import SettingsStates
 
@@ -179,3 +180,53 @@ async def test_process_time_input_invalid(message, state):
 
     message.answer.assert_called_once()
     state.clear.assert_not_called()
+
+
+# -----------------------------
+# /keywords
+# -----------------------------
+@pytest.mark.asyncio
+async def test_cmd_keywords_show(message):
+    command = SimpleNamespace(args=None)
+
+    with patch("src.settings.handlers.is_user_admin", new_callable=AsyncMock) as admin, \
+         patch("src.settings.handlers.get_chat_settings", new_callable=AsyncMock) as get_chat:
+
+        admin.return_value = True
+        get_chat.return_value = SimpleNamespace(task_keywords="лаба, сдать")
+
+        await cmd_keywords(message, command, bot=None)
+
+        sent_text = message.answer.call_args[0][0]
+        assert "дедлайн" in sent_text
+        assert "лаба, сдать" in sent_text
+
+
+@pytest.mark.asyncio
+async def test_cmd_keywords_set(message):
+    command = SimpleNamespace(args="Лаба,  сдать, ")
+
+    with patch("src.settings.handlers.is_user_admin", new_callable=AsyncMock) as admin, \
+         patch("src.settings.handlers.get_chat_settings", new_callable=AsyncMock), \
+         patch("src.settings.handlers.update_settings_field", new_callable=AsyncMock) as update:
+
+        admin.return_value = True
+
+        await cmd_keywords(message, command, bot=None)
+
+        update.assert_called_once_with(123, task_keywords="лаба, сдать")
+
+
+@pytest.mark.asyncio
+async def test_cmd_keywords_reset(message):
+    command = SimpleNamespace(args="-")
+
+    with patch("src.settings.handlers.is_user_admin", new_callable=AsyncMock) as admin, \
+         patch("src.settings.handlers.get_chat_settings", new_callable=AsyncMock), \
+         patch("src.settings.handlers.update_settings_field", new_callable=AsyncMock) as update:
+
+        admin.return_value = True
+
+        await cmd_keywords(message, command, bot=None)
+
+        update.assert_called_once_with(123, task_keywords=None)
@@ -0,0 +1,175 @@
+import asyncio
+import os
+import queue
+import pytest
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
+
+from aiogram.exceptions import TelegramNetworkError, TelegramServerError
+from aiogram.methods import GetUpdates
+from aiogram.utils.backoff import Backoff, BackoffConfig
+
+from utils.sharding import ChatOrdering, ShardRouter, fetch_updates, serve_shard, shard_for, update_chat_id
+
+
+def make_update(update_id, chat_id, text="текст"):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 1700000000,
+            "chat": {"id": chat_id, "type": "supergroup", "title": "Группа"},
+            "from": {"id": 42, "is_bot": False, "first_name": "Тест"},
+            "text": text,
+        },
+    }
+
+
+def recording_shard(out_dir):
+    """
+    Фабрика воркера для теста: пишет chat_id, message_id и pid каждого апдейта.
+    """
+    dp = Dispatcher()
+    router = Router()
+    path = os.path.join(out_dir, f"{os.getpid()}.log")
+
+    @router.message()
+    async def on_message(message: Message):
+        with open(path, "a") as f:
+            f.write(f"{message.chat.id} {message.message_id} {os.getpid()}\n")
+
+    dp.include_router(router)
+    return Bot(token="42:TEST"), dp
+
+
+# ---------- routing ----------
+
+def test_update_chat_id():
+    assert update_chat_id(make_update(1, -100500)) == -100500
+    callback = {"update_id": 2, "callback_query": {
+        "id": "1", "from": {"id": 7}, "message": {"chat": {"id": -5}}, "chat_instance": "x",
+    }}
+    assert update_chat_id(callback) == -5
+    inline = {"update_id": 3, "inline_query": {"id": "1", "from": {"id": 7}, "query": "", "offset": ""}}
+    assert update_chat_id(inline) == 7
+    assert update_chat_id({"update_id": 4}) == 0
+
+
+def test_shard_for_is_stable():
+    assert shard_for(-1001234567, 4) == shard_for(-1001234567, 4)
+    assert {shard_for(chat_id, 4) for chat_id in range(100)} == {0, 1, 2, 3}
+
+
+# ---------- ordering ----------
+
+@pytest.mark.asyncio
+async def test_chat_ordering_keeps_order_within_chat():
+    ordering = ChatOrdering()
+    seen = []
+
+    async def work(chat_id, n, delay):
+        await asyncio.sleep(delay)
+        seen.append((chat_id, n))
+
+    # первый апдейт чата 1 самый медленный, но следующие его не обгоняют
+    await asyncio.gather(
+        ordering.run(1, work(1, 1, 0.03)),
+        ordering.run(1, work(1, 2, 0)),
+        ordering.run(2, work(2, 1, 0)),
+        ordering.run(1, work(1, 3, 0)),
+    )
+
+    assert [n for chat_id, n in seen if chat_id == 1] == [1, 2, 3]
+    # другой чат не ждёт чат 1
+    assert seen[0] == (2, 1)
+    assert ordering._locks == {}
+
+
+@pytest.mark.asyncio
+async def test_serve_shard_handles_updates(tmp_path):
+    bot, dp = recording_shard(str(tmp_path))
+    q = queue.Queue()
+    for i in range(1, 6):
+        q.put(make_update(i, chat_id=-1))
+    q.put(None)
+
+    handled = await serve_shard(bot, dp, q)
+
+    assert handled == 5
+    lines = (tmp_path / f"{os.getpid()}.log").read_text().split("\n")
+    assert [line.split()[1] for line in lines if line] == ["1", "2", "3", "4", "5"]
+
+
+@pytest.mark.asyncio
+async def test_serve_shard_limits_updates_in_flight(tmp_path):
+    bot, dp = recording_shard(str(tmp_path))
+    release = asyncio.Event()
+    started = []
+
+    @dp.message()
+    async def slow(message: Message):
+        started.append(message.message_id)
+        await release.wait()
+
+    q = queue.Queue()
+    for i in range(1, 11):
+        q.put(make_update(i, chat_id=-i))
+    q.put(None)
+
+    serving = asyncio.create_task(serve_shard(bot, dp, q, max_in_flight=3))
+    for _ in range(20):
+        await asyncio.sleep(0.01)
+
+    # остальные апдейты ждут в очереди процесса, а не задачами в памяти воркера
+    assert len(started) == 3
+    assert q.qsize() == 8
+
+    release.set()
+    assert await serving == 10
+
+
+# ---------- processes ----------
+
+@pytest.mark.asyncio
+async def test_router_pins_chats_to_processes(tmp_path):
+    router = ShardRouter(2, recording_shard, factory_args=(str(tmp_path),), queue_size=10)
+    router.start()
+    for i in range(1, 41):
+        await router.route(make_update(i, chat_id=i % 4))
+    await router.stop(timeout=60)
+
+    assert router.routed == [20, 20]
+
+    handled = {}
+    for log in tmp_path.glob("*.log"):
+        for line in log.read_text().splitlines():
+            chat_id, message_id, pid = map(int, line.split())
+            handled.setdefault(chat_id, []).append((message_id, pid))
+
+    assert sorted(handled) == [0, 1, 2, 3]
+    for chat_id, items in handled.items():
+        assert len({pid for _, pid in items}) == 1
+        assert [message_id for message_id, _ in items] == list(range(chat_id or 4, 41, 4))
+    assert len(list(tmp_path.glob("*.log"))) == 2
+
+
+@pytest.mark.asyncio
+async def test_fetch_updates_survives_telegram_errors():
+    method = GetUpdates()
+    responses = [TelegramNetworkError(method, "timeout"), TelegramServerError(method, "Bad Gateway"), ["апдейт"]]
+
+    class FlakyBot:
+        async def get_updates(self, **kwargs):
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+    bot = FlakyBot()
+    backoff = Backoff(config=BackoffConfig(min_delay=0.01, max_delay=0.02, factor=2, jitter=0))
+
+    assert await fetch_updates(bot, None, [], backoff) == []
+    assert await fetch_updates(bot, None, [], backoff) == []
+    assert backoff.counter == 2
+    assert await fetch_updates(bot, None, [], backoff) == ["апдейт"]
+    assert backoff.counter == 0
@@ -1,6 +1,9 @@
 import pytest
 from unittest.mock import AsyncMock
 from types import SimpleNamespace
+from datetime import datetime
+from database.digests import encode_items
+from database.models import DIGEST_REBUILD, Digest, Task
 from src.summary.handlers import cmd_summary
 
 
@@ -15,6 +18,35 @@ def mock_message():
     return msg
 
 
+def use_daily_data(monkeypatch, data: dict) -> None:
+    """
+    Данные за сутки одной пачкой вместо has_daily_data/stream_daily_data;
+    готовой сводки нет, собранная не сохраняется. Категории идут через
+    process_items_pipeline по одной, без общего запроса.
+    """
+    async def fake_has_daily_data(chat_id):
+        return any(data.values())
+
+    async def fake_stream_daily_data(chat_id, unchecked_only=False):
+        yield data
+
+    async def fake_load_digest(chat_id):
+        return None
+
+    async def fake_open_digest(chat_id):
+        return Digest(version=0, built_version=DIGEST_REBUILD, items="{}")
+
+    async def fake_save_digest(chat_id, data, built_version):
+        pass
+
+    monkeypatch.setattr("src.summary.handlers.has_daily_data", fake_has_daily_data)
+    monkeypatch.setattr("src.summary.handlers.load_digest", fake_load_digest)
+    monkeypatch.setattr("ml.services.stream_daily_data", fake_stream_daily_data)
+    monkeypatch.setattr("ml.services.open_digest", fake_open_digest)
+    monkeypatch.setattr("ml.services.save_digest", fake_save_digest)
+    monkeypatch.setattr("ml.services.ML_COMBINED", False)
+
+
 @pytest.mark.asyncio
 async def test_cmd_summary_no_settings(mock_message, monkeypatch):
     async def fake_get_settings(chat_id):
@@ -32,11 +64,8 @@ async def test_cmd_summary_no_data(mock_message, monkeypatch):
     async def fake_get_settings(chat_id):
         return SimpleNamespace(include_tasks=True)
 
-    async def fake_get_daily_data(chat_id):
-        return {"tasks": [], "links": []}
-
     monkeypatch.setattr("src.summary.handlers.get_chat_settings", fake_get_settings)
-    monkeypatch.setattr("src.summary.handlers.get_daily_data", fake_get_daily_data)
+    use_daily_data(monkeypatch, {"tasks": [], "links": []})
 
     await cmd_summary(mock_message)
 
@@ -51,22 +80,20 @@ async def test_cmd_summary_full_success(mock_message, monkeypatch):
     )
 
     fake_data = {
-        "tasks": [SimpleNamespace(message_id=1, task_name="Task 1", about=None)],
-        "links": [SimpleNamespace(url="https://test.com", about="Link 1")],
-        "documents": [SimpleNamespace(message_id=2, document_name="doc.pdf", about=None)],
-        "mentions": [SimpleNamespace(message_id=3, mention="@user", about=None)],
-        "hashtags": [SimpleNamespace(message_id=4, hashtag="#tag", about=None)]
+        "tasks": [SimpleNamespace(is_checked=True, message_id=1, task_name="Task 1", about=None)],
+        "links": [SimpleNamespace(is_checked=True, url="https://test.com", about="Link 1")],
+        "documents": [SimpleNamespace(is_checked=True, message_id=2, document_name="doc.pdf", about=None)],
+        "mentions": [SimpleNamespace(is_checked=True, message_id=3, mention="@user", about=None)],
+        "hashtags": [SimpleNamespace(is_checked=True, message_id=4, hashtag="#tag", about=None)]
     }
 
     async def fake_get_settings(chat_id): return fake_settings
 
-    async def fake_get_daily_data(chat_id): return fake_data
-
     async def fake_pipeline(items, item_type, model_class): return items
 
     monkeypatch.setattr("src.summary.handlers.get_chat_settings", fake_get_settings)
-    monkeypatch.setattr("src.summary.handlers.get_daily_data", fake_get_daily_data)
-    monkeypatch.setattr("src.summary.handlers.process_items_pipeline", fake_pipeline)
+    use_daily_data(monkeypatch, fake_data)
+    monkeypatch.setattr("ml.services.process_items_pipeline", fake_pipeline)
 
     await cmd_summary(mock_message)
 
@@ -86,17 +113,15 @@ async def test_cmd_summary_full_success(mock_message, monkeypatch):
 async def test_cmd_summary_pipeline_error(mock_message, monkeypatch):
     fake_settings = SimpleNamespace(include_tasks=True, include_links=False, include_docs=False, include_mentions=False,
                                     include_hashtags=False)
-    fake_data = {"tasks": [SimpleNamespace(message_id=1, task_name="Task", about=None)]}
+    fake_data = {"tasks": [SimpleNamespace(is_checked=True, message_id=1, task_name="Task", about=None)]}
 
     async def fake_get_settings(chat_id): return fake_settings
 
-    async def fake_get_daily_data(chat_id): return fake_data
-
     async def fake_pipeline_error(items, item_type, model_class): return None
 
     monkeypatch.setattr("src.summary.handlers.get_chat_settings", fake_get_settings)
-    monkeypatch.setattr("src.summary.handlers.get_daily_data", fake_get_daily_data)
-    monkeypatch.setattr("src.summary.handlers.process_items_pipeline", fake_pipeline_error)
+    use_daily_data(monkeypatch, fake_data)
+    monkeypatch.setattr("ml.services.process_items_pipeline", fake_pipeline_error)
 
     await cmd_summary(mock_message)
 
@@ -108,19 +133,42 @@ async def test_cmd_summary_pipeline_error(mock_message, monkeypatch):
 async def test_cmd_summary_all_filtered(mock_message, monkeypatch):
     fake_settings = SimpleNamespace(include_tasks=True, include_links=False, include_docs=False, include_mentions=False,
                                     include_hashtags=False)
-    fake_data = {"tasks": [SimpleNamespace(message_id=1, task_name="Noise", about=None)]}
+    fake_data = {"tasks": [SimpleNamespace(is_checked=True, message_id=1, task_name="Noise", about=None)]}
 
     async def fake_get_settings(chat_id): return fake_settings
 
-    async def fake_get_daily_data(chat_id): return fake_data
-
     async def fake_pipeline_empty(items, item_type, model_class): return []
 
     monkeypatch.setattr("src.summary.handlers.get_chat_settings", fake_get_settings)
-    monkeypatch.setattr("src.summary.handlers.get_daily_data", fake_get_daily_data)
-    monkeypatch.setattr("src.summary.handlers.process_items_pipeline", fake_pipeline_empty)
+    use_daily_data(monkeypatch, fake_data)
+    monkeypatch.setattr("ml.services.process_items_pipeline", fake_pipeline_empty)
 
     await cmd_summary(mock_message)
 
     status_msg = mock_message.answer.return_value
-    assert "нейросеть посчитала всё это неважным" in status_msg.edit_text.call_args[0][0]
\ No newline at end of file
+    assert "нейросеть посчитала всё это неважным" in status_msg.edit_text.call_args[0][0]
+
+@pytest.mark.asyncio
+async def test_cmd_summary_from_fresh_digest(mock_message, monkeypatch):
+    fake_settings = SimpleNamespace(include_tasks=True, include_links=False, include_docs=False, include_mentions=False,
+                                    include_hashtags=False)
+    task = Task(id=1, chat_id=12345, message_id=7, task_name="Сдать отчёт", about=None, created_at=datetime.now())
+    digest = Digest(version=3, built_version=3, items=encode_items({"tasks": [task]}), updated_at=datetime.now())
+
+    async def fake_get_settings(chat_id): return fake_settings
+
+    async def fake_load_digest(chat_id): return digest
+
+    async def no_reads(*args, **kwargs):
+        raise AssertionError("свежая сводка не должна читать сущности")
+
+    monkeypatch.setattr("src.summary.handlers.get_chat_settings", fake_get_settings)
+    monkeypatch.setattr("src.summary.handlers.load_digest", fake_load_digest)
+    monkeypatch.setattr("src.summary.handlers.has_daily_data", no_reads)
+    monkeypatch.setattr("src.summary.handlers.refresh_digest", no_reads)
+
+    await cmd_summary(mock_message)
+
+    sent_text = mock_message.answer.call_args[0][0]
+    assert "Сдать отчёт" in sent_text
+    assert "https://t.me/test_chat/7" in sent_text
@@ -20,16 +20,13 @@ async def fake_process_items_pipeline(all_items, item_type, model_class):
 
 
 @pytest.mark.asyncio
-async def test_get_tasks_handler_with_tasks(mock_message, monkeypatch):
+async def test_get_tasks_handler_with_tasks(mock_message, monkeypatch, daily_items):
     fake_tasks = [
         SimpleNamespace(message_id=1, task_name="Первая задача", about=None)
     ]
 
-    async def fake_get_daily_tasks(chat_id: int):
-        return fake_tasks
-
-    monkeypatch.setattr("src.tasks.handlers.get_daily_tasks", fake_get_daily_tasks)
-    monkeypatch.setattr("src.tasks.handlers.process_items_pipeline", fake_process_items_pipeline)
+    daily_items("src.tasks.handlers", fake_tasks)
+    monkeypatch.setattr("ml.services.process_items_pipeline", fake_process_items_pipeline)
 
     await get_tasks_handler(mock_message)
 
@@ -42,10 +39,7 @@ async def test_get_tasks_handler_with_tasks(mock_message, monkeypatch):
 
 
 @pytest.mark.asyncio
-async def test_get_tasks_handler_no_tasks(mock_message, monkeypatch):
-    async def empty_tasks(chat_id: int):
-        return []
-
-    monkeypatch.setattr("src.tasks.handlers.get_daily_tasks", empty_tasks)
+async def test_get_tasks_handler_no_tasks(mock_message, daily_items):
+    daily_items("src.tasks.handlers", [])
     await get_tasks_handler(mock_message)
     mock_message.answer.assert_called_once_with("✅ Задач за последние 24 часа не найдено.")
\ No newline at end of file
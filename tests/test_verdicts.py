@@ -0,0 +1,137 @@
+import pytest
+from types import SimpleNamespace
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+
+import ml.ml
+from database.verdicts import load_verdicts, save_verdicts
+from ml.ml import analyze_items
+from ml.verdicts import CachedVerdict, VerdictCache, verdict_key
+
+
+def link(item_id, url, context="посмотрите"):
+    return SimpleNamespace(id=item_id, url=url, context=context)
+
+
+def test_key_normalization():
+    key = verdict_key("link", "https://Example.com/lecture/", "Посмотрите  лекцию", "v1")
+
+    assert key == verdict_key("link", " https://example.com/lecture#t=10", "посмотрите лекцию", "v1")
+    # путь URL, вид элемента, контекст и версия промпта различают вердикты
+    assert key != verdict_key("link", "https://example.com/Lecture", "посмотрите лекцию", "v1")
+    assert key != verdict_key("doc", "https://example.com/lecture", "посмотрите лекцию", "v1")
+    assert key != verdict_key("link", "https://example.com/lecture", "не смотрите", "v1")
+    assert key != verdict_key("link", "https://example.com/lecture", "посмотрите лекцию", "v2")
+    assert verdict_key("hashtag", "#Матан", None, "v1") == verdict_key("hashtag", "#матан", "", "v1")
+
+
+@pytest.mark.asyncio
+async def test_cache_memory_then_db(verdict_storage):
+    rows, load, save = verdict_storage
+    cache = VerdictCache(maxsize=1, load=load, save=save)
+    await cache.put_many("link", {"a": CachedVerdict(True, "лекция", 40), "b": CachedVerdict(False, None, 10)})
+
+    assert set(rows) == {"a", "b"}
+    # в памяти остался только последний ключ, первый читается из БД
+    assert await cache.get_many(["b", "a", "c"]) == {
+        "a": CachedVerdict(True, "лекция", 40), "b": CachedVerdict(False, None, 10),
+    }
+    assert cache.stats() == {
+        "size": 1, "memory_hits": 1, "db_hits": 1, "misses": 1,
+        "hit_rate": 2 / 3, "tokens_saved": 50, "calls_skipped": 0,
+    }
+
+
+@pytest.mark.asyncio
+async def test_cache_survives_db_errors():
+    async def broken(*args):
+        raise RuntimeError("БД недоступна")
+
+    cache = VerdictCache(load=broken, save=broken)
+    await cache.put_many("link", {"a": CachedVerdict(True, None, 5)})
+
+    assert await cache.get_many(["a", "b"]) == {"a": CachedVerdict(True, None, 5)}
+    assert (cache.memory_hits, cache.misses) == (1, 1)
+
+
+@pytest.mark.asyncio
+async def test_analyze_items_skips_cached(llm):
+    first = await analyze_items([link(1, "https://e.com/лекция"), link(2, "https://e.com/мем")], "link")
+    assert [(item["original"].id, item["about"]) for item in first] == [(1, "о https://e.com/лекция")]
+    assert len(llm.prompts) == 1
+
+    # те же элементы из другого чата: LLM не вызывается
+    second = await analyze_items([link(10, "https://E.com/лекция/"), link(11, "https://e.com/мем")], "link")
+    assert [(item["original"].id, item["about"]) for item in second] == [(10, "о https://e.com/лекция")]
+    assert len(llm.prompts) == 1
+
+    stats = ml.ml.verdict_cache.stats()
+    assert (stats["memory_hits"], stats["misses"], stats["calls_skipped"]) == (2, 2, 1)
+    assert stats["hit_rate"] == 0.5
+    assert stats["tokens_saved"] > 0
+
+
+@pytest.mark.asyncio
+async def test_analyze_items_sends_only_misses(llm):
+    await analyze_items([link(1, "https://e.com/лекция")], "link")
+
+    items = [link(2, "https://e.com/лекция"), link(3, "https://e.com/лекция-2"), link(4, "https://e.com/лекция-2")]
+    result = await analyze_items(items, "link")
+
+    # в LLM ушёл один элемент: первый уже в кэше, 3 и 4 одинаковые
+    assert llm.prompts[-1].count("ID: ") == 1
+    assert [item["original"].id for item in result] == [2, 3, 4]
+
+
+@pytest.mark.asyncio
+async def test_llm_error_is_not_cached(llm, monkeypatch):
+    async def broken(prompt):
+        raise RuntimeError("quota")
+
+    monkeypatch.setattr(llm, "ainvoke", broken)
+    assert await analyze_items([link(1, "https://e.com/лекция")], "link") is None
+    assert ml.ml.verdict_cache.stats()["size"] == 0
+
+
+@pytest.mark.asyncio
+async def test_verdicts_table(test_engine, monkeypatch):
+    monkeypatch.setattr(
+        "database.session.async_session",
+        async_sessionmaker(bind=test_engine, class_=AsyncSession, expire_on_commit=False),
+    )
+    row = dict(key="k" * 64, item_type="link", is_important=True, about="лекция", tokens=30)
+
+    await save_verdicts([row])
+    await save_verdicts([row | {"about": "другое"}])  # ключ уже есть — пропускается
+
+    verdict = (await load_verdicts(["k" * 64, "x" * 64]))["k" * 64]
+    assert (verdict.is_important, verdict.about, verdict.tokens) == (True, "лекция", 30)
+
+
+@pytest.mark.asyncio
+async def test_save_verdicts_in_chunks(test_engine, monkeypatch):
+    monkeypatch.setattr(
+        "database.session.async_session",
+        async_sessionmaker(bind=test_engine, class_=AsyncSession, expire_on_commit=False),
+    )
+    # 5 колонок на строку: по 2 строки в INSERT
+    monkeypatch.setattr("database.verdicts.MAX_STATEMENT_PARAMS", 10)
+    rows = [
+        dict(key=f"{i:064d}", item_type="task", is_important=False, about=None, tokens=5)
+        for i in range(5)
+    ]
+
+    inserts = []
+
+    def on_execute(conn, cursor, statement, *args):
+        if statement.startswith("INSERT INTO verdicts"):
+            inserts.append(statement)
+
+    event.listen(test_engine.sync_engine, "before_cursor_execute", on_execute)
+    try:
+        await save_verdicts(rows)
+    finally:
+        event.remove(test_engine.sync_engine, "before_cursor_execute", on_execute)
+
+    assert len(inserts) == 3
+    assert set(await load_verdicts([row["key"] for row in rows])) == {row["key"] for row in rows}
@@ -0,0 +1,106 @@
+import asyncio
+import pytest
+import pytest_asyncio
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
+from aiohttp.test_utils import TestClient, TestServer
+
+from middlewares.middleware import ConcurrencyLimitMiddleware
+from utils.webhook import build_app
+
+SECRET = "test-secret"
+
+
+def make_update(update_id=1, text="надо сделать отчет"):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 1700000000,
+            "chat": {"id": -100123, "type": "supergroup", "title": "Группа"},
+            "from": {"id": 42, "is_bot": False, "first_name": "Тест"},
+            "text": text,
+        },
+    }
+
+
+@pytest.fixture
+def received():
+    return []
+
+
+@pytest.fixture
+def dispatcher(received):
+    dp = Dispatcher()
+    router = Router()
+
+    @router.message()
+    async def on_message(message: Message):
+        received.append(message.text)
+
+    dp.include_router(router)
+    return dp
+
+
+@pytest_asyncio.fixture
+async def client(dispatcher):
+    bot = Bot(token="42:TEST")
+    app = build_app(dispatcher, bot, path="/webhook", secret=SECRET, handle_in_background=False)
+    client = TestClient(TestServer(app))
+    await client.start_server()
+    yield client
+    await client.close()
+    await bot.session.close()
+
+
+@pytest.mark.asyncio
+async def test_update_is_handled(client, received):
+    resp = await client.post(
+        "/webhook",
+        json=make_update(text="надо сделать отчет"),
+        headers={"X-Telegram-Bot-Api-Secret-Token": SECRET},
+    )
+
+    assert resp.status == 200
+    assert received == ["надо сделать отчет"]
+
+
+@pytest.mark.asyncio
+async def test_wrong_secret_rejected(client, received):
+    resp = await client.post(
+        "/webhook",
+        json=make_update(),
+        headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"},
+    )
+
+    assert resp.status == 401
+    assert received == []
+
+
+@pytest.mark.asyncio
+async def test_concurrent_updates_are_limited():
+    limiter = ConcurrencyLimitMiddleware(limit=2)
+    peak = 0
+
+    async def handler(event, data):
+        nonlocal peak
+        peak = max(peak, limiter.in_flight)
+        await asyncio.sleep(0.01)
+
+    await asyncio.gather(*(limiter(handler, object(), {}) for _ in range(10)))
+
+    assert peak == 2
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_metrics_route(client):
+    from utils.metrics import registry
+
+    registry.register("test", lambda: {"handled": 3})
+    try:
+        resp = await client.get("/metrics")
+        assert resp.status == 200
+        assert "bot_test_handled 3.0" in await resp.text()
+    finally:
+        registry.unregister("test")
@@ -0,0 +1,376 @@
+"""
+Импорт истории чата из экспорта Telegram Desktop (JSON, «Экспорт истории чата»).
+
+Бот, добавленный в существующую группу, ничего не знает о прошлых сообщениях.
+Импорт читает result.json потоково — в памяти буфер чтения и одна пачка
+строк, поэтому экспорт в несколько гигабайт идёт в постоянной памяти.
+Сущности извлекаются теми же правилами, что и в CollectorMiddleware
+(split_entities), строки собираются database.ingest.record_rows, задачи
+ищутся детектором с ключевыми словами чата.
+
+Запись пачками по одной транзакции: в Postgres (asyncpg) через COPY во временную
+таблицу и INSERT ... SELECT ... ON CONFLICT DO NOTHING, в SQLite — многострочными
+INSERT из write_rows. Повторный импорт и пересечение с уже собранными ботом
+сообщениями ничего не дублируют. Сообщения старше RETENTION_DAYS пропускаются:
+очистка всё равно удалила бы их.
+
+Запуск: python -m utils.backfill path/to/result.json
+        python -m utils.backfill result.json --chat-id -1001234567890 --db-url sqlite+aiosqlite:///bot.db
+"""
+import argparse
+import asyncio
+import codecs
+import json
+import logging
+import os
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import Table, select, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+import database.session
+from configs.config import RETENTION_DAYS
+from database.cache import ChatState
+from database.ingest import IngestRecord, mark_digests, record_rows, write_rows
+from database.migrations import migrate
+from database.models import Base, Chat
+from database.retention import create_partitions, is_partitioned
+from middlewares.middleware import split_entities, worth_ingesting
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 1 << 20
+
+# Типы сущностей экспорта, которые в Bot API называются иначе
+EXPORT_ENTITY_TYPES = {"link": "url", "mention_name": "text_mention"}
+
+# Медиа с полем file, которые в Bot API приходят не документом
+NOT_DOCUMENTS = {"sticker", "voice_message", "video_message", "audio_file", "video_file", "animation"}
+
+SUPERGROUP_TYPES = {"private_supergroup", "public_supergroup", "private_channel", "public_channel"}
+
+_MESSAGES_KEY = re.compile(r'"messages"\s*:\s*\[')
+_SEPARATORS = " \t\r\n,"
+
+
+class ExportReader:
+    """
+    Потоковое чтение result.json: шапка экспорта (всё до "messages") и сообщения
+    по одному через JSONDecoder.raw_decode, без загрузки файла целиком.
+    bytes_read — сколько байт прочитано, для прогресса.
+    """
+
+    def __init__(self, path: str, read_size: int = READ_SIZE):
+        self.path = path
+        self.read_size = read_size
+        self.size = os.path.getsize(path)
+        self.bytes_read = 0
+        self.header: Dict[str, Any] = {}
+        self._file = None
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self._buffer = ""
+        self._eof = False
+
+    def _read(self) -> None:
+        data = self._file.read(self.read_size)
+        self.bytes_read += len(data)
+        self._eof = not data
+        self._buffer += self._decoder.decode(data, final=self._eof)
+
+    def open(self) -> Dict[str, Any]:
+        """
+        Открывает файл и читает шапку. Ключ messages в экспорте Telegram Desktop — последний.
+        """
+        self._file = open(self.path, "rb")
+        while (match := _MESSAGES_KEY.search(self._buffer)) is None:
+            if self._eof:
+                raise ValueError(f"{self.path}: нет списка messages — это не экспорт одного чата")
+            self._read()
+        self.header = json.loads(self._buffer[:match.start()].rstrip().rstrip(",") + "}")
+        self._buffer = self._buffer[match.end():]
+        return self.header
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        decoder = json.JSONDecoder()
+        pos = 0
+        while True:
+            while pos < len(self._buffer) and self._buffer[pos] in _SEPARATORS:
+                pos += 1
+            if pos == len(self._buffer):
+                if self._eof:
+                    raise ValueError(f"{self.path}: файл оборван")
+                self._buffer, pos = "", 0
+                self._read()
+                continue
+            if self._buffer[pos] == "]":
+                return
+            try:
+                message, end = decoder.raw_decode(self._buffer, pos)
+            except json.JSONDecodeError:
+                # сообщение не дочитано: подгружаем файл и разбираем его заново
+                if self._eof:
+                    raise
+                self._buffer, pos = self._buffer[pos:], 0
+                self._read()
+                continue
+            pos = end
+            yield message
+
+
+def export_chat_id(header: Dict[str, Any]) -> int:
+    """
+    chat_id Bot API по шапке экспорта: у супергрупп и каналов в экспорте id без префикса -100.
+    """
+    chat_type, chat_id = header.get("type"), int(header["id"])
+    if chat_type in SUPERGROUP_TYPES:
+        return int(f"-100{chat_id}")
+    if chat_type == "private_group":
+        return -chat_id
+    return chat_id
+
+
+def export_text(message: Dict[str, Any]) -> Tuple[str, List[Tuple[str, str, Optional[str]]]]:
+    """
+    Текст сообщения и сущности (тип по Bot API, текст, url) из text_entities
+    или, в старых экспортах, из списка в text.
+    """
+    parts = message.get("text_entities")
+    if parts is None:
+        raw = message.get("text", "")
+        parts = [{"type": "plain", "text": raw}] if isinstance(raw, str) else [
+            {"type": "plain", "text": part} if isinstance(part, str) else part for part in raw
+        ]
+
+    entities = [
+        (EXPORT_ENTITY_TYPES.get(part["type"], part["type"]), part["text"], part.get("href"))
+        for part in parts if part.get("type") != "plain"
+    ]
+    return "".join(part["text"] for part in parts), entities
+
+
+def export_record(message: Dict[str, Any], chat_id: int) -> Optional[IngestRecord]:
+    """
+    IngestRecord из сообщения экспорта; None для служебных сообщений и команд.
+    Правки в экспорте уже применены, поэтому edited не ставится.
+    """
+    if message.get("type") != "message":
+        return None
+
+    text, entities = export_text(message)
+    if text.startswith("/"):
+        return None
+
+    document = None
+    if "file" in message and message.get("media_type") not in NOT_DOCUMENTS:
+        # file_id Bot API в экспорте нет: вместо него путь файла внутри экспорта
+        document = (message["file"], message.get("file_name") or "Без названия")
+
+    if "date_unixtime" in message:
+        date = datetime.fromtimestamp(int(message["date_unixtime"]))
+    else:
+        date = datetime.fromisoformat(message["date"])
+
+    hashtags, links, mentions = split_entities(entities)
+    return IngestRecord(
+        chat_id=chat_id,
+        message_id=int(message["id"]),
+        text=text,
+        document=document,
+        hashtags=hashtags,
+        links=links,
+        mentions=mentions,
+        date=date,
+    )
+
+
+async def copy_rows(session, rows: List[Tuple[Table, Dict[str, Any]]]) -> None:
+    """
+    Postgres (asyncpg): строки каждой таблицы — COPY во временную таблицу без
+    ограничений, затем INSERT ... SELECT ... ON CONFLICT DO NOTHING в основную.
+    Временные таблицы очищаются при коммите.
+    """
+    grouped: Dict[Table, List[dict]] = {}
+    for table, row in rows:
+        grouped.setdefault(table, []).append(row)
+
+    conn = await session.connection()
+    driver = (await conn.get_raw_connection()).driver_connection
+    order = {table: i for i, table in enumerate(Base.metadata.sorted_tables)}
+
+    for table in sorted(grouped, key=lambda t: order.get(t, len(order))):
+        table_rows = grouped[table]
+        columns = list(table_rows[0])
+        names = ", ".join(columns)
+        staging = f"backfill_{table.name}"
+        await conn.execute(text(
+            f"CREATE TEMP TABLE IF NOT EXISTS {staging} ON COMMIT DELETE ROWS "
+            f"AS SELECT {names} FROM {table.name} WITH NO DATA"
+        ))
+        await driver.copy_records_to_table(
+            staging, records=[tuple(row[c] for c in columns) for row in table_rows], columns=columns,
+        )
+        await conn.execute(text(
+            f"INSERT INTO {table.name} ({names}) SELECT {names} FROM {staging} ON CONFLICT DO NOTHING"
+        ))
+
+
+class Backfill:
+    """
+    Импорт сообщений одного чата пачками по `batch_size` строк, каждая пачка — одна
+    транзакция. В секционированных таблицах Postgres секции под дни пачки создаются
+    заранее, чтобы история не оседала в DEFAULT. Готовая сводка чата (digests)
+    помечается устаревшей, как при обычной записи.
+    """
+
+    def __init__(
+            self,
+            session_pool,
+            chat_id: int,
+            batch_size: int = 5000,
+            retention_days: int = RETENTION_DAYS,
+    ):
+        self.session_pool = session_pool
+        self.chat_id = chat_id
+        self.batch_size = batch_size
+        self.retention_days = retention_days
+        self._started = time.perf_counter()
+
+        self.messages_read = 0
+        self.messages_skipped = 0
+        self.messages_expired = 0
+        self.rows_written = 0
+        self.batches = 0
+
+    async def chat_state(self) -> ChatState:
+        """
+        Ключевые слова задач берутся из настроек чата; чата ещё может не быть (до /on).
+        """
+        async with self.session_pool() as session:
+            keywords = await session.scalar(select(Chat.task_keywords).where(Chat.chat_id == self.chat_id))
+        return ChatState(is_active=True, task_keywords=keywords)
+
+    async def run(self, messages, progress: Optional[Callable[["Backfill"], None]] = None) -> Dict[str, float]:
+        state = await self.chat_state()
+        cutoff = datetime.now() - timedelta(days=self.retention_days) if self.retention_days else None
+        self._started = time.perf_counter()
+        rows = []
+
+        for message in messages:
+            self.messages_read += 1
+            record = export_record(message, self.chat_id)
+            if record is None or not worth_ingesting(record):
+                self.messages_skipped += 1
+                continue
+            if cutoff is not None and record.date < cutoff:
+                self.messages_expired += 1
+                continue
+
+            rows.extend(record_rows(record, state))
+            if len(rows) >= self.batch_size:
+                await self.write(rows)
+                rows = []
+                if progress is not None:
+                    progress(self)
+
+        if rows:
+            await self.write(rows)
+        if progress is not None:
+            progress(self)
+        return self.stats()
+
+    async def write(self, rows: List[Tuple[Table, Dict[str, Any]]]) -> None:
+        async with self.session_pool() as session:
+            dialect = session.get_bind().dialect
+            if dialect.name == "postgresql":
+                await self.ensure_partitions(session, rows)
+            if dialect.name == "postgresql" and dialect.driver == "asyncpg":
+                await copy_rows(session, rows)
+            else:
+                await write_rows(session, rows)
+            await mark_digests(session, rows, [])
+            await session.commit()
+        self.rows_written += len(rows)
+        self.batches += 1
+
+    async def ensure_partitions(self, session, rows: List[Tuple[Table, Dict[str, Any]]]) -> None:
+        days = sorted({row["created_at"].date() for _, row in rows})
+        conn = await session.connection()
+        for table in {table for table, _ in rows}:
+            if await is_partitioned(conn, table.name):
+                await create_partitions(conn, table.name, days)
+
+    def stats(self) -> Dict[str, float]:
+        elapsed = time.perf_counter() - self._started
+        return {
+            "messages_read": self.messages_read,
+            "messages_skipped": self.messages_skipped,
+            "messages_expired": self.messages_expired,
+            "rows_written": self.rows_written,
+            "batches": self.batches,
+            "elapsed_seconds": round(elapsed, 1),
+            "rows_per_second": round(self.rows_written / elapsed) if elapsed else 0,
+        }
+
+
+def print_progress(reader: ExportReader, interval: float = 2.0) -> Callable[[Backfill], None]:
+    """
+    Строка прогресса в stderr не чаще раза в interval секунд.
+    """
+    last = 0.0
+
+    def report(backfill: Backfill) -> None:
+        nonlocal last
+        now = time.perf_counter()
+        if now - last < interval and reader.bytes_read < reader.size:
+            return
+        last = now
+        stats = backfill.stats()
+        print(
+            f"\r{reader.bytes_read / reader.size:6.1%} файла, сообщений {stats['messages_read']}, "
+            f"строк {stats['rows_written']}, {stats['rows_per_second']} строк/с",
+            end="", file=sys.stderr, flush=True,
+        )
+
+    return report
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Импорт истории чата из экспорта Telegram Desktop")
+    parser.add_argument("path", help="result.json из экспорта истории чата")
+    parser.add_argument("--chat-id", type=int, help="chat_id Bot API, если не совпадает с id из экспорта")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--db-url", help="по умолчанию — DB_URL бота")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    engine = create_async_engine(args.db_url, echo=False) if args.db_url else database.session.engine
+    await migrate(engine)
+    session_pool = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    reader = ExportReader(args.path)
+    try:
+        header = reader.open()
+        chat_id = args.chat_id if args.chat_id is not None else export_chat_id(header)
+        logger.info("Импорт «%s» в чат %s", header.get("name"), chat_id)
+
+        backfill = Backfill(session_pool, chat_id, batch_size=args.batch_size)
+        stats = await backfill.run(reader, progress=print_progress(reader))
+        print(file=sys.stderr)
+        logger.info("Импорт завершён: %s", stats)
+    finally:
+        reader.close()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+from aiohttp import web
+
+from configs.config import METRICS_PATH
+
+logger = logging.getLogger(__name__)
+
+# Источник метрик: функция без аргументов, возвращающая словарь чисел (см. IngestPool.stats)
+MetricsSource = Callable[[], Dict[str, Any]]
+
+
+class MetricsRegistry:
+    """
+    Метрики процесса в текстовом формате Prometheus.
+    Каждый ключ словаря источника становится метрикой `<prefix>_<ключ>`,
+    список чисел — метрикой с меткой index (например, глубины очередей воркеров).
+    Нечисловые значения пропускаются.
+    """
+
+    def __init__(self):
+        self._sources: Dict[str, MetricsSource] = {}
+
+    def register(self, prefix: str, source: MetricsSource) -> None:
+        self._sources[prefix] = source
+
+    def unregister(self, prefix: str) -> None:
+        self._sources.pop(prefix, None)
+
+    def collect(self) -> Dict[str, Dict[str, Any]]:
+        collected = {}
+        for prefix, source in self._sources.items():
+            try:
+                collected[prefix] = source()
+            except Exception:
+                logger.exception("Ошибка сбора метрик %s", prefix)
+        return collected
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for prefix, values in self.collect().items():
+            for key, value in values.items():
+                name = f"bot_{prefix}_{key}"
+                if isinstance(value, (list, tuple)):
+                    lines += [f'{name}{{index="{i}"}} {float(v)}' for i, v in enumerate(value)]
+                elif isinstance(value, (int, float)):
+                    lines.append(f"{name} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def add_metrics_route(app: web.Application, path: str = METRICS_PATH, metrics: MetricsRegistry = registry) -> None:
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render(), content_type="text/plain")
+
+    app.router.add_get(path, handle)
+
+
+class MetricsServer:
+    """
+    Отдельный HTTP-сервер для /metrics в режимах без вебхука.
+    start/stop регистрируются на startup/shutdown диспетчера. В шардированном
+    режиме воркер получает shard_index из workflow_data и слушает port + 1 + shard_index.
+    """
+
+    def __init__(self, host: str, port: int, path: str = METRICS_PATH, metrics: MetricsRegistry = registry):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.metrics = metrics
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self, shard_index: Optional[int] = None) -> None:
+        if self._runner is not None:
+            return
+        port = self.port if shard_index is None else self.port + 1 + shard_index
+        app = web.Application()
+        add_metrics_route(app, self.path, self.metrics)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host=self.host, port=port).start()
+        logger.info("Метрики на %s:%s%s", self.host, port, self.path)
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import multiprocessing
+import queue as queue_module
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from aiogram import Bot, Dispatcher
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from aiogram.utils.backoff import Backoff, BackoffConfig
+
+from configs.config import MAX_CONCURRENT_UPDATES
+
+logger = logging.getLogger(__name__)
+
+# Фабрика воркера: вызывается в дочернем процессе и возвращает (bot, dispatcher)
+ShardFactory = Callable[..., Tuple[Bot, Dispatcher]]
+
+_STOP = None
+
+# Паузы между повторами getUpdates после ошибки сети или Telegram (как в поллинге aiogram)
+POLLING_BACKOFF = BackoffConfig(min_delay=1.0, max_delay=5.0, factor=1.3, jitter=0.1)
+
+
+def update_chat_id(raw: Dict[str, Any]) -> int:
+    """
+    Чат, к которому относится апдейт (для callback_query — чат сообщения с кнопкой).
+    Апдейты без чата маршрутизируются по пользователю, а без него — в шард 0.
+    """
+    for key, payload in raw.items():
+        if key == "update_id" or not isinstance(payload, dict):
+            continue
+        chat = payload.get("chat") or (payload.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        user = payload.get("from") or payload.get("user")
+        if user:
+            return user["id"]
+    return 0
+
+
+def shard_for(chat_id: int, shards: int) -> int:
+    return chat_id % shards
+
+
+class ChatOrdering:
+    """
+    Апдейты одного чата выполняются строго по очереди, разных чатов — параллельно.
+    asyncio.Lock будит ожидающих в порядке FIFO, поэтому порядок прихода сохраняется.
+    """
+
+    def __init__(self):
+        self._locks: Dict[int, list] = {}
+
+    async def run(self, chat_id: int, coro):
+        entry = self._locks.setdefault(chat_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                return await coro
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[chat_id]
+
+
+async def serve_shard(bot: Bot, dp: Dispatcher, queue, ready=None, max_in_flight: int = MAX_CONCURRENT_UPDATES) -> int:
+    """
+    Цикл воркера: читает сырые апдейты из очереди процесса и скармливает их диспетчеру.
+    После startup диспетчера выставляет `ready`. Возвращает число обработанных апдейтов.
+
+    В работе не больше `max_in_flight` апдейтов: следующий берётся из очереди, только
+    когда освободится место. Иначе медленный чат копил бы задачи в памяти воркера,
+    а очередь процесса (SHARD_QUEUE_SIZE) не давила бы на супервизор.
+    """
+    loop = asyncio.get_running_loop()
+    ordering = ChatOrdering()
+    in_flight = asyncio.Semaphore(max_in_flight)
+    tasks = set()
+    handled = 0
+
+    async def feed(raw):
+        try:
+            await ordering.run(update_chat_id(raw), dp.feed_raw_update(bot, raw))
+        except Exception:
+            logger.exception("Ошибка обработки апдейта %s", raw.get("update_id"))
+        finally:
+            in_flight.release()
+
+    workflow_data = {"dispatcher": dp, "bots": [bot], **dp.workflow_data}
+    await dp.emit_startup(bot=bot, **workflow_data)
+    if ready is not None:
+        ready.set()
+    try:
+        while True:
+            await in_flight.acquire()
+            try:
+                raw = queue.get_nowait()
+            except queue_module.Empty:
+                raw = await loop.run_in_executor(None, queue.get)
+            if raw is _STOP:
+                in_flight.release()
+                break
+            task = asyncio.create_task(feed(raw))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            handled += 1
+
+        await asyncio.gather(*tasks)
+    finally:
+        await dp.emit_shutdown(bot=bot, **workflow_data)
+        await bot.session.close()
+    return handled
+
+
+def _worker_entry(index: int, queue, ready, factory: ShardFactory, factory_args: tuple) -> None:
+    """
+    Точка входа процесса-воркера. Модули импортируются заново (spawn),
+    поэтому у каждого воркера свой движок БД и свой клиент LLM.
+    """
+    logging.basicConfig(level=logging.INFO, format=f"[shard {index}] %(levelname)s:%(name)s:%(message)s")
+    bot, dp = factory(*factory_args)
+    # Номер шарда доступен startup-хукам (например, порт метрик воркера)
+    dp["shard_index"] = index
+    handled = asyncio.run(serve_shard(bot, dp, queue, ready))
+    logger.info("Воркер %d остановлен, обработано апдейтов: %d", index, handled)
+
+
+class ShardRouter:
+    """
+    Раздаёт апдейты `workers` процессам по chat_id: все апдейты чата попадают
+    в один процесс и обрабатываются там по порядку.
+    Очереди процессов ограничены `queue_size`; при заполнении route() ждёт.
+    """
+
+    def __init__(self, workers: int, factory: ShardFactory, factory_args: tuple = (), queue_size: int = 1000):
+        self.workers = workers
+        self.factory = factory
+        self.factory_args = factory_args
+        self.queue_size = queue_size
+        self._context = multiprocessing.get_context("spawn")
+        self._queues: List = []
+        self._ready: List = []
+        self._processes: List = []
+        self.routed = [0] * workers
+
+    def start(self) -> None:
+        self._queues = [self._context.Queue(maxsize=self.queue_size) for _ in range(self.workers)]
+        self._ready = [self._context.Event() for _ in range(self.workers)]
+        self._processes = [
+            self._context.Process(
+                target=_worker_entry,
+                args=(i, q, ready, self.factory, self.factory_args),
+                name=f"shard-{i}",
+            )
+            for i, (q, ready) in enumerate(zip(self._queues, self._ready))
+        ]
+        for process in self._processes:
+            process.start()
+
+    async def wait_ready(self, timeout: Optional[float] = 60) -> bool:
+        """
+        Ждёт, пока все воркеры поднимут диспетчер. False, если кто-то не успел.
+        """
+        loop = asyncio.get_running_loop()
+        results = [await loop.run_in_executor(None, ready.wait, timeout) for ready in self._ready]
+        return all(results)
+
+    async def route(self, raw: Dict[str, Any]) -> int:
+        shard = shard_for(update_chat_id(raw), self.workers)
+        queue = self._queues[shard]
+        try:
+            queue.put_nowait(raw)
+        except queue_module.Full:
+            await asyncio.get_running_loop().run_in_executor(None, queue.put, raw)
+        self.routed[shard] += 1
+        return shard
+
+    async def stop(self, timeout: Optional[float] = 30) -> None:
+        """
+        Дожидается, пока воркеры доработают очереди, и останавливает их.
+        """
+        loop = asyncio.get_running_loop()
+        for queue in self._queues:
+            await loop.run_in_executor(None, queue.put, _STOP)
+        for process in self._processes:
+            await loop.run_in_executor(None, process.join, timeout)
+            if process.is_alive():
+                logger.warning("Воркер %s не остановился за %s с", process.name, timeout)
+                process.terminate()
+        self._queues, self._ready, self._processes = [], [], []
+
+
+async def fetch_updates(bot: Bot, offset: Optional[int], allowed_updates: List[str], backoff: Backoff) -> list:
+    """
+    Один getUpdates. Ошибка сети или 5xx Telegram не роняет супервизор:
+    после паузы с нарастающим backoff возвращается пустой список, и цикл повторяет запрос.
+    """
+    try:
+        updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=allowed_updates)
+    except TelegramRetryAfter as e:
+        logger.warning("Telegram просит подождать %s с", e.retry_after)
+        await asyncio.sleep(e.retry_after)
+        return []
+    except (TelegramNetworkError, TelegramServerError) as e:
+        logger.error("Ошибка получения апдейтов: %s; повтор через %.1f с", e, backoff.next_delay)
+        await backoff.asleep()
+        return []
+    backoff.reset()
+    return updates
+
+
+async def run_supervisor(
+        bot: Bot,
+        factory: ShardFactory,
+        workers: int,
+        allowed_updates: List[str],
+        queue_size: int = 1000,
+) -> None:
+    """
+    Поллинг в главном процессе, обработка в воркерах.
+    Offset подтверждается только после того, как апдейт отдан в очередь воркера.
+    """
+    router = ShardRouter(workers, factory, queue_size=queue_size)
+    router.start()
+    if not await router.wait_ready():
+        logger.warning("Не все воркеры поднялись за отведённое время")
+    logger.info("Запущено воркеров: %d", workers)
+
+    await bot.delete_webhook(drop_pending_updates=True)
+    offset = None
+    backoff = Backoff(config=POLLING_BACKOFF)
+    try:
+        while True:
+            updates = await fetch_updates(bot, offset, allowed_updates, backoff)
+            for update in updates:
+                await router.route(update.model_dump(mode="json", exclude_none=True))
+                offset = update.update_id + 1
+    finally:
+        await router.stop()
+        await bot.session.close()
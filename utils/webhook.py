@@ -0,0 +1,72 @@
+import asyncio
+import logging
+from typing import List
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from utils.metrics import add_metrics_route
+from configs.config import (
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEB_SERVER_HOST,
+    WEB_SERVER_PORT,
+    MAX_CONCURRENT_UPDATES,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def build_app(
+        dp: Dispatcher,
+        bot: Bot,
+        path: str = WEBHOOK_PATH,
+        secret: str = WEBHOOK_SECRET,
+        handle_in_background: bool = True,
+) -> web.Application:
+    """
+    aiohttp-приложение, которое принимает апдейты от Telegram на `path`.
+    Запросы без заголовка X-Telegram-Bot-Api-Secret-Token = `secret` отклоняются.
+    Startup/shutdown диспетчера (старт и дренаж IngestPool) привязаны к жизненному циклу приложения.
+    Там же отдаются метрики процесса (METRICS_PATH).
+    """
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=handle_in_background,
+        secret_token=secret,
+    ).register(app, path=path)
+    add_metrics_route(app)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, allowed_updates: List[str]) -> None:
+    """
+    Регистрирует вебхук и держит HTTP-сервер до остановки процесса.
+    Несколько таких процессов можно поставить за балансировщик:
+    setWebhook идемпотентен, а вебхук при остановке не снимается.
+    """
+    if not WEBHOOK_URL:
+        raise RuntimeError("Для BOT_MODE=webhook нужен WEBHOOK_URL")
+
+    await bot.set_webhook(
+        f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET,
+        max_connections=min(MAX_CONCURRENT_UPDATES, 100),
+        allowed_updates=allowed_updates,
+    )
+
+    runner = web.AppRunner(build_app(dp, bot))
+    await runner.setup()
+    site = web.TCPSite(runner, host=WEB_SERVER_HOST, port=WEB_SERVER_PORT)
+    await site.start()
+    logger.info("Вебхук слушает %s:%s%s", WEB_SERVER_HOST, WEB_SERVER_PORT, WEBHOOK_PATH)
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()